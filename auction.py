@@ -1,6 +1,8 @@
 from typing import Callable
 
+from board_index import set_owner
 from constants import *
+from timing import get_timing_registry
 
 
 def initialize_auction(initiator: str, square_idx: int, state: dict):
@@ -23,6 +25,7 @@ def initialize_auction(initiator: str, square_idx: int, state: dict):
 
     state[PHASE] = AUCTION
     state[AUCTION] = auction
+    mark_dirty(state, AUCTION)
 
 
 def get_enabled_auction_actions(player: str, state: dict, sim: bool = False) -> list[tuple[str, Callable[[], str]]]:
@@ -69,6 +72,7 @@ def all_other_bids_lower(player: str, auction_state: dict) -> bool:
 
 def stand(player: str, state: dict):
     state[AUCTION][PLAYERS][player][LAST_ACTION] = STAND
+    mark_dirty(state, AUCTION)
     return f"{player} stands with a bid of {state[AUCTION][PLAYERS][player][BID]}"
 
 
@@ -87,19 +91,25 @@ def highest_known_bid(auction_state: dict) -> int:
     return max_bid
 
 
-def bid(player: str, state: dict, sim: bool):
+def bid(player: str, state: dict, sim: bool, amount: int | None = None):
     highest_bid = highest_known_bid(state[AUCTION])
     money = state[PLAYERS][player][MONEY]
-    if sim:
-        rand = Random(str(state))
+    if amount is not None:
+        # Replay of a recorded bid (see replay)
+        assert highest_bid < amount <= money, f"Bid of {amount} is not allowed"
+    elif sim:
+        rand = state_random(state)
         amount = rand.randint(highest_bid + 1, money)
     else:
-        amount = get_int_from_input_in_range(
-            f"Enter your bid (current highest: {highest_bid}, remaining money: {money}): ",
-            highest_bid + 1, money)
+        # The time the player takes to decide is not part of the action latency
+        with get_timing_registry().untimed():
+            amount = get_int_from_input_in_range(
+                f"Enter your bid (current highest: {highest_bid}, remaining money: {money}): ",
+                highest_bid + 1, money)
 
     state[AUCTION][PLAYERS][player][BID] = amount
     state[AUCTION][PLAYERS][player][LAST_ACTION] = BID
+    mark_dirty(state, AUCTION)
     return f"{player} bids {amount}"
 
 
@@ -109,6 +119,7 @@ def is_pass_enabled(player: str, state: dict) -> bool:
 
 def do_pass(player: str, state: dict):
     state[AUCTION][PLAYERS][player][LAST_ACTION] = PASS
+    mark_dirty(state, AUCTION)
     return f"{player} passes"
 
 
@@ -164,6 +175,7 @@ def all_made_action_or_are_ahead(player: str, state: dict) -> bool:
 def next_round(player: str, state: dict):
     state[AUCTION][PLAYERS][player][LAST_ACTION] = CHANGE
     state[AUCTION][PLAYERS][player][ROUND] += 1
+    mark_dirty(state, AUCTION)
     return f"{player} moves to next round ({state[AUCTION][PLAYERS][player][ROUND]})"
 
 
@@ -212,6 +224,7 @@ def choose_winner(player: str, state: dict):
         winner = get_winner(state)
 
     state[AUCTION][PLAYERS][player][WINNER] = winner
+    mark_dirty(state, AUCTION)
     return f"{player} chooses {winner} as the winner of the auction"
 
 
@@ -245,5 +258,5 @@ def close_auction(player: str, state: dict):
     state[AUCTION] = None
     if winner != NONE:
         pay_bank(winner, state, auction_state[PLAYERS][winner][BID])
-        state[BOARD][auction_state[ASSET]][OWNER] = winner
+        set_owner(state, auction_state[ASSET], winner)
     return f"{player} closes auction"
@@ -1,23 +1,84 @@
 import itertools
+import os
 from random import Random
 
 import git
 import yaml
 
+from odb_commit import ObjectReader, read_ref, read_state_at, write_state_commit
 
-def simulate_auction(repo: git.Repo, initial_commit: git.Commit, players: list[str]) -> None:
+# Parsed branch states per repository (see read_state)
+_branch_states: dict[str, 'BranchStates'] = {}
+
+
+class BranchStates:
+    """
+    Parsed states of the player branches of an auction repository, each kept with the commit it was read from,
+    and the set of players whose state still has an UNKNOWN winner.
+    A branch is only parsed again when its tip moved, and the set is only updated then.
+    """
+
+    def __init__(self, repo: git.Repo):
+        self.repo = repo
+        self.reader = ObjectReader(os.path.join(repo.git_dir, 'objects'))
+        self.tips: dict[str, str] = {}
+        self.states: dict[str, dict] = {}
+        self.undecided: set[str] = set()
+
+    def get(self, p: str) -> dict:
+        tip = branch_tip(self.repo, p)
+        if tip != self.tips.get(p):
+            self._set(p, tip, read_state_at(self.reader, tip))
+        return _copy_state(self.states[p])
+
+    def committed(self, p: str, tip: str, state: dict):
+        self._set(p, tip, _copy_state(state))
+
+    def all_decided(self, players: list[str]) -> bool:
+        for p in players:
+            if p not in self.tips:
+                self.get(p)
+        return len(self.undecided) == 0
+
+    def _set(self, p: str, tip: str, state: dict):
+        self.tips[p] = tip
+        self.states[p] = state
+        if any(player_state['winner'] == 'UNKNOWN' for player_state in state.values()):
+            self.undecided.add(p)
+        else:
+            self.undecided.discard(p)
+
+
+def _copy_state(state: dict) -> dict:
+    # Callers change the entries of the players, so cached states are never handed out themselves
+    return {p: dict(player_state) for p, player_state in state.items()}
+
+
+def get_branch_states(repo: git.Repo) -> BranchStates:
+    branch_states = _branch_states.get(repo.git_dir)
+    if branch_states is None:
+        branch_states = _branch_states[repo.git_dir] = BranchStates(repo)
+    return branch_states
+
+
+def simulate_auction(repo: git.Repo, initial_commit: git.Commit, players: list[str],
+                     seed: str | int | None = None) -> dict:
     """
     Simulate the auction process
     :param repo: git repository
     :param initial_commit: initial commit of the repository
     :param players: names of the players
+    :param seed: seed for the random choices, defaults to the hexsha of the initial commit
+    :return: statistics of the run: actions (each one is a commit), merges and the highest round reached
     """
 
     # Use the initial commit to seed the random number generator
     # This way, the simulation will be deterministic
     # and can be reproduced if something fails
-    rand = Random(initial_commit.hexsha)
+    rand = Random(initial_commit.hexsha if seed is None else seed)
 
+    n_actions = 0
+    n_merges = 0
     while not terminated(repo, players):
         p = rand.choice(players)
         possible_actions = [lambda: merge(repo, rand.choice(sorted(list(set(players).difference({p})))), p)]
@@ -32,7 +93,17 @@ def simulate_auction(repo: git.Repo, initial_commit: git.Commit, players: list[s
             possible_actions.append(lambda: next_round(p, repo))
         if is_choose_winner_enabled(p, state):
             possible_actions.append(lambda: choose_winner(p, repo))
-        rand.choice(possible_actions)()
+        action = rand.choice(possible_actions)
+        action()
+        n_actions += 1
+        if action is possible_actions[0]:
+            n_merges += 1
+
+    return {
+        'actions': n_actions,
+        'merges': n_merges,
+        'rounds': max(read_state(repo, p)[p]['round'] for p in players)
+    }
 
 
 def terminated(repo: git.Repo, players: list[str]) -> bool:
@@ -42,12 +113,8 @@ def terminated(repo: git.Repo, players: list[str]) -> bool:
     :param players:
     :return:
     """
-    for p in players:
-        state = read_state(repo, p)
-        for p2 in players:
-            if state[p2]['winner'] == 'UNKNOWN':
-                return False
-    return True
+    # Commits go through write_and_commit, which keeps the branch states up to date
+    return get_branch_states(repo).all_decided(players)
 
 
 def is_bid_enabled(p: str, state: dict) -> bool:
@@ -78,11 +145,21 @@ def bid(p: str, amount: int, repo: git.Repo) -> None:
     :param repo: current repository
     """
 
-    state = read_state(repo, p)
+    write_and_commit(repo, bid_state(p, amount, read_state(repo, p)), p, f"{p} bid {amount}")
+
+
+def bid_state(p: str, amount: int, state: dict) -> dict:
+    """
+    State after a bid of the player, without touching the repository
+    :param p: player name
+    :param amount: amount to bid
+    :param state: state of the player's branch, not changed
+    :return: new state
+    """
+    state = _copy_state(state)
     state[p]['bid'] = amount
     state[p]['last_action'] = 'BID'
-
-    write_and_commit(repo, state, p, f"{p} bid {amount}")
+    return state
 
 
 def is_stand_enabled(p: str, state: dict) -> bool:
@@ -98,10 +175,13 @@ def is_stand_enabled(p: str, state: dict) -> bool:
 
 
 def stand(p: str, repo: git.Repo) -> None:
-    state = read_state(repo, p)
-    state[p]['last_action'] = 'STAND'
+    write_and_commit(repo, stand_state(p, read_state(repo, p)), p, f"{p} stand")
+
 
-    write_and_commit(repo, state, p, f"{p} stand")
+def stand_state(p: str, state: dict) -> dict:
+    state = _copy_state(state)
+    state[p]['last_action'] = 'STAND'
+    return state
 
 
 def is_pass_enabled(p: str, state: dict) -> bool:
@@ -116,10 +196,13 @@ def is_pass_enabled(p: str, state: dict) -> bool:
 
 
 def do_pass(p: str, repo: git.Repo) -> None:
-    state = read_state(repo, p)
-    state[p]['last_action'] = 'PASS'
+    write_and_commit(repo, pass_state(p, read_state(repo, p)), p, f"{p} pass")
+
 
-    write_and_commit(repo, state, p, f"{p} pass")
+def pass_state(p: str, state: dict) -> dict:
+    state = _copy_state(state)
+    state[p]['last_action'] = 'PASS'
+    return state
 
 
 def common_preconditions(p: str, state: dict) -> bool:
@@ -168,9 +251,9 @@ def merge(repo: git.Repo, sender: str, receiver: str) -> None:
     """
 
     sender_state = read_state(repo, sender)
-    sender_parent = repo.head.commit
+    sender_parent = branch_tip(repo, sender)
     receiver_state = read_state(repo, receiver)
-    receiver_parent = repo.head.commit
+    receiver_parent = branch_tip(repo, receiver)
 
     merged = _merge_states(sender_state, receiver_state)
 
@@ -222,11 +305,14 @@ def all_made_action_or_are_ahead(p: str, state: dict) -> bool:
 
 
 def next_round(p: str, repo: git.Repo) -> None:
-    state = read_state(repo, p)
+    write_and_commit(repo, next_round_state(p, read_state(repo, p)), p, f"{p} moved to next round")
+
+
+def next_round_state(p: str, state: dict) -> dict:
+    state = _copy_state(state)
     state[p]['round'] += 1
     state[p]['last_action'] = 'CHANGE'
-
-    write_and_commit(repo, state, p, f"{p} moved to next round")
+    return state
 
 
 def is_choose_winner_enabled(p: str, state: dict) -> bool:
@@ -269,15 +355,19 @@ def all_others_meet_conditions(p: str, state: dict) -> bool:
 
 
 def choose_winner(p: str, repo: git.Repo) -> None:
-    state = read_state(repo, p)
+    state = choose_winner_state(p, read_state(repo, p))
+    write_and_commit(repo, state, p, f"{p} chose winner {state[p]['winner']}")
+
+
+def choose_winner_state(p: str, state: dict) -> dict:
+    state = _copy_state(state)
     if all_have_passed(state):
         winner = "NONE"
     else:
         winner: str = get_winner(state)
 
     state[p]['winner'] = winner
-
-    write_and_commit(repo, state, p, f"{p} chose winner {winner}")
+    return state
 
 
 def get_winner(state: dict) -> str:
@@ -290,18 +380,23 @@ def get_winner(state: dict) -> str:
 
 
 def write_and_commit(repo: git.Repo, state: dict, committer: str, message: str,
-                     parents: list[git.Commit] | None = None) -> None:
+                     parents: list[str] | None = None) -> None:
+    """
+    Commit a state to the branch of a player by writing the objects and moving the branch,
+    without checking the branch out
+    :param repo: git repository
+    :param state: new state
+    :param committer: player whose branch receives the commit
+    :param message: commit message
+    :param parents: hexshas of the parent commits, defaults to the tip of the player's branch
+    """
     check_invariants(state)
 
-    with open(f"{repo.working_tree_dir}/state.yml", 'w') as f:
-        yaml.dump(state, f)
-
+    if parents is None:
+        parents = [branch_tip(repo, committer)]
     author = git.Actor(committer, f"{committer}@auction.com")
-    repo.index.add([f"{repo.working_tree_dir}/state.yml"])
-    repo.index.commit(message,
-                      parent_commits=parents,
-                      author=author,
-                      committer=author)
+    tip = write_state_commit(repo, yaml.dump(state).encode(), message, parents, author, branch=committer)
+    get_branch_states(repo).committed(committer, tip, state)
 
 
 def check_invariants(state: dict) -> None:
@@ -343,7 +438,8 @@ def read_state(repo: git.Repo, p: str) -> dict:
     :return: state dictionary
     """
 
-    repo.git.checkout(p)
-    with open(f"{repo.working_tree_dir}/state.yml", 'r') as f:
-        state = yaml.safe_load(f)
-    return state
+    return get_branch_states(repo).get(p)
+
+
+def branch_tip(repo: git.Repo, p: str) -> str:
+    return read_ref(repo.git_dir, f'refs/heads/{p}')
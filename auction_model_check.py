@@ -0,0 +1,222 @@
+import argparse
+import time
+from collections import deque
+
+from auction_local import (bid_state, stand_state, pass_state, next_round_state, choose_winner_state, _merge_states,
+                           is_bid_enabled, is_stand_enabled, is_pass_enabled, is_next_round_enabled,
+                           is_choose_winner_enabled, highest_known_bid, check_agreement, check_solvability,
+                           check_win_with_higher_bid)
+
+# Explicit-state exploration of the auction protocol without git. A global state is the state of every player's
+# branch. Its successors are every enabled action of every player on their own branch and every merge of another
+# branch into it, exactly as simulate_auction picks them, with every bid amount the player can afford.
+# A global state is terminal once no branch has an UNKNOWN winner left (see auction_local.terminated).
+
+AGREEMENT = 'agreement'
+SOLVABILITY = 'solvability'
+WIN_WITH_HIGHER_BID = 'win_with_higher_bid'
+MERGE = 'merge'
+DEADLOCK = 'deadlock'
+CYCLE = 'cycle'
+
+INVARIANTS = [(AGREEMENT, check_agreement), (SOLVABILITY, check_solvability),
+              (WIN_WITH_HIGHER_BID, check_win_with_higher_bid)]
+
+FIELDS = ('money', 'winner', 'bid', 'last_action', 'round')
+
+
+def initial_global_state(players: list[str], money: list[int]) -> tuple[dict, ...]:
+    state = {p: {'money': money[i], 'winner': 'UNKNOWN', 'bid': 0, 'last_action': 'CHANGE', 'round': 1}
+             for i, p in enumerate(players)}
+    return tuple(state for _ in players)
+
+
+def state_key(global_state: tuple[dict, ...]) -> tuple:
+    # Players are kept in the same order in every branch state, so this tuple identifies a global state
+    return tuple(tuple(tuple(player_state[field] for field in FIELDS) for player_state in branch.values())
+                 for branch in global_state)
+
+
+def is_terminal(global_state: tuple[dict, ...]) -> bool:
+    return all(player_state['winner'] != 'UNKNOWN' for branch in global_state for player_state in branch.values())
+
+
+def successors(players: list[str], global_state: tuple[dict, ...]):
+    """
+    Generate the successors of a global state
+    :param players: names of the players, in the order of the branches
+    :param global_state: state of every player's branch
+    :return: generator of (label, index of the changed branch, new branch state or None if the merge failed, error)
+    """
+    for i, p in enumerate(players):
+        state = global_state[i]
+        if is_bid_enabled(p, state):
+            for amount in range(highest_known_bid(state) + 1, state[p]['money'] + 1):
+                yield f"{p} bid {amount}", i, bid_state(p, amount, state), None
+        if is_stand_enabled(p, state):
+            yield f"{p} stand", i, stand_state(p, state), None
+        if is_pass_enabled(p, state):
+            yield f"{p} pass", i, pass_state(p, state), None
+        if is_next_round_enabled(p, state):
+            yield f"{p} moved to next round", i, next_round_state(p, state), None
+        if is_choose_winner_enabled(p, state):
+            new_state = choose_winner_state(p, state)
+            yield f"{p} chose winner {new_state[p]['winner']}", i, new_state, None
+        for j, sender in enumerate(players):
+            if j == i:
+                continue
+            label = f"{p} received and merged {sender}'s state"
+            try:
+                yield label, i, _merge_states(global_state[j], state), None
+            except Exception as e:
+                yield label, i, None, str(e)
+
+
+def check_model(players: list[str], money: list[int], max_states: int | None = None) -> dict:
+    """
+    Explore every reachable global state breadth first and check the invariants of auction_local on every
+    branch state, that every merge succeeds, that no non-terminal state is stuck and that no run can go on
+    forever (the state graph without self-loops has no cycle)
+    :param players: names of the players
+    :param money: initial money of every player, which bounds the bid amounts
+    :param max_states: stop after this many states, the result is then not exhaustive
+    :return: report with the numbers of states, transitions and terminal states, the exploration speed and
+     one shortest counterexample trace per violated property
+    """
+    start_time = time.perf_counter()
+    initial = initial_global_state(players, money)
+    ids: dict[tuple, int] = {state_key(initial): 0}
+    # Breadth-first tree of the exploration, used to rebuild traces
+    parents: list[tuple[int, str] | None] = [None]
+    edges: list[dict[int, str]] = [{}]
+    queue = deque([(0, initial)])
+    violations: dict[str, dict] = {}
+    n_transitions = 0
+    n_terminal = 0
+    complete = True
+
+    def violation(kind: str, state_id: int, label: str | None, message: str):
+        if kind not in violations:
+            violations[kind] = {'message': message, 'trace': trace(parents, state_id) + ([label] if label else [])}
+
+    while queue:
+        state_id, global_state = queue.popleft()
+        if is_terminal(global_state):
+            n_terminal += 1
+            continue
+
+        progress = False
+        for label, i, branch, error in successors(players, global_state):
+            n_transitions += 1
+            if error is not None:
+                violation(MERGE, state_id, label, error)
+                continue
+            for kind, check in INVARIANTS:
+                try:
+                    check(branch)
+                except Exception as e:
+                    violation(kind, state_id, label, str(e))
+            new_state = global_state[:i] + (branch,) + global_state[i + 1:]
+            key = state_key(new_state)
+            new_id = ids.get(key)
+            if new_id == state_id:
+                continue
+            progress = True
+            if new_id is None:
+                if max_states is not None and len(ids) >= max_states:
+                    complete = False
+                    continue
+                new_id = ids[key] = len(parents)
+                parents.append((state_id, label))
+                edges.append({})
+                queue.append((new_id, new_state))
+            edges[state_id].setdefault(new_id, label)
+
+        if not progress:
+            violation(DEADLOCK, state_id, None, "no action changes this non-terminal state")
+
+    cycle = find_cycle(edges)
+    if cycle is not None:
+        violation(CYCLE, cycle[0], None, f"a run can repeat {len(cycle) - 1} states forever")
+        violations[CYCLE]['cycle'] = [edges[a][b] for a, b in zip(cycle, cycle[1:])]
+
+    seconds = time.perf_counter() - start_time
+    return {
+        'players': players,
+        'money': money,
+        'complete': complete,
+        'states': len(parents),
+        'transitions': n_transitions,
+        'terminal_states': n_terminal,
+        'seconds': seconds,
+        'states_per_second': len(parents) / seconds if seconds else 0,
+        'violations': violations
+    }
+
+
+def trace(parents: list[tuple[int, str] | None], state_id: int) -> list[str]:
+    labels = []
+    while parents[state_id] is not None:
+        state_id, label = parents[state_id]
+        labels.append(label)
+    labels.reverse()
+    return labels
+
+
+def find_cycle(edges: list[dict[int, str]]) -> list[int] | None:
+    """
+    Find a cycle in the state graph with an iterative depth-first search
+    :param edges: successor ids (with the label of the transition) of every state id
+    :return: state ids of a cycle, starting and ending with the same id, or None
+    """
+    on_stack = [False] * len(edges)
+    done = [False] * len(edges)
+    for root in range(len(edges)):
+        if done[root]:
+            continue
+        path = [root]
+        iterators = [iter(edges[root])]
+        on_stack[root] = True
+        while iterators:
+            successor = next(iterators[-1], None)
+            if successor is None:
+                state_id = path.pop()
+                iterators.pop()
+                on_stack[state_id] = False
+                done[state_id] = True
+            elif on_stack[successor]:
+                return path[path.index(successor):] + [successor]
+            elif not done[successor]:
+                path.append(successor)
+                iterators.append(iter(edges[successor]))
+                on_stack[successor] = True
+    return None
+
+
+def print_report(report: dict):
+    print(f"{len(report['players'])} players with money {report['money']}: "
+          f"{'exhaustive' if report['complete'] else 'stopped at the state limit'}")
+    print(f"{report['states']} states, {report['transitions']} transitions, {report['terminal_states']} terminal "
+          f"in {report['seconds']:.2f}s ({report['states_per_second']:.0f} states/s)")
+    if not report['violations']:
+        print("no violations")
+    for kind, v in report['violations'].items():
+        print(f"\n{kind} violated: {v['message']}")
+        for step, label in enumerate(v['trace']):
+            print(f"  {step + 1:>3}. {label}")
+        for label in v.get('cycle', []):
+            print(f"  cycle: {label}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Exhaustively check the auction protocol for small player counts")
+    parser.add_argument('--players', type=int, nargs='+', default=[2, 3], help="player counts to check")
+    parser.add_argument('--money', type=int, nargs='+', default=[2],
+                        help="initial money of the players, repeated cyclically; bounds the bid amounts")
+    parser.add_argument('--max-states', type=int, default=None, help="stop exploring after this many states")
+    args = parser.parse_args()
+
+    for n in args.players:
+        names = [f'p{i}' for i in range(n)]
+        print_report(check_model(names, [args.money[i % len(args.money)] for i in range(n)], args.max_states))
+        print()
@@ -1,9 +1,25 @@
+import argparse
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 import git
 
 from auction_local import simulate_auction
 from constants import ROOT, STARTING_MONEY, N_PLAYERS
 from repo_util import init_auction_repo
 
+# Initial money of every player for a number of players, by distribution name
+MONEY_DISTRIBUTIONS = {
+    'equal': lambda n: [STARTING_MONEY] * n,
+    'linear': lambda n: [STARTING_MONEY * (n + i) // n for i in range(n)],
+    'one_rich': lambda n: [STARTING_MONEY * 2] + [STARTING_MONEY] * (n - 1),
+    'one_poor': lambda n: [STARTING_MONEY // 10] + [STARTING_MONEY] * (n - 1)
+}
+
+SWEEP_COLUMNS = ['players', 'money', 'seed', 'rounds', 'commits', 'merges', 'seconds']
+
 
 def sim(repo_number: int):
     name = f'auction_{repo_number}'
@@ -30,5 +46,121 @@ def run_simulations(start_number: int, iterations: int):
         sim(i)
 
 
+def sweep_run(path: str, n_players: int, distribution: str, seed: int) -> dict:
+    """
+    Run one auction of a parameter sweep in a new repository
+    :param path: directory to create the repository in
+    :param n_players: number of players
+    :param distribution: name of the initial money distribution (see MONEY_DISTRIBUTIONS)
+    :param seed: seed of the random choices of the players
+    :return: one row of the results table (see SWEEP_COLUMNS)
+    """
+    name = f'auction_{n_players}p_{distribution}_s{seed}'
+    player_names = [f'p{i}' for i in range(n_players)]
+    money = MONEY_DISTRIBUTIONS[distribution](n_players)
+
+    start_time = time.perf_counter()
+    repo, initial_commit = init_auction_repo(path, name, player_names, money)
+    stats = simulate_auction(repo, initial_commit, player_names, seed=seed)
+    return {
+        'players': n_players,
+        'money': distribution,
+        'seed': seed,
+        'rounds': stats['rounds'],
+        'commits': stats['actions'],
+        'merges': stats['merges'],
+        'seconds': time.perf_counter() - start_time
+    }
+
+
+def run_sweep(player_counts: list[int], distributions: list[str], seeds: list[int], path: str = ROOT,
+              workers: int | None = None) -> list[dict]:
+    """
+    Run one auction for every combination of player count, money distribution and seed on a pool of
+    worker processes. Every run has its own repository and seed, so its result does not depend on the
+    worker that runs it.
+    :param player_counts: numbers of players
+    :param distributions: names of initial money distributions (see MONEY_DISTRIBUTIONS)
+    :param seeds: seeds of the random choices of the players
+    :param path: directory to create the repositories in, must not contain repositories of an earlier sweep
+    :param workers: number of worker processes, defaults to the number of CPUs
+    :return: results table, one row per run sorted by parameters, failed runs have an 'error' instead of metrics
+    """
+    for distribution in distributions:
+        assert distribution in MONEY_DISTRIBUTIONS, f"Unknown money distribution {distribution}"
+    os.makedirs(path, exist_ok=True)
+
+    grid = list(itertools.product(player_counts, distributions, seeds))
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(sweep_run, path, *params): params for params in grid}
+        for future in as_completed(futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                n_players, distribution, seed = futures[future]
+                results.append({'players': n_players, 'money': distribution, 'seed': seed, 'error': repr(e)})
+
+    results.sort(key=lambda r: (r['players'], distributions.index(r['money']), r['seed']))
+    return results
+
+
+def summarize_sweep(results: list[dict]) -> list[dict]:
+    """
+    Average the metrics of the successful runs per player count and money distribution
+    :param results: results table of run_sweep
+    :return: one row per parameter combination with the number of runs and mean metrics
+    """
+    groups: dict[tuple[int, str], list[dict]] = {}
+    for result in results:
+        if 'error' not in result:
+            groups.setdefault((result['players'], result['money']), []).append(result)
+    return [{
+        'players': n_players,
+        'money': distribution,
+        'runs': len(rows),
+        **{column: sum(row[column] for row in rows) / len(rows) for column in ['rounds', 'commits', 'merges', 'seconds']}
+    } for (n_players, distribution), rows in groups.items()]
+
+
+def print_sweep(results: list[dict]):
+    print(f"{'players':>8}{'money':>10}{'seed':>8}{'rounds':>8}{'commits':>9}{'merges':>8}{'seconds':>9}")
+    for r in results:
+        if 'error' in r:
+            print(f"{r['players']:>8}{r['money']:>10}{r['seed']:>8}  failed: {r['error']}")
+        else:
+            print(f"{r['players']:>8}{r['money']:>10}{r['seed']:>8}{r['rounds']:>8}{r['commits']:>9}{r['merges']:>8}"
+                  f"{r['seconds']:>9.2f}")
+    print()
+    print(f"{'players':>8}{'money':>10}{'runs':>8}{'rounds':>8}{'commits':>9}{'merges':>8}{'seconds':>9}  (means)")
+    for r in summarize_sweep(results):
+        print(f"{r['players']:>8}{r['money']:>10}{r['runs']:>8}{r['rounds']:>8.1f}{r['commits']:>9.1f}"
+              f"{r['merges']:>8.1f}{r['seconds']:>9.2f}")
+
+
+def write_sweep_csv(results: list[dict], path: str):
+    with open(path, 'w') as f:
+        f.write(','.join(SWEEP_COLUMNS + ['error']) + '\n')
+        for r in results:
+            f.write(','.join(str(r.get(column, '')) for column in SWEEP_COLUMNS + ['error']) + '\n')
+
+
 if __name__ == '__main__':
-    run_simulations(start_number=1, iterations=1)
+    parser = argparse.ArgumentParser(description="Run auction simulations, optionally as a parallel parameter sweep")
+    parser.add_argument('--sweep', action='store_true', help="run a parameter sweep instead of a single auction")
+    parser.add_argument('--players', type=int, nargs='+', default=[2, 3, 4, 5], help="player counts of the sweep")
+    parser.add_argument('--money', nargs='+', default=list(MONEY_DISTRIBUTIONS), choices=list(MONEY_DISTRIBUTIONS),
+                        help="initial money distributions of the sweep")
+    parser.add_argument('--seeds', type=int, default=5, help="number of seeds per parameter combination")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes, defaults to the number of CPUs")
+    parser.add_argument('--dir', default=f'{ROOT}/auction_sweep', help="directory to create the sweep repositories in")
+    parser.add_argument('--csv', default=None, help="also write the results table to this CSV file")
+    args = parser.parse_args()
+
+    if args.sweep:
+        sweep_results = run_sweep(args.players, args.money, list(range(args.seeds)), args.dir, args.workers)
+        print_sweep(sweep_results)
+        if args.csv:
+            write_sweep_csv(sweep_results, args.csv)
+    else:
+        run_simulations(start_number=1, iterations=1)
@@ -61,12 +61,9 @@ def transfer_all_assets_to_bank(player: str, state: dict):
     if state[GOOJF_CC_OWNER] == player:
         state[GOOJF_CC_OWNER] = None
 
-    for square in state[BOARD]:
-        if not is_property(square):
-            continue
-        if square[OWNER] == player:
-            square[OWNER] = None
-            square[MORTGAGED] = False
+    for i in list(get_owned_property_idxs(player, state)):
+        set_owner(state, i, None)
+        set_mortgaged(state, i, False)
 
 
 def transfer_all_assets_to_player(p_from: str, p_to: str, state: dict):
@@ -78,6 +75,5 @@ def transfer_all_assets_to_player(p_from: str, p_to: str, state: dict):
     if state[GOOJF_CC_OWNER] == p_from:
         state[GOOJF_CC_OWNER] = p_to
 
-    for square in state[BOARD]:
-        if is_property(square) and square[OWNER] == p_from:
-            square[OWNER] = p_to
+    for i in list(get_owned_property_idxs(p_from, state)):
+        set_owner(state, i, p_to)
@@ -0,0 +1,220 @@
+import argparse
+import json
+import platform
+import sys
+import time
+from typing import Callable, Iterable
+
+from auction import get_enabled_auction_actions
+from bankruptcy_prevention import get_enabled_bankruptcy_prevention_actions
+from constants import *
+from free_4_all import get_enabled_free_4_all_actions
+from monopoly import check_invariants, compute_enabled_actions, get_enabled_actions
+from post_roll import get_enabled_post_roll_actions, get_rail_rent, get_street_rent
+from pre_roll import get_enabled_pre_roll_actions
+from roll import get_enabled_roll_actions
+from state_codec import BINARY_CODEC, JSON_CODEC, YAML_CODEC, decode_state, encode_state
+from state_corpus import CorpusRecorder, StateCorpus
+
+# Microbenchmarks of the per-action work of the engine on a fixed corpus of states.
+# The corpus is sampled from in-memory games with fixed seeds by state_corpus.CorpusRecorder, so it is
+# the same on every run and machine, or read from a corpus file recorded with state_corpus.
+
+EARLY_GAME = 'early_game'
+DEVELOPED_SETS = 'developed_sets'
+MID_AUCTION = 'mid_auction'
+BANKRUPTCY = 'bankruptcy_prevention'
+CATEGORIES = [EARLY_GAME, DEVELOPED_SETS, MID_AUCTION, BANKRUPTCY]
+
+EARLY_GAME_ACTIONS = 50
+CODECS = [YAML_CODEC, JSON_CODEC, BINARY_CODEC]
+MIN_PASS_NS = 20_000_000
+
+# Enabled action functions per phase, with the players that can act in it
+PHASE_ACTIONS: dict[str, tuple[Callable, Callable[[dict], list[str]]]] = {
+    PRE_ROLL: (get_enabled_pre_roll_actions, lambda state: [state[ORDER][state[ACTIVE]]]),
+    ROLL: (get_enabled_roll_actions, lambda state: [state[ORDER][state[ACTIVE]]]),
+    POST_ROLL: (get_enabled_post_roll_actions, lambda state: [state[ORDER][state[ACTIVE]]]),
+    BANKRUPTCY_PREVENTION: (get_enabled_bankruptcy_prevention_actions, lambda state: [state[ORDER][state[ACTIVE]]]),
+    FREE_4_ALL: (get_enabled_free_4_all_actions, lambda state: state[ORDER]),
+    AUCTION: (lambda player, state: get_enabled_auction_actions(player, state, True), lambda state: state[ORDER])
+}
+
+
+def categorize(state: dict, n_actions: int) -> list[str]:
+    categories = []
+    if n_actions <= EARLY_GAME_ACTIONS:
+        categories.append(EARLY_GAME)
+    if any(square.get(LEVEL, 0) > 0 for square in state[BOARD]):
+        categories.append(DEVELOPED_SETS)
+    if state[AUCTION] is not None:
+        categories.append(MID_AUCTION)
+    if state[PHASE] == BANKRUPTCY_PREVENTION:
+        categories.append(BANKRUPTCY)
+    return categories
+
+
+def build_corpus(n_games: int = 5, per_category: int = 25) -> dict[str, list[dict]]:
+    """
+    Collect representative states from in-memory games with fixed seeds, sampled like a corpus file
+    (see state_corpus.CorpusRecorder)
+    :param n_games: number of games
+    :param per_category: number of states per category, evenly spread over all matching states
+    :return: states per category (see CATEGORIES)
+    """
+    recorder = CorpusRecorder()
+    recorder.record_games(n_games, seed='benchmark')
+    return categorize_samples(recorder.samples(), per_category)
+
+
+def corpus_from_file(path: str, per_category: int = 25) -> dict[str, list[dict]]:
+    """
+    Collect representative states from a corpus file (see state_corpus)
+    :param path: corpus file
+    :param per_category: number of states per category, evenly spread over all matching states
+    :return: states per category (see CATEGORIES)
+    """
+    corpus = StateCorpus(path)
+    return categorize_samples(((entry['action'], corpus.state(i)) for i, entry in enumerate(corpus.entries)),
+                              per_category)
+
+
+def categorize_samples(samples: Iterable[tuple[int, dict]], per_category: int) -> dict[str, list[dict]]:
+    matches: dict[str, list[dict]] = {category: [] for category in CATEGORIES}
+    for action, state in samples:
+        for category in categorize(state, action):
+            matches[category].append(state)
+    return spread(matches, per_category)
+
+
+def spread(matches: dict[str, list[dict]], per_category: int) -> dict[str, list[dict]]:
+    corpus = {}
+    for category, states in matches.items():
+        step = max(1, len(states) // per_category)
+        corpus[category] = states[::step][:per_category]
+    return corpus
+
+
+def benchmarks(corpus: dict[str, list[dict]]) -> dict[str, list[Callable[[], object]]]:
+    """
+    Calls to time, by benchmark name. Every call only reads its state.
+    :param corpus: states per category
+    :return: benchmark name -> calls
+    """
+    states = [state for category in CATEGORIES for state in corpus[category]]
+    calls: dict[str, list[Callable[[], object]]] = {}
+
+    def add(name: str, call: Callable[[], object]):
+        calls.setdefault(name, []).append(call)
+
+    for state in states:
+        for player in state[ORDER]:
+            add('get_enabled_actions', lambda p=player, s=state: compute_enabled_actions(p, s, True))
+            # Repeated calls on an unchanged state, e.g. idle polls, after the first one
+            add('get_enabled_actions/cached', lambda p=player, s=state: get_enabled_actions(p, s, True))
+        enabled, players = PHASE_ACTIONS.get(state[PHASE], (None, None))
+        if enabled is not None:
+            for player in players(state):
+                add(f'get_enabled_{state[PHASE]}_actions', lambda p=player, s=state, f=enabled: f(p, s))
+        add('check_invariants', lambda s=state: check_invariants(s))
+        for i, square in enumerate(state[BOARD]):
+            if square[TYPE] == STREET and square[OWNER] is not None:
+                add('get_street_rent', lambda s=state, i_=i: get_street_rent(s, i_))
+            elif square[TYPE] == RAIL and square[OWNER] is not None:
+                add('get_rail_rent', lambda s=state, i_=i: get_rail_rent(s, i_))
+        for codec in CODECS:
+            data = encode_state(state, codec)
+            add(f'encode_state/{codec}', lambda s=state, c=codec: encode_state(s, c))
+            add(f'decode_state/{codec}', lambda d=data: decode_state(d))
+    return calls
+
+
+def run_benchmarks(corpus: dict[str, list[dict]], repeat: int = 5) -> dict:
+    """
+    Time every benchmark over the corpus
+    :param corpus: states per category
+    :param repeat: number of timed passes over all calls, the fastest pass counts
+    :return: machine-readable results: environment, corpus size and mean microseconds per call per benchmark
+    """
+    results = {}
+    for name, calls in sorted(benchmarks(corpus).items()):
+        # Warm up, e.g. builds the board index of the state, and pass over the calls often enough
+        # that a timed pass takes at least MIN_PASS_NS
+        start = time.perf_counter_ns()
+        for call in calls:
+            call()
+        number = max(1, MIN_PASS_NS // max(1, time.perf_counter_ns() - start))
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter_ns()
+            for _ in range(number):
+                for call in calls:
+                    call()
+            elapsed = time.perf_counter_ns() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = {'calls': len(calls), 'us': best / number / len(calls) / 1000}
+    return {
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'corpus': {category: len(states) for category, states in corpus.items()},
+        'repeat': repeat,
+        'results': results
+    }
+
+
+def compare_to_baseline(results: dict, baseline: dict, threshold: float) -> dict[str, dict]:
+    """
+    Compare results with a stored baseline
+    :param results: results of run_benchmarks
+    :param baseline: earlier results of run_benchmarks
+    :param threshold: relative slowdown above which a benchmark counts as regressed, e.g. 0.1 for 10%
+    :return: per benchmark in both: baseline and current microseconds, their ratio and whether it regressed
+    """
+    comparison = {}
+    for name, current in results['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        ratio = current['us'] / before['us'] if before['us'] else 1.0
+        comparison[name] = {'baseline_us': before['us'], 'us': current['us'], 'ratio': ratio,
+                            'regressed': ratio > 1 + threshold}
+    return comparison
+
+
+def print_results(results: dict, comparison: dict[str, dict] | None = None):
+    print(f"Benchmarks over {results['corpus']} states, best of {results['repeat']}")
+    print(f"{'benchmark':<44}{'calls':>8}{'us':>12}" + (f"{'baseline':>12}{'change':>10}" if comparison else ""))
+    for name, r in results['results'].items():
+        line = f"{name:<44}{r['calls']:>8}{r['us']:>12.2f}"
+        if comparison and name in comparison:
+            c = comparison[name]
+            line += f"{c['baseline_us']:>12.2f}{c['ratio'] - 1:>+10.1%}" + ("  REGRESSION" if c['regressed'] else "")
+        print(line)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Time action enumeration, invariant checks, rents and codecs "
+                                                 "on a fixed corpus of states")
+    parser.add_argument('--games', type=int, default=5, help="number of fixed-seed games the corpus is taken from")
+    parser.add_argument('--corpus', help="take the states from this corpus file (see state_corpus) instead")
+    parser.add_argument('--per-category', type=int, default=25, help="number of states per category")
+    parser.add_argument('--repeat', type=int, default=5, help="number of timed passes, the fastest counts")
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    parser.add_argument('--baseline', help="compare with the results in this JSON file")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="relative slowdown against the baseline that counts as a regression")
+    args = parser.parse_args()
+
+    states = (corpus_from_file(args.corpus, args.per_category) if args.corpus
+              else build_corpus(args.games, args.per_category))
+    benchmark_results = run_benchmarks(states, args.repeat)
+    baseline_comparison = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline_comparison = compare_to_baseline(benchmark_results, json.load(f), args.threshold)
+    print_results(benchmark_results, baseline_comparison)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(benchmark_results, f, indent=2)
+    if baseline_comparison and any(c['regressed'] for c in baseline_comparison.values()):
+        sys.exit(1)
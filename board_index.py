@@ -0,0 +1,144 @@
+from bisect import insort
+
+from constants import *
+
+# Keys of the board index, which is kept in state[INDEX] while a state is in memory
+SETS = 'sets'
+OWNED = 'owned'
+COUNTS = 'counts'
+
+# Keys of a set summary
+IDXS = 'idxs'
+UNIFORM = 'uniform'
+MIN_LEVEL = 'min_level'
+MAX_LEVEL = 'max_level'
+N_MORTGAGED = 'n_mortgaged'
+
+
+def get_board_index(state: dict) -> dict:
+    """
+    Get the board index of the state, building it on first use.
+    The index summarizes every street set and lists the properties of every player,
+    so that set predicates and ownership questions do not have to scan the board.
+    It is kept up to date by set_owner, set_level and set_mortgaged.
+    :param state: state dictionary
+    :return: board index
+    """
+    index = state.get(INDEX)
+    if index is None:
+        index = build_board_index(state)
+        state[INDEX] = index
+    return index
+
+
+def build_board_index(state: dict) -> dict:
+    sets: dict[int, dict] = {}
+    for i, square in enumerate(state[BOARD]):
+        if square[TYPE] == STREET:
+            sets.setdefault(square[SET], {IDXS: []})[IDXS].append(i)
+
+    for summary in sets.values():
+        refresh_set_summary(state, summary)
+
+    index = {SETS: sets, OWNED: {}, COUNTS: {}}
+    for i, square in enumerate(state[BOARD]):
+        if is_property(square) and square[OWNER] is not None:
+            _add_owned(index, state, square[OWNER], i)
+    return index
+
+
+def _ownership_key(square: dict) -> str | int:
+    # Rails and utilities are counted per type, streets per set
+    return square[SET] if square[TYPE] == STREET else square[TYPE]
+
+
+def _add_owned(index: dict, state: dict, owner: str, idx: int):
+    insort(index[OWNED].setdefault(owner, []), idx)
+    counts = index[COUNTS].setdefault(owner, {})
+    key = _ownership_key(state[BOARD][idx])
+    counts[key] = counts.get(key, 0) + 1
+
+
+def _remove_owned(index: dict, state: dict, owner: str, idx: int):
+    owned = index[OWNED][owner]
+    owned.remove(idx)
+    counts = index[COUNTS][owner]
+    key = _ownership_key(state[BOARD][idx])
+    counts[key] -= 1
+    if counts[key] == 0:
+        del counts[key]
+    if len(owned) == 0:
+        del index[OWNED][owner]
+        del index[COUNTS][owner]
+
+
+def refresh_set_summary(state: dict, summary: dict):
+    # Sets have at most three streets, so recomputing a summary is constant time
+    streets = [state[BOARD][i] for i in summary[IDXS]]
+    owners = {s[OWNER] for s in streets}
+    levels = [s[LEVEL] for s in streets]
+    summary[OWNER] = streets[0][OWNER]
+    summary[UNIFORM] = len(owners) == 1
+    summary[MIN_LEVEL] = min(levels)
+    summary[MAX_LEVEL] = max(levels)
+    summary[N_MORTGAGED] = sum(1 for s in streets if s[MORTGAGED])
+
+
+def get_set_summary(state: dict, n_set: int) -> dict:
+    return get_board_index(state)[SETS][n_set]
+
+
+def _square_changed(state: dict, idx: int):
+    square = state[BOARD][idx]
+    if square[TYPE] == STREET:
+        mark_dirty(state, SET, square[SET])
+    if INDEX not in state:
+        # The index will be built from the board when it is first used
+        return
+    if square[TYPE] == STREET:
+        refresh_set_summary(state, state[INDEX][SETS][square[SET]])
+
+
+def set_owner(state: dict, idx: int, owner: str | None):
+    old_owner = state[BOARD][idx][OWNER]
+    state[BOARD][idx][OWNER] = owner
+    for p in (old_owner, owner):
+        if p is not None:
+            mark_dirty(state, PLAYERS, p)
+    if INDEX in state and old_owner != owner:
+        if old_owner is not None:
+            _remove_owned(state[INDEX], state, old_owner, idx)
+        if owner is not None:
+            _add_owned(state[INDEX], state, owner, idx)
+    _square_changed(state, idx)
+
+
+def set_level(state: dict, idx: int, level: int):
+    state[BOARD][idx][LEVEL] = level
+    _square_changed(state, idx)
+
+
+def set_mortgaged(state: dict, idx: int, mortgaged: bool):
+    state[BOARD][idx][MORTGAGED] = mortgaged
+    _square_changed(state, idx)
+
+
+def get_owned_property_idxs(player: str, state: dict) -> list[int]:
+    # Ascending board order, like a scan of the board would find them
+    return get_board_index(state)[OWNED].get(player, [])
+
+
+def count_owned(player: str, key: str | int, state: dict) -> int:
+    """
+    Count the properties of a player of one kind
+    :param player: owner
+    :param key: RAIL, UTILITY or the number of a street set
+    :param state: state dictionary
+    :return: number of owned properties of that kind
+    """
+    return get_board_index(state)[COUNTS].get(player, {}).get(key, 0)
+
+
+def owns_all_of_same_set(owner: str, n_set: int, state: dict) -> bool:
+    summary = get_set_summary(state, n_set)
+    return summary[UNIFORM] and summary[OWNER] == owner
@@ -0,0 +1,103 @@
+import argparse
+import time
+import zlib
+
+import git
+
+from constants import *
+from rules import RULES_FILE
+from state_codec import BINARY_CODEC, JSON_CODEC, YAML_CODEC, decode_state, encode_state
+from state_corpus import CorpusRecorder, StateCorpus
+
+CODECS = [YAML_CODEC, JSON_CODEC, BINARY_CODEC]
+
+
+def states_from_simulations(n_games: int, per_bucket: int = 20) -> list[dict]:
+    """
+    Collect real game states by running in-memory games, sampled by phase, player count and progress
+    (see state_corpus.CorpusRecorder)
+    :param n_games: number of games
+    :param per_bucket: states kept per phase, player count and progress
+    :return: list of states
+    """
+    recorder = CorpusRecorder(per_bucket)
+    recorder.record_games(n_games, seed='codec_benchmark')
+    return [state for _, state in recorder.samples()]
+
+
+def states_from_corpus(path: str) -> list[dict]:
+    """
+    Read all states of a corpus file (see state_corpus)
+    :param path: corpus file
+    :return: list of states
+    """
+    return StateCorpus(path).load()
+
+
+def states_from_repo(path: str, every: int) -> list[dict]:
+    """
+    Collect the states of every n-th commit of an existing game repository
+    :param path: repository path
+    :param every: keep every n-th state
+    :return: list of states
+    """
+    repo = git.Repo(path)
+    states = []
+    for i, commit in enumerate(repo.iter_commits()):
+        if i % every == 0 and 'state.yml' in commit.tree:
+            states.append(decode_state(commit.tree['state.yml'].data_stream.read(),
+                                       lambda c=commit: c.tree[RULES_FILE].data_stream.read()))
+    return states
+
+
+def benchmark_codecs(states: list[dict]) -> dict[str, dict]:
+    """
+    Time encoding and decoding of the states with every codec and measure their sizes
+    :param states: states to encode
+    :return: per codec: mean encode and decode time in microseconds, mean raw and zlib compressed bytes
+    """
+    results = {}
+    for codec in CODECS:
+        start = time.perf_counter()
+        encoded = [encode_state(state, codec) for state in states]
+        encode_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for data in encoded:
+            decode_state(data)
+        decode_time = time.perf_counter() - start
+
+        results[codec] = {
+            'encode_us': encode_time / len(states) * 1e6,
+            'decode_us': decode_time / len(states) * 1e6,
+            # git stores objects zlib compressed, so this is roughly what a commit adds to the repo
+            'bytes': sum(len(data) for data in encoded) / len(states),
+            'zlib_bytes': sum(len(zlib.compress(data)) for data in encoded) / len(states)
+        }
+    return results
+
+
+def print_results(results: dict[str, dict], n_states: int):
+    print(f"Codec benchmark over {n_states} states")
+    print(f"{'codec':<8}{'encode us':>12}{'decode us':>12}{'bytes':>10}{'zlib bytes':>12}")
+    for codec, r in results.items():
+        print(f"{codec:<8}{r['encode_us']:>12.1f}{r['decode_us']:>12.1f}{r['bytes']:>10.0f}{r['zlib_bytes']:>12.0f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare the state codecs on real game states")
+    parser.add_argument('--repo', help="read the states from this game repository instead of simulating games")
+    parser.add_argument('--corpus', help="read the states from this corpus file (see state_corpus) instead")
+    parser.add_argument('--games', type=int, default=3, help="number of simulated games")
+    parser.add_argument('--per-bucket', type=int, default=20,
+                        help="states sampled per phase, player count and progress of the simulated games")
+    parser.add_argument('--every', type=int, default=10, help="use every n-th state of the repository")
+    args = parser.parse_args()
+
+    if args.repo:
+        corpus = states_from_repo(args.repo, args.every)
+    elif args.corpus:
+        corpus = states_from_corpus(args.corpus)
+    else:
+        corpus = states_from_simulations(args.games, args.per_bucket)
+    print_results(benchmark_codecs(corpus), len(corpus))
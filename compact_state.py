@@ -0,0 +1,271 @@
+from array import array
+
+import constants
+from constants import *
+
+# Integer codes for the string enums used in the dict state.
+# The position in the tuple is the code.
+SQUARE_TYPES = (GO, STREET, COMMUNITY_CHEST, TAX, RAIL, CHANCE, JAIL, UTILITY, FREE_PARKING, GO_TO_JAIL)
+PHASES = (PRE_ROLL, ROLL, POST_ROLL, DOUBLES_CHECK, FREE_4_ALL, BANKRUPTCY_PREVENTION, AUCTION)
+LAST_ACTIONS = (CHANGE, BID, STAND, PASS)
+
+SQUARE_TYPE_CODES = {t: i for i, t in enumerate(SQUARE_TYPES)}
+PHASE_CODES = {p: i for i, p in enumerate(PHASES)}
+LAST_ACTION_CODES = {a: i for i, a in enumerate(LAST_ACTIONS)}
+
+# Player references are stored as indices into CompactState.names.
+# These negative codes stand for the special values.
+NO_PLAYER = -1
+BANK_CODE = -2
+UNKNOWN_CODE = -1
+NONE_CODE = -2
+
+_DYNAMIC_SQUARE_KEYS = (OWNER, LEVEL, MORTGAGED)
+
+_square_rules_cache: dict[tuple, 'SquareRules'] = {}
+_board_rules_cache: dict[tuple, tuple['SquareRules', ...]] = {}
+_cards_cache: dict[tuple, tuple] = {}
+_key_order_cache: dict[tuple, tuple] = {}
+
+
+class SquareRules:
+    """
+    Immutable data of a board square. Instances are interned, so all compact states share them.
+    """
+    __slots__ = ('keys', 'type', 'name', 'value', 'rent', 'house_cost', 'set')
+
+    def __init__(self, keys: tuple[str, ...], square: dict):
+        self.keys = keys
+        self.type = SQUARE_TYPE_CODES[square[TYPE]]
+        self.name = square[NAME]
+        self.value = square.get(VALUE)
+        self.rent = tuple(square[RENT]) if RENT in square else None
+        self.house_cost = square.get(HOUSE_COST)
+        self.set = square.get(SET)
+
+
+class CompactDebt:
+    __slots__ = ('creditor', 'amount', 'next_phase')
+
+    def __init__(self, creditor: int, amount: int, next_phase: int):
+        self.creditor = creditor
+        self.amount = amount
+        self.next_phase = next_phase
+
+
+class CompactAuctionEntry:
+    __slots__ = ('bid', 'last_action', 'round', 'winner')
+
+    def __init__(self, bid: int, last_action: int, round_: int, winner: int):
+        self.bid = bid
+        self.last_action = last_action
+        self.round = round_
+        self.winner = winner
+
+
+class CompactAuction:
+    __slots__ = ('asset', 'initiator', 'entries')
+
+    def __init__(self, asset: int, initiator: int, entries: dict[int, CompactAuctionEntry]):
+        self.asset = asset
+        self.initiator = initiator
+        self.entries = entries
+
+
+class CompactState:
+    """
+    Slot and array backed game state with integer coded enums.
+    Per player values are parallel arrays indexed like names, per square values are parallel arrays
+    indexed like the board. The static rules (board square data and card decks) are shared between states.
+    """
+    __slots__ = ('key_order', 'names', 'urls', 'order', 'active', 'phase', 'free_4_all_order',
+                 'goojf_ch_owner', 'goojf_cc_owner', 'bank_money', 'winner', 'debt', 'auction',
+                 'money', 'bankrupt', 'in_jail', 'jail_time', 'position', 'consecutive_doubles',
+                 'board', 'owner', 'level', 'mortgaged', 'community_chest', 'chance')
+
+
+def to_compact(state: dict) -> CompactState:
+    """
+    Convert a dict state (as read from state.yml) to its compact representation
+    :param state: state dictionary
+    :return: compact state
+    """
+    c = CompactState()
+    c.key_order = _intern(_key_order_cache, tuple(k for k in state.keys() if not k.startswith('_')))
+    c.names = tuple(state[PLAYERS].keys())
+    codes = {name: i for i, name in enumerate(c.names)}
+    players = [state[PLAYERS][name] for name in c.names]
+
+    c.urls = tuple(p.get(URL) for p in players) if any(URL in p for p in players) else None
+    c.order = array('b', (codes[p] for p in state[ORDER]))
+    c.active = state[ACTIVE]
+    c.phase = PHASE_CODES[state[PHASE]]
+    c.free_4_all_order = None if state[FREE_4_ALL_ORDER] is None \
+        else array('b', (codes[p] for p in state[FREE_4_ALL_ORDER]))
+    c.goojf_ch_owner = _player_code(codes, state[GOOJF_CH_OWNER])
+    c.goojf_cc_owner = _player_code(codes, state[GOOJF_CC_OWNER])
+    c.bank_money = state[BANK_MONEY]
+    c.winner = _player_code(codes, state[WINNER])
+    c.debt = None if state[DEBT] is None else CompactDebt(
+        BANK_CODE if state[DEBT][CREDITOR] == BANK else codes[state[DEBT][CREDITOR]],
+        state[DEBT][AMOUNT],
+        PHASE_CODES[state[DEBT][NEXT_PHASE]])
+    c.auction = None if state[AUCTION] is None else _auction_to_compact(codes, state[AUCTION])
+
+    c.money = array('l', (p[MONEY] for p in players))
+    c.bankrupt = bytearray(p[BANKRUPT] for p in players)
+    c.in_jail = bytearray(p[IN_JAIL] for p in players)
+    c.jail_time = bytearray(p[JAIL_TIME] for p in players)
+    c.position = bytearray(p[POSITION] for p in players)
+    c.consecutive_doubles = bytearray(p[CONSECUTIVE_DOUBLES] for p in players)
+
+    board = state[BOARD]
+    c.board = _intern_board(board)
+    c.owner = array('b', (_player_code(codes, s.get(OWNER)) for s in board))
+    c.level = bytearray(s.get(LEVEL, 0) for s in board)
+    c.mortgaged = bytearray(s.get(MORTGAGED, False) for s in board)
+    c.community_chest = _intern_cards(state[COMMUNITY_CHEST])
+    c.chance = _intern_cards(state[CHANCE])
+    return c
+
+
+def from_compact(c: CompactState) -> dict:
+    """
+    Convert a compact state back to the dict state, such that from_compact(to_compact(state)) == state
+    :param c: compact state
+    :return: state dictionary
+    """
+    names = c.names
+    players = {}
+    for i, name in enumerate(names):
+        player = {}
+        if c.urls is not None and c.urls[i] is not None:
+            player[URL] = c.urls[i]
+        player[MONEY] = c.money[i]
+        player[BANKRUPT] = bool(c.bankrupt[i])
+        player[IN_JAIL] = bool(c.in_jail[i])
+        player[JAIL_TIME] = c.jail_time[i]
+        player[POSITION] = c.position[i]
+        player[CONSECUTIVE_DOUBLES] = c.consecutive_doubles[i]
+        players[name] = player
+
+    values = {
+        ACTIVE: c.active,
+        ORDER: [names[i] for i in c.order],
+        PHASE: PHASES[c.phase],
+        FREE_4_ALL_ORDER: None if c.free_4_all_order is None else [names[i] for i in c.free_4_all_order],
+        GOOJF_CH_OWNER: _player_name(names, c.goojf_ch_owner),
+        GOOJF_CC_OWNER: _player_name(names, c.goojf_cc_owner),
+        BANK_MONEY: c.bank_money,
+        WINNER: _player_name(names, c.winner),
+        DEBT: None if c.debt is None else {
+            CREDITOR: BANK if c.debt.creditor == BANK_CODE else names[c.debt.creditor],
+            AMOUNT: c.debt.amount,
+            NEXT_PHASE: PHASES[c.debt.next_phase]
+        },
+        AUCTION: None if c.auction is None else _auction_from_compact(names, c.auction),
+        PLAYERS: players,
+        BOARD: [_square_from_compact(c, i) for i in range(len(c.board))],
+        COMMUNITY_CHEST: [dict(card) for card in c.community_chest],
+        CHANCE: [dict(card) for card in c.chance]
+    }
+    return {k: values[k] for k in c.key_order}
+
+
+def _player_code(codes: dict[str, int], player: str | None) -> int:
+    return NO_PLAYER if player is None else codes[player]
+
+
+def _player_name(names: tuple[str, ...], code: int) -> str | None:
+    return None if code == NO_PLAYER else names[code]
+
+
+def _auction_to_compact(codes: dict[str, int], auction: dict) -> CompactAuction:
+    entries = {}
+    for p, entry in auction[PLAYERS].items():
+        if entry[WINNER] == UNKNOWN:
+            winner = UNKNOWN_CODE
+        elif entry[WINNER] == NONE:
+            winner = NONE_CODE
+        else:
+            winner = codes[entry[WINNER]]
+        entries[codes[p]] = CompactAuctionEntry(entry[BID], LAST_ACTION_CODES[entry[LAST_ACTION]],
+                                                entry[ROUND], winner)
+    return CompactAuction(auction[ASSET], codes[auction[INITIATOR]], entries)
+
+
+def _auction_from_compact(names: tuple[str, ...], auction: CompactAuction) -> dict:
+    players = {}
+    for i, entry in auction.entries.items():
+        if entry.winner == UNKNOWN_CODE:
+            winner = UNKNOWN
+        elif entry.winner == NONE_CODE:
+            winner = NONE
+        else:
+            winner = names[entry.winner]
+        players[names[i]] = {
+            BID: entry.bid,
+            LAST_ACTION: LAST_ACTIONS[entry.last_action],
+            ROUND: entry.round,
+            WINNER: winner
+        }
+    return {
+        ASSET: auction.asset,
+        INITIATOR: names[auction.initiator],
+        PLAYERS: players
+    }
+
+
+def _square_from_compact(c: CompactState, idx: int) -> dict:
+    rules = c.board[idx]
+    square = {}
+    for key in rules.keys:
+        match key:
+            case constants.TYPE:
+                square[key] = SQUARE_TYPES[rules.type]
+            case constants.NAME:
+                square[key] = rules.name
+            case constants.VALUE:
+                square[key] = rules.value
+            case constants.RENT:
+                square[key] = list(rules.rent)
+            case constants.HOUSE_COST:
+                square[key] = rules.house_cost
+            case constants.SET:
+                square[key] = rules.set
+            case constants.OWNER:
+                square[key] = _player_name(c.names, c.owner[idx])
+            case constants.LEVEL:
+                square[key] = c.level[idx]
+            case constants.MORTGAGED:
+                square[key] = bool(c.mortgaged[idx])
+            case _:
+                raise ValueError(f"Unknown square key: {key}")
+    return square
+
+
+def _intern(cache: dict, value: tuple) -> tuple:
+    return cache.setdefault(value, value)
+
+
+def _intern_board(board: list[dict]) -> tuple[SquareRules, ...]:
+    key = tuple(_static_items(square) for square in board)
+    if key not in _board_rules_cache:
+        _board_rules_cache[key] = tuple(_intern_square_rules(square, items) for square, items in zip(board, key))
+    return _board_rules_cache[key]
+
+
+def _intern_square_rules(square: dict, items: tuple) -> SquareRules:
+    if items not in _square_rules_cache:
+        _square_rules_cache[items] = SquareRules(tuple(square.keys()), square)
+    return _square_rules_cache[items]
+
+
+def _static_items(square: dict) -> tuple:
+    # The key order is part of the identity so that the conversion back preserves it
+    return tuple((k, tuple(v) if isinstance(v, list) else v) if k not in _DYNAMIC_SQUARE_KEYS else (k,)
+                 for k, v in square.items())
+
+
+def _intern_cards(cards: list[dict]) -> tuple:
+    return _intern(_cards_cache, tuple(tuple(card.items()) for card in cards))
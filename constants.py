@@ -1,3 +1,4 @@
+import hashlib
 import os
 from random import Random
 
@@ -77,6 +78,11 @@ GOOFJ_CC = 'goojf_cc'
 GOOFJ_CH = 'goojf_ch'
 
 SQUARE = 'square'
+
+# Runtime data kept in a state while it is in memory. Keys starting with '_' are never written or hashed.
+INDEX = '_index'
+DIRTY = '_dirty'
+ENABLED_ACTIONS = '_enabled_actions'
 JAIL_IDX = 10
 INIT_BOARD = [
     {TYPE: GO, NAME: GO},
@@ -171,11 +177,13 @@ def collect_from_bank(player: str, state: dict, amount: int):
     else:
         state[PLAYERS][player][MONEY] += remaining_bank_money
         state[BANK_MONEY] = 0
+    mark_dirty(state, PLAYERS, player)
 
 
 def pay_bank(player: str, state: dict, amount: int):
     state[PLAYERS][player][MONEY] -= amount
     state[BANK_MONEY] += amount
+    mark_dirty(state, PLAYERS, player)
 
 
 def go_to_jail(player: str, state: dict):
@@ -195,18 +203,9 @@ def is_property(square: dict) -> bool:
     return square[TYPE] in {STREET, RAIL, UTILITY}
 
 
-def owns_all_of_same_set(owner: str, n_set: int, state: dict) -> bool:
-    for s in state[BOARD]:
-        if (s[TYPE] == STREET
-                and s[SET] == n_set
-                and s[OWNER] != owner):
-            return False
-    return True
-
-
 def initialize_free_4_all(state: dict):
     assert state[FREE_4_ALL_ORDER] is None, 'Free for all must not be initialized'
-    rand = Random(str(state))
+    rand = state_random(state)
     f4a_order: list[str] = [p for p in state[ORDER] if not state[PLAYERS][p][BANKRUPT]]
     rand.shuffle(f4a_order)
 
@@ -214,6 +213,71 @@ def initialize_free_4_all(state: dict):
     state[FREE_4_ALL_ORDER] = f4a_order
 
 
+def public_state(state: dict) -> dict:
+    return {k: v for k, v in state.items() if not k.startswith('_')}
+
+
+def start_change_tracking(state: dict):
+    """
+    Record which players, street sets and auction entries are changed from now on,
+    so that check_invariants can re-validate only those
+    :param state: state dictionary that stays in memory across actions
+    """
+    state[DIRTY] = {PLAYERS: set(), SET: set(), AUCTION: False}
+
+
+def mark_dirty(state: dict, key: str, value=True):
+    dirty = state.get(DIRTY)
+    if dirty is None:
+        return
+    if key == AUCTION:
+        dirty[AUCTION] = True
+    else:
+        dirty[key].add(value)
+
+
+def state_random(state: dict) -> Random:
+    # Seeded by the state itself, so that all players derive the same values
+    return Random(int.from_bytes(state_digest(state), 'big'))
+
+
+def state_digest(state: dict) -> bytes:
+    """
+    Digest of the mutable part of the state in a canonical order.
+    Static data (square names, prices, rent tables, cards) and dict key order do not take part,
+    so it is much cheaper than hashing the whole state and every player computes the same digest.
+    The player names do take part, otherwise all games would start with the same rolls.
+    :param state: state dictionary
+    :return: 16 byte digest
+    """
+    order = state[ORDER]
+    players = state[PLAYERS]
+    debt = state[DEBT]
+    auction = state[AUCTION]
+    canonical = (
+        tuple(order),
+        state[PHASE],
+        state[ACTIVE],
+        state[BANK_MONEY],
+        state[WINNER],
+        state[GOOJF_CH_OWNER],
+        state[GOOJF_CC_OWNER],
+        None if state[FREE_4_ALL_ORDER] is None else tuple(state[FREE_4_ALL_ORDER]),
+        None if debt is None else (debt[CREDITOR], debt[AMOUNT], debt[NEXT_PHASE]),
+        None if auction is None else (
+            auction[ASSET],
+            auction[INITIATOR],
+            tuple((p, a[BID], a[LAST_ACTION], a[ROUND], a[WINNER])
+                  for p in order if p in auction[PLAYERS] for a in (auction[PLAYERS][p],))
+        ),
+        tuple((p[MONEY], p[BANKRUPT], p[IN_JAIL], p[JAIL_TIME], p[POSITION], p[CONSECUTIVE_DOUBLES])
+              for p in (players[name] for name in order)),
+        tuple((i, s[OWNER], s.get(LEVEL), s[MORTGAGED])
+              for i, s in enumerate(state[BOARD]) if s.get(OWNER) is not None)
+    )
+    return hashlib.blake2b(repr(canonical).encode(), digest_size=16).digest()
+
+
 def get_int_from_input(prompt: str) -> int:
     while True:
         try:
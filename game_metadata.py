@@ -0,0 +1,117 @@
+import json
+
+import git
+
+from constants import *
+from rules import RULES, RULES_FILE, find_rules, has_rules_hash, register_rules
+from state_codec import DEFAULT_CODEC, decode_state, read_header
+
+# Every player repository holds a small record of its game in the .git directory, written when the
+# repository is created: the name of its player, the initial commit, the players, the rules (see rules)
+# and the codec of the game. It is read once per repository and cached, so resuming a game does not
+# depend on the length of its history.
+METADATA_FILE = 'monopoly-game.json'
+# Before the metadata record, the player name was the only thing stored, in this file of the .git directory
+LEGACY_NAME_FILE = '.name'
+METADATA_VERSION = 1
+INITIAL_COMMIT = 'initial_commit'
+CODEC = 'codec'
+VERSION = 'version'
+
+_metadata: dict[str, dict] = {}
+
+
+def write_game_metadata(repo: git.Repo, player: str, initial_commit: str, players: list[str],
+                        rules_hash: str, codec: str) -> dict:
+    """
+    Write the metadata record of a player repository
+    :param repo: player repository
+    :param player: name of the player of the repository
+    :param initial_commit: hexsha of the initial commit of the game
+    :param players: names of the players in turn order
+    :param rules_hash: hash of the rules of the game
+    :param codec: state codec of the game
+    :return: the metadata
+    """
+    metadata = {
+        VERSION: METADATA_VERSION,
+        NAME: player,
+        INITIAL_COMMIT: initial_commit,
+        PLAYERS: list(players),
+        RULES: rules_hash,
+        CODEC: codec
+    }
+    path = os.path.join(repo.git_dir, METADATA_FILE)
+    with open(f"{path}.lock", 'w') as f:
+        json.dump(metadata, f, indent=2)
+    os.replace(f"{path}.lock", path)
+    _metadata[repo.git_dir] = metadata
+    return metadata
+
+
+def write_game_metadata_for_state(repo: git.Repo, player: str, initial_commit: str, state: dict,
+                                  codec: str) -> dict:
+    """
+    Write the metadata record of a player repository for the initial state of its game
+    (see write_game_metadata)
+    """
+    return write_game_metadata(repo, player, initial_commit, state[ORDER], find_rules(state), codec)
+
+
+def get_game_metadata(repo: git.Repo) -> dict:
+    """
+    Metadata of the game of a player repository, read from the repository only on the first call.
+    Repositories created before the metadata record get one, which takes one walk over their history.
+    :param repo: player repository
+    :return: the metadata (see write_game_metadata)
+    """
+    metadata = _metadata.get(repo.git_dir)
+    if metadata is None:
+        try:
+            with open(os.path.join(repo.git_dir, METADATA_FILE)) as f:
+                metadata = _metadata[repo.git_dir] = json.load(f)
+        except FileNotFoundError:
+            metadata = _legacy_game_metadata(repo)
+    return metadata
+
+
+def _legacy_game_metadata(repo: git.Repo) -> dict:
+    with open(os.path.join(repo.git_dir, LEGACY_NAME_FILE)) as f:
+        player = f.read().strip()
+    if not repo.head.is_valid():
+        # The initial commit has not been merged yet, so only the player is known. It is not cached,
+        # so the full record is written once the repository has a history.
+        return {NAME: player}
+    initial_commit = next(repo.iter_commits(rev='HEAD', reverse=True))
+    data = (initial_commit.tree / 'state.yml').data_stream.read()
+    codec, _, _ = read_header(data)
+    state = decode_state(data, lambda: (initial_commit.tree / RULES_FILE).data_stream.read())
+    return write_game_metadata_for_state(repo, player, initial_commit.hexsha, state, codec)
+
+
+def load_game(repo: git.Repo) -> dict:
+    """
+    Prepare resuming the game of a player repository: read its metadata and make its rules known,
+    in case they are not the built-in ones
+    :param repo: player repository
+    :return: the metadata (see write_game_metadata)
+    """
+    metadata = get_game_metadata(repo)
+    rules_hash = metadata.get(RULES)
+    if rules_hash is not None and not has_rules_hash(rules_hash):
+        register_rules(json.loads((repo.head.commit.tree / RULES_FILE).data_stream.read()))
+    return metadata
+
+
+def get_game_codec(repo: git.Repo) -> str:
+    # Repositories that have not received the initial commit yet only know their player
+    return get_game_metadata(repo).get(CODEC, DEFAULT_CODEC)
+
+
+def get_initial_commit(repo: git.Repo) -> git.Commit:
+    """
+    Initial commit of the game of a player repository, without walking its history
+    :param repo: player repository
+    :return: the commit
+    """
+    return repo.commit(get_game_metadata(repo)[INITIAL_COMMIT])
@@ -1,10 +1,17 @@
 import logging
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 import git
 
 from constants import *
-from monopoly import simulate_monopoly, take_action
+from game_metadata import get_game_codec, get_initial_commit, load_game
+from monopoly import simulate_monopoly, simulate_monopoly_in_memory, take_action
+from push_worker import stop_push_worker
+from replay import enable_replay_verification
 from repo_util import init_monopoly_simulation_repos, init_monopoly_repo, join_new_game, rejoin_game
+from state_codec import DEFAULT_CODEC, check_git_mergeable
+from timing import TIMING_LOG, start_game_timing
 
 
 def create_new_game():
@@ -47,18 +54,104 @@ def rejoin():
     game_loop(repo)
 
 
-def run_simulations(n=1):
+def run_simulations(n=1, in_memory=False, log_timings: bool = False):
     for i in range(n):
-        name = f'monopoly_{i}'
-        player_names = [f'm{i}_p{j}' for j in range(3)]
+        run_simulation(i, in_memory, log_timings=log_timings)
+
+
+def run_simulation(i: int, in_memory: bool = False, codec: str = DEFAULT_CODEC, shared: bool = False,
+                   log_timings: bool = False) -> dict:
+    """
+    Run the i-th simulated game to termination
+    :param i: number of the game, determines its name, its players and (through them) its seed
+    :param in_memory: run the game on the in-memory engine instead of player repositories
+    :param codec: state codec of the player repositories, one that git can merge
+    :param shared: let the player repositories share one object store and commit and merge in-process
+    :param log_timings: write the action timings to a rotating log file in the game directory
+    :return: summary of the game
+    """
+    name = f'monopoly_{i}'
+    player_names = [f'm{i}_p{j}' for j in range(N_PLAYERS)]
+    start_time = time.perf_counter()
+    if in_memory:
+        state = simulate_monopoly_in_memory(player_names, name)
+    else:
+        # Before creating the repositories, which git has to merge
+        check_git_mergeable(codec)
         try:
-            repos, initial_commit = init_monopoly_simulation_repos(ROOT, name, player_names)
+            repos, initial_commit = init_monopoly_simulation_repos(ROOT, name, player_names, codec, shared)
         except FileExistsError:
             print('Game already exists, loading repos')
             repos = [git.Repo(f'{ROOT}/{name}/{player}') for player in player_names]
-            initial_commit = next(repos[0].iter_commits(rev='HEAD', reverse=True))
+            load_game(repos[0])
+            initial_commit = get_initial_commit(repos[0])
+            # Keep writing the states like the game did so far
+            codec = get_game_codec(repos[0])
             print('Loaded initial commit:', initial_commit.hexsha)
-        simulate_monopoly(repos, initial_commit)
+        timing_log = f'{ROOT}/{name}/{TIMING_LOG}' if log_timings else None
+        state = simulate_monopoly(repos, initial_commit, codec, odb=shared, timing_log=timing_log)
+    print(f"Game {name} is terminated, WINNER: ", state[WINNER])
+    return {
+        NAME: name,
+        WINNER: state[WINNER],
+        'seat': player_names.index(state[WINNER]),
+        'seconds': time.perf_counter() - start_time
+    }
+
+
+def run_simulations_parallel(n=1, workers: int | None = None, in_memory=False, codec: str = DEFAULT_CODEC,
+                             shared: bool = False, log_timings: bool = False) -> dict:
+    """
+    Run n simulated games on a pool of worker processes.
+    Every game lives in its own directory and is seeded by its own initial commit (or name), so the
+    outcome of a game does not depend on the worker that runs it or on the order in which games finish.
+    :param n: number of games
+    :param workers: number of worker processes, defaults to the number of CPUs
+    :param in_memory: run the games on the in-memory engine instead of player repositories
+    :param codec: state codec of the player repositories
+    :param shared: let the player repositories of each game share one object store
+    :param log_timings: write the action timings of each game to a rotating log file in its directory
+    :return: merged summary of all games
+    """
+    results = []
+    failures = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_simulation, i, in_memory, codec, shared, log_timings): i for i in range(n)}
+        for future in as_completed(futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                failures[f'monopoly_{futures[future]}'] = repr(e)
+
+    results.sort(key=lambda r: int(r[NAME].split('_')[1]))
+    summary = merge_simulation_results(results)
+    summary['failures'] = failures
+    print_simulation_summary(summary)
+    return summary
+
+
+def merge_simulation_results(results: list[dict]) -> dict:
+    wins_per_seat = [0] * N_PLAYERS
+    for result in results:
+        wins_per_seat[result['seat']] += 1
+    total_seconds = sum(result['seconds'] for result in results)
+    return {
+        'games': len(results),
+        'wins_per_seat': wins_per_seat,
+        'total_seconds': total_seconds,
+        'mean_seconds': total_seconds / len(results) if results else 0,
+        'results': results
+    }
+
+
+def print_simulation_summary(summary: dict):
+    print('==============================================================================================')
+    print(f"Finished {summary['games']} games, {len(summary['failures'])} failed")
+    for seat, wins in enumerate(summary['wins_per_seat']):
+        print(f"Seat {seat}: {wins} wins")
+    print(f"Mean game time: {summary['mean_seconds']:.2f}s (total {summary['total_seconds']:.2f}s)")
+    for name, error in summary['failures'].items():
+        print(f"{name} failed: {error}")
 
 
 def main():
@@ -68,9 +161,10 @@ def main():
     1. Create a new game
     2. Join a new game
     3. Rejoin an active game
-    4. Run simulations""")
-    choice = get_int_from_input_in_range("Please select an option (1-4): ",
-                                         1, 4)
+    4. Run simulations
+    5. Run simulations in parallel""")
+    choice = get_int_from_input_in_range("Please select an option (1-5): ",
+                                         1, 5)
     match choice:
         case 1:
             create_new_game()
@@ -81,14 +175,34 @@ def main():
         case 4:
             n = get_int_from_input("Enter the number of simulations to run: ")
             run_simulations(n)
-
-
-def game_loop(repo: git.Repo):
+        case 5:
+            n = get_int_from_input("Enter the number of simulations to run: ")
+            workers = get_int_from_input_in_range("Enter the number of worker processes: ", 1, os.cpu_count() or 1)
+            run_simulations_parallel(n, workers)
+
+
+def game_loop(repo: git.Repo, timing_log: str | None = None, verify: bool = False):
+    """
+    Play the game of a player repository until it terminates
+    :param repo: player repository
+    :param timing_log: if given, append the action timings to this rotating log file
+    :param verify: replay the commits of the other players before merging them (see replay).
+     Only for games in which every player records its actions, commits without records fail verification.
+    """
     terminated = False
     # suppress error output for git push and fetch
     logging.getLogger("git.remote").setLevel(logging.ERROR)
+    # Also gives games created before the metadata record one
+    load_game(repo)
+    codec = get_game_codec(repo)
+    if verify:
+        enable_replay_verification(repo)
+    timings = start_game_timing(timing_log)
     while not terminated:
-        terminated = take_action(repo)
+        terminated = take_action(repo, codec=codec)
+    # take_action pushed the end of the game before returning
+    stop_push_worker(repo)
+    timings.flush()
 
 
 if __name__ == '__main__':
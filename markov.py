@@ -0,0 +1,179 @@
+import argparse
+import time
+
+import numpy as np
+
+from constants import *
+
+# Exact landing probabilities from the Markov chain of one token moving by the rules of the engine.
+# A chain state is observed before every roll: either a square and the number of consecutive doubles
+# rolled so far in the turn (0 to 2), or a jail state with the number of missed jail rolls (0 to 2).
+# Jailed players always try to roll doubles and pay the fine after the third miss (see roll.roll_in_jail),
+# and cards are drawn uniformly from the full deck.
+
+N_SQUARES = len(INIT_BOARD)
+N_DOUBLES_STATES = 3
+N_JAIL_STATES = 3
+N_STATES = N_SQUARES * N_DOUBLES_STATES + N_JAIL_STATES
+DICE = [(d1, d2) for d1 in range(1, 7) for d2 in range(1, 7)]
+
+
+def free_state(position: int, consecutive_doubles: int) -> int:
+    return position * N_DOUBLES_STATES + consecutive_doubles
+
+
+def jail_state(jail_time: int) -> int:
+    return N_SQUARES * N_DOUBLES_STATES + jail_time
+
+
+def resolve_landing(position: int) -> list[tuple[float, int, bool, list[int]]]:
+    """
+    Where a token that lands on a square ends up
+    :param position: square the token lands on
+    :return: (probability, final position, sent to jail, squares landed on) for every outcome
+    """
+    square_type = INIT_BOARD[position][TYPE]
+    if square_type == GO_TO_JAIL:
+        return [(1.0, JAIL_IDX, True, [position, JAIL_IDX])]
+    if square_type in (COMMUNITY_CHEST, CHANCE):
+        cards = CC_CARDS if square_type == COMMUNITY_CHEST else CH_CARDS
+        outcomes = []
+        for card in cards:
+            p = 1 / len(cards)
+            if card[TYPE] == ADVANCE_TO:
+                outcomes.append((p, card[SQUARE], False, [position, card[SQUARE]]))
+            elif card[TYPE] == GO_TO_JAIL:
+                outcomes.append((p, JAIL_IDX, True, [position, JAIL_IDX]))
+            else:
+                outcomes.append((p, position, False, [position]))
+        return outcomes
+    return [(1.0, position, False, [position])]
+
+
+def build_transition_matrix() -> tuple[np.ndarray, np.ndarray]:
+    """
+    Build the transition matrix of the chain and the expected landings per roll
+    :return: transitions[s, t] = P(next state t | state s),
+     landings[s, i] = expected number of times the token lands on square i during a roll from state s
+    """
+    transitions = np.zeros((N_STATES, N_STATES))
+    landings = np.zeros((N_STATES, N_SQUARES))
+
+    def move(s: int, p: float, new_pos: int, next_doubles: int):
+        for q, final, jailed, landed in resolve_landing(new_pos):
+            t = jail_state(0) if jailed else free_state(final, next_doubles)
+            transitions[s, t] += p * q
+            for i in landed:
+                landings[s, i] += p * q
+
+    for position in range(N_SQUARES):
+        for doubles in range(N_DOUBLES_STATES):
+            s = free_state(position, doubles)
+            for d1, d2 in DICE:
+                p = 1 / len(DICE)
+                if d1 == d2 and doubles == 2:
+                    # Third consecutive doubles: straight to jail, the token only lands if it moves
+                    transitions[s, jail_state(0)] += p
+                    if position != JAIL_IDX:
+                        landings[s, JAIL_IDX] += p
+                    continue
+                next_doubles = doubles + 1 if d1 == d2 else 0
+                move(s, p, (position + d1 + d2) % N_SQUARES, next_doubles)
+
+    for jail_time in range(N_JAIL_STATES):
+        s = jail_state(jail_time)
+        for d1, d2 in DICE:
+            p = 1 / len(DICE)
+            if d1 == d2 or jail_time == 2:
+                # Doubles out of jail do not give another roll
+                move(s, p, JAIL_IDX + d1 + d2, 0)
+            else:
+                transitions[s, jail_state(jail_time + 1)] += p
+    return transitions, landings
+
+
+def stationary_distribution(transitions: np.ndarray) -> np.ndarray:
+    # Solve pi P = pi with sum(pi) = 1 by replacing one balance equation with the normalization
+    a = transitions.T - np.eye(len(transitions))
+    a[-1] = 1
+    b = np.zeros(len(transitions))
+    b[-1] = 1
+    return np.linalg.solve(a, b)
+
+
+def solve_landing_probabilities() -> dict:
+    """
+    Solve the chain
+    :return: report with, per square, the probability of being there before a roll ('stationary'),
+     the share of all landings ('landing_frequencies') and the expected landings per turn,
+     the expected number of rolls per turn, and per street the expected rent per turn of an opponent
+     for every building level (see street_rent_per_turn)
+    """
+    transitions, landings = build_transition_matrix()
+    pi = stationary_distribution(transitions)
+
+    stationary = np.zeros(N_SQUARES)
+    for position in range(N_SQUARES):
+        stationary[position] = pi[free_state(position, 0):free_state(position, 0) + N_DOUBLES_STATES].sum()
+    stationary[JAIL_IDX] += pi[jail_state(0):].sum()
+
+    # A turn ends with every roll after which the player has no doubles pending (including going to jail)
+    turn_ends = pi[jail_state(0):].sum() + sum(pi[free_state(position, 0)] for position in range(N_SQUARES))
+    rolls_per_turn = 1 / turn_ends
+    landings_per_roll = pi @ landings
+    landings_per_turn = landings_per_roll * rolls_per_turn
+
+    return {
+        'stationary': stationary.tolist(),
+        'landing_frequencies': (landings_per_roll / landings_per_roll.sum()).tolist(),
+        'landings_per_turn': landings_per_turn.tolist(),
+        'rolls_per_turn': float(rolls_per_turn),
+        'street_rent_per_turn': street_rent_per_turn(landings_per_turn)
+    }
+
+
+def street_rent_per_turn(landings_per_turn: np.ndarray) -> dict[str, list[float]]:
+    """
+    Expected rent one opponent pays per turn for every street
+    :param landings_per_turn: expected landings per turn of one token on every square
+    :return: street name -> rent per turn without the full set, with the full set, and with 1 to 5 buildings
+    """
+    rents = {}
+    for i, square in enumerate(INIT_BOARD):
+        if square[TYPE] != STREET:
+            continue
+        levels = [square[RENT][0], square[RENT][0] * 2] + square[RENT][1:]
+        rents[square[NAME]] = [float(landings_per_turn[i] * rent) for rent in levels]
+    return rents
+
+
+def print_report(report: dict):
+    print(f"expected rolls per turn: {report['rolls_per_turn']:.4f}")
+    print(f"{'square':<24}{'stationary':>12}{'landings':>10}{'per turn':>10}")
+    for square, stationary, freq, per_turn in zip(INIT_BOARD, report['stationary'], report['landing_frequencies'],
+                                                  report['landings_per_turn']):
+        print(f"{square[NAME]:<24}{stationary:>12.2%}{freq:>10.2%}{per_turn:>10.4f}")
+    print()
+    print(f"{'rent per opponent turn':<24}{'no set':>8}{'set':>8}" + "".join(f"{f'{n}h':>8}" for n in range(1, 6)))
+    for name, rents in report['street_rent_per_turn'].items():
+        print(f"{name:<24}" + "".join(f"{rent:>8.2f}" for rent in rents))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Exact landing probabilities and rent expectations")
+    parser.add_argument('--compare-vectorized', type=int, default=0,
+                        help="also compare the landing frequencies with this many vectorized simulation games")
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    result = solve_landing_probabilities()
+    elapsed = time.perf_counter() - start_time
+    print_report(result)
+    print(f"\nsolved in {elapsed * 1000:.1f}ms")
+    if args.compare_vectorized:
+        from vectorized_simulation import simulate_vectorized
+
+        simulated = np.array(simulate_vectorized(args.compare_vectorized)['landing_frequencies'])
+        diff = np.abs(simulated - np.array(result['landing_frequencies']))
+        print(f"total variation distance to {args.compare_vectorized} vectorized games: {diff.sum() / 2:.4f}, "
+              f"largest difference {diff.max():.2%} on {INIT_BOARD[int(diff.argmax())][NAME]}")
@@ -1,42 +1,153 @@
 import itertools
 import random
-import threading
-import time
 from typing import Callable
 
 import git
-import yaml
 
 from auction import get_enabled_auction_actions
 from bankruptcy_prevention import get_enabled_bankruptcy_prevention_actions
+from board_index import build_board_index, get_owned_property_idxs, get_set_summary, refresh_set_summary, IDXS
+from compact_state import from_compact, to_compact
 from constants import *
 from doubles_check import doubles_check
 from free_4_all import get_enabled_free_4_all_actions
+from game_metadata import get_game_metadata
+from odb_commit import OdbCommitter, read_head, read_ref
 from post_roll import get_enabled_post_roll_actions
 from pre_roll import get_enabled_pre_roll_actions
+from push_worker import get_push_worker, stop_push_worker
+from replay import action_record, enable_replay_verification, format_action_record, get_replay_verifier, \
+    verify_remote_commits, with_action_records
+from repo_util import init_monopoly_state, write_history_repo
 from roll import get_enabled_roll_actions
+from rules import rules_file_reader
+from shared_store import get_shared_object_dir, merge_from_shared_store
+from state_codec import DEFAULT_CODEC, check_git_mergeable, decode_state, encode_state
 from termination import is_terminate_enabled, terminate, is_terminated
-
-
-def simulate_monopoly(repos: list[git.Repo], initial_commit: git.Commit):
+from timing import COMMIT, GIT, MERGE, action_kind, get_timing_registry, start_game_timing
+
+
+# Last state read per repository with the commit it was read at (see read_player_and_state)
+_states: dict[str, tuple[str, dict]] = {}
+
+
+def simulate_monopoly(repos: list[git.Repo], initial_commit: git.Commit, codec: str = DEFAULT_CODEC,
+                      odb: bool = False, group_size: int = 1, verify: bool = False,
+                      snapshot_interval: int = 0, timing_log: str | None = None) -> dict:
+    """
+    Simulate a game on the player repositories
+    :param repos: player repositories
+    :param initial_commit: initial commit, seeds the random choice of players and actions
+    :param codec: state codec, binary only with odb and a snapshot interval, as git cannot merge it
+    :param odb: commit straight into the object databases instead of through working trees and indexes.
+     Repositories sharing an object store (see init_monopoly_simulation_repos) then also merge without fetching.
+    :param group_size: with odb, squash this many consecutive actions of a player into one commit
+    :param verify: replay the commits of the other players before merging them (see replay)
+    :param snapshot_interval: with odb, commit only the changes of the state and the full state every this many
+     commits (see OdbCommitter)
+    :param timing_log: also write the action timings of the game to this rotating log file (see timing)
+    :return: the final state
+    """
+    if not (odb and snapshot_interval):
+        check_git_mergeable(codec)
+    timings = start_game_timing(timing_log)
     rand = Random(initial_commit.hexsha)
+    if verify:
+        for verified_repo in repos:
+            enable_replay_verification(verified_repo)
+    committers = {repo.git_dir: OdbCommitter(repo, codec, group_size, get_shared_object_dir(repo), snapshot_interval)
+                  for repo in repos} if odb else {}
     terminated = False
     while not terminated:
         repo = rand.choice(repos)
-        if not os.path.exists(f"{repo.working_tree_dir}/state.yml"):
-            merge_from_remotes(repo)
+        committer = committers.get(repo.git_dir)
+        has_state = committer.has_state() if committer else os.path.exists(f"{repo.working_tree_dir}/state.yml")
+        if not has_state:
+            with timings.time(GIT, MERGE):
+                merge_from_remotes(repo, committer)
             terminated = False
         else:
-            terminated = take_action(repo, sim=True, rand=rand)
-
+            terminated = take_action(repo, sim=True, rand=rand, codec=codec, committer=committer)
+    for c in committers.values():
+        # Leave the working trees like the classic commit path would
+        c.sync_working_tree()
+    timings.print_summary()
+    timings.flush()
+    # The final push of the game happened in take_action
+    for player_repo in repos:
+        stop_push_worker(player_repo)
+    if verify:
+        for verified_repo in repos:
+            get_replay_verifier(verified_repo).print_summary()
+    if committer is not None:
+        return committer.read_state()
+    _, state = read_player_and_state(repo)
+    return state
+
+
+def simulate_monopoly_in_memory(players: list[str], seed: str, max_actions: int | None = None,
+                                history_path: str | None = None, history_name: str | None = None,
+                                full_check_interval: int = 100, codec: str = DEFAULT_CODEC,
+                                observer: Callable[[str, dict], None] | None = None) -> dict:
+    """
+    Simulate a game on a live state object, without reading, writing or committing state.yml per action
+    :param players: names of the players in turn order
+    :param seed: seed for the random choice of players and actions
+    :param max_actions: stop after this many actions even if the game is not terminated
+    :param history_path: if given, write the game as a git history to history_path/history_name at the end
+    :param history_name: repository name for the history, defaults to the seed
+    :param full_check_interval: check all invariants every this many actions, otherwise only the changed parts
+    :param codec: state codec of the history
+    :param observer: called with the commit message and the live state after every action
+    :return: the final state
+    """
+    rand = Random(seed)
+    state = init_monopoly_state(players)
+    start_change_tracking(state)
+    # Compact states take a fraction of the memory of dict states and are faster to take than deep copies
+    history = [(f"initial commit {seed}", to_compact(state))] if history_path else None
+
+    n_actions = 0
+    while not is_terminated(state) and (max_actions is None or n_actions < max_actions):
+        player = rand.choice(players)
+        enabled_actions = get_enabled_actions(player, state, sim=True)
+        if len(enabled_actions) == 0:
+            # Another player has to act. The actions are cached per state, so this check is cheap.
+            if not any(get_enabled_actions(p, state, sim=True) for p in players):
+                raise Exception(f"Deadlock after {n_actions} actions: no player can act in phase {state[PHASE]}")
+            continue
 
-def take_action(repo: git.Repo, sim: bool = False, rand: Random = None) -> bool:
-    # push if origin exists and has unpushed commits first in case of connection loss after taking an action.
-    threading.Thread(target=push_if_origin_exists_and_has_unpushed, args=(repo,), daemon=True).start()
-    player, state = read_player_and_state(repo)
+        message, action = enabled_actions[0] if len(enabled_actions) == 1 else rand.choice(enabled_actions)
+        commit_message = action()
+        invalidate_enabled_actions(state)
+        n_actions += 1
+        check_invariants(state, full=n_actions % full_check_interval == 0)
+        if history is not None:
+            history.append((commit_message, to_compact(state)))
+        if observer is not None:
+            observer(commit_message, state)
+
+    if history is not None:
+        write_history_repo(history_path, history_name or seed,
+                           [(message, from_compact(compact)) for message, compact in history], codec)
+    return state
+
+
+def take_action(repo: git.Repo, sim: bool = False, rand: Random = None, codec: str = DEFAULT_CODEC,
+                committer: OdbCommitter | None = None) -> bool:
+    # Pushes run in the background, after every commit and merge.
+    # The worker also retries pushes that failed after an earlier action, e.g. because of a connection loss.
+    push_worker = get_push_worker(repo)
+    if committer is None:
+        player, state = read_player_and_state(repo)
+    else:
+        player, state = read_player(repo), committer.read_state()
 
     if is_terminated(state):
-        final_push_success = push_if_origin_exists_and_has_unpushed(repo)
+        if committer is not None:
+            with push_worker.lock:
+                committer.flush()
+        final_push_success = push_worker.flush()
         if final_push_success:
             print("Game is terminated, WINNER: ", state[WINNER])
             return True
@@ -46,7 +157,9 @@ def take_action(repo: git.Repo, sim: bool = False, rand: Random = None) -> bool:
     enabled_actions = get_enabled_actions(player, state, sim)
 
     if len(enabled_actions) == 0:
-        merge_from_remotes(repo)
+        with push_worker.lock, get_timing_registry().time(GIT, MERGE):
+            merge_from_remotes(repo, committer)
+        push_worker.request()
         return False
 
     if len(enabled_actions) == 1:
@@ -58,28 +171,75 @@ def take_action(repo: git.Repo, sim: bool = False, rand: Random = None) -> bool:
             message, action = get_wanted_action(enabled_actions)
 
     print(f"Executing action: {message}")
-    if sim:
-        start_time = time.time_ns()
-
-    commit_message = action()
-    check_invariants_and_commit(commit_message, repo, state)
-
-    if sim:
-        execution_time = time.time_ns() - start_time
-        with open(f"{os.getcwd()}/action_times.log", "a") as log_file:
-            log_file.write(f"{execution_time}\n")
+    timings = get_timing_registry()
+    try:
+        with timings.time(state[PHASE], action_kind(action)):
+            commit_message = action()
+        invalidate_enabled_actions(state)
+        record = format_action_record(action_record(player, message, state))
+        with push_worker.lock, timings.time(GIT, COMMIT):
+            if committer is None:
+                check_invariants_and_commit(with_action_records(commit_message, [record]), repo, state, codec)
+            else:
+                check_invariants(state)
+                committer.commit(commit_message, state, record)
+    except Exception as e:
+        # The cached state was changed in place but not committed, the next read must decode it again
+        _states.pop(repo.git_dir, None)
+        if committer is not None:
+            committer.discard_state()
+        raise e
+    push_worker.request()
     return False
 
 
 def read_player_and_state(repo: git.Repo) -> tuple[str, dict]:
-    with open(f"{repo.working_tree_dir}/.git/.name", 'r') as f:
-        player = f.read().strip()
-    with open(f"{repo.working_tree_dir}/state.yml", 'r') as f:
-        state = yaml.safe_load(f)
+    """
+    Read the player and the state of a repository. The state is only decoded again when HEAD has moved,
+    e.g. by a merge, so polls that find nothing to do reuse the state and its enabled actions.
+    :param repo: player repository
+    :return: player, state
+    """
+    player = read_player(repo)
+    head = read_head(repo.git_dir)
+    cached = _states.get(repo.git_dir)
+    if head is not None and cached is not None and cached[0] == head:
+        return player, cached[1]
+    with open(f"{repo.working_tree_dir}/state.yml", 'rb') as f:
+        state = decode_state(f.read(), rules_file_reader(repo.working_tree_dir))
+    _states[repo.git_dir] = (head, state)
     return player, state
 
 
+def read_player(repo: git.Repo) -> str:
+    # Cached after the first read (see game_metadata)
+    return get_game_metadata(repo)[NAME]
+
+
 def get_enabled_actions(player: str, state: dict, sim: bool) -> list:
+    """
+    Enabled actions of a player, computed once per state version and kept in the state.
+    A state read from a new commit is a new object and starts without cached actions. Whoever changes a
+    state in place, e.g. by executing one of its actions, must call invalidate_enabled_actions.
+    :param player: player
+    :param state: state dictionary
+    :param sim: whether the actions are simulated (see get_enabled_auction_actions)
+    :return: (label, action) pairs, shared between calls, so they must not be changed
+    """
+    cache = state.get(ENABLED_ACTIONS)
+    if cache is None:
+        cache = state[ENABLED_ACTIONS] = {}
+    enabled = cache.get((player, sim))
+    if enabled is None:
+        enabled = cache[(player, sim)] = compute_enabled_actions(player, state, sim)
+    return enabled
+
+
+def invalidate_enabled_actions(state: dict):
+    state.pop(ENABLED_ACTIONS, None)
+
+
+def compute_enabled_actions(player: str, state: dict, sim: bool) -> list:
     if is_terminate_enabled(state):
         return [("Terminate", lambda: terminate(player, state))]
 
@@ -106,7 +266,16 @@ def get_enabled_actions(player: str, state: dict, sim: bool) -> list:
     return enabled
 
 
-def merge_from_remotes(repo: git.Repo):
+def merge_from_remotes(repo: git.Repo, committer: OdbCommitter | None = None):
+    if committer is not None and get_shared_object_dir(repo) is not None:
+        merge_from_shared_store(repo, committer)
+        return
+    # Git cannot merge delta commits, so the committer merges the fetched branches itself
+    delta = committer is not None and committer.snapshot_interval > 0
+    if delta:
+        committer.flush()
+    elif committer is not None:
+        committer.sync_working_tree()
     for remote in repo.remotes:
         if remote.name == 'origin':
             # Skip the origin remote, as it is not a player remote.
@@ -118,11 +287,18 @@ def merge_from_remotes(repo: git.Repo):
             # remote or its main branch is not available. Just try the next one.
             continue
 
+        verify_remote_commits(repo, remote.name)
+
+        if delta:
+            committer.merge_branch(read_ref(repo.git_dir, f'refs/remotes/{remote.name}/main'), f'{remote.name}/main')
+            continue
         try:
             repo.git.merge(f'{remote.name}/main')
         except git.CommandError as e:
             print(f"Failed to merge from {remote.name} in repo {repo.working_tree_dir}")
             raise e
+    if committer is not None and not delta:
+        committer.mark_synced()
 
 
 def get_wanted_action(enabled_actions):
@@ -135,67 +311,99 @@ def get_wanted_action(enabled_actions):
     return enabled_actions[choice - 1]  # adjust for 0-indexing
 
 
-def check_invariants_and_commit(message, repo, state):
+def check_invariants_and_commit(message, repo, state, codec=DEFAULT_CODEC):
+    check_git_mergeable(codec)
     check_invariants(state)
-    with open(f"{repo.working_tree_dir}/state.yml", 'w') as f:
-        yaml.dump(state, f)
+    with open(f"{repo.working_tree_dir}/state.yml", 'wb') as f:
+        f.write(encode_state(state, codec))
     repo.index.add(f"{repo.working_tree_dir}/state.yml")
-    repo.index.commit(f"{message}")
-
-
-def push_if_origin_exists_and_has_unpushed(repo: git.Repo) -> bool:
-    #  Return True if push was successful or not required, False otherwise.
-
-    try:
-        origin = repo.remote("origin")
-    except ValueError:
-        # The repo does not have an origin remote
-        # e.g. case in simulations
-        # just ignore it
-        return True
-    try:
-        has_unpushed_commits = repo.git.rev_list('origin/main..main', count=True) != '0'
-    except git.exc.GitCommandError:
-        # the origin main branch does not yes have any commits
-        has_unpushed_commits = True
-
-    if has_unpushed_commits:
-        try:
-            origin.push().raise_if_error()
-        except Exception as e:
-            # push failed, try again the next time
-            return False
-    return True
-
-def check_invariants(state: dict):
+    commit = repo.index.commit(f"{message}")
+    # The committed state is the one in memory, no need to decode it again (see read_player_and_state)
+    _states[repo.git_dir] = (commit.hexsha, state)
+
+
+def check_invariants(state: dict, full: bool = True):
+    """
+    Check the invariants of the state.
+    If the state tracks its changes (see start_change_tracking) and full is False, only the players,
+    street sets and auction entries changed since the last check are re-validated.
+    :param state: state dictionary
+    :param full: check everything, regardless of the tracked changes
+    """
     try:
-        check_street_levels(state)
-        check_player_money(state)
-        check_total_money(state)
-        if state[AUCTION] is not None:
-            check_auction_invariants(state)
+        dirty = state.get(DIRTY)
+        if full or dirty is None:
+            check_street_levels(state)
+            check_player_money(state)
+            check_total_money(state)
+            check_board_index(state)
+            if state[AUCTION] is not None:
+                check_auction_invariants(state)
+        else:
+            check_changed_invariants(state, dirty)
+        if dirty is not None:
+            start_change_tracking(state)
     except Exception as e:
         print("Invariant check failed:", e)
         print("State on error:", state)
         raise e
 
 
+def check_changed_invariants(state: dict, dirty: dict):
+    for n_set in dirty[SET]:
+        check_set_levels(state, get_set_summary(state, n_set)[IDXS])
+    check_player_money(state, dirty[PLAYERS])
+    check_total_money(state)
+    check_owned_properties(state, dirty[PLAYERS], dirty[SET])
+    if state[AUCTION] is not None and (dirty[AUCTION] or dirty[PLAYERS]):
+        check_auction_invariants(state)
+
+
 def check_street_levels(state: dict):
-    for square in state[BOARD]:
+    sets: dict[int, list[int]] = {}
+    for i, square in enumerate(state[BOARD]):
         if square[TYPE] == STREET:
-            if square[LEVEL] > 5:
-                raise Exception(f"Street {square[NAME]} has level {square[LEVEL]} > 5")
-            if square[LEVEL] < 0:
-                raise Exception(f"Street {square[NAME]} has level {square[LEVEL]} < 0")
-            n_set = square[SET]
-            for square2 in state[BOARD]:
-                if square2[TYPE] == STREET and square2[SET] == n_set:
-                    if abs(square2[LEVEL] - square2[LEVEL]) > 1:
-                        raise Exception("Streets from same set have levels with difference > 1")
-
-
-def check_player_money(state: dict):
-    for player in state[PLAYERS]:
+            sets.setdefault(square[SET], []).append(i)
+    for idxs in sets.values():
+        check_set_levels(state, idxs)
+
+
+def check_set_levels(state: dict, idxs: list[int]):
+    levels = []
+    for i in idxs:
+        square = state[BOARD][i]
+        if square[LEVEL] > 5:
+            raise Exception(f"Street {square[NAME]} has level {square[LEVEL]} > 5")
+        if square[LEVEL] < 0:
+            raise Exception(f"Street {square[NAME]} has level {square[LEVEL]} < 0")
+        levels.append(square[LEVEL])
+    if max(levels) - min(levels) > 1:
+        raise Exception(f"Streets from set {state[BOARD][idxs[0]][SET]} have levels with difference > 1")
+
+
+def check_board_index(state: dict):
+    if INDEX in state and state[INDEX] != build_board_index(state):
+        raise Exception("Board index is out of sync with the board")
+
+
+def check_owned_properties(state: dict, players: set[str], sets: set[int]):
+    # Partial index check for the changed players and sets, check_board_index covers the rest
+    if INDEX not in state:
+        return
+    for player in players:
+        for i in get_owned_property_idxs(player, state):
+            if state[BOARD][i][OWNER] != player:
+                raise Exception(f"Board index lists {state[BOARD][i][NAME]} as property of {player}")
+    for n_set in sets:
+        summary = get_set_summary(state, n_set)
+        expected = dict(summary)
+        refresh_set_summary(state, expected)
+        if summary != expected:
+            raise Exception(f"Board index summary of set {n_set} is out of sync with the board")
+
+
+def check_player_money(state: dict, players=None):
+    for player in state[PLAYERS] if players is None else players:
         if state[PLAYERS][player][MONEY] < 0:
             raise Exception(f"Player {player} has negative money")
         if state[PLAYERS][player][MONEY] > TOTAL_MONEY:
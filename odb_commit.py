@@ -0,0 +1,444 @@
+import os
+import time
+from io import BytesIO
+
+import git
+from git.objects.fun import tree_entries_from_data, tree_to_stream
+from gitdb import IStream, LooseObjectDB, OStream, PackedDB
+from gitdb.exc import BadObject
+
+from constants import public_state
+from rules import RULES_FILE
+from state_codec import DEFAULT_CODEC, check_git_mergeable, decode_state, encode_state
+from state_delta import apply_delta, copy_value, decode_delta, diff_states, encode_delta, merge_states
+
+STATE_FILE = 'state.yml'
+# Delta commits (see OdbCommitter) hold the changes since their first parent instead of the full state
+DELTA_FILE = 'state.delta'
+BLOB_MODE = 0o100644
+
+
+def write_state_commit(repo: git.Repo, data: bytes, message: str, parents: list[str], actor: git.Actor,
+                       branch: str = 'main', odb: LooseObjectDB | None = None, filename: str = STATE_FILE,
+                       extra_entries: list[tuple[bytes, int, str]] = ()) -> str:
+    """
+    Commit an encoded state by writing the blob, tree and commit objects straight into the object database
+    and moving the branch. The working tree, the index and the git executable are not used.
+    :param repo: git repository
+    :param data: encoded state
+    :param message: commit message
+    :param parents: hexshas of the parent commits
+    :param actor: author and committer
+    :param branch: branch to move to the new commit
+    :param odb: object database to write to, defaults to the loose objects of the repository
+    :param filename: file the data is stored in, STATE_FILE or DELTA_FILE
+    :param extra_entries: further tree entries (binsha, mode, name) of existing blobs, e.g. the rules file
+    :return: hexsha of the new commit
+    """
+    if odb is None:
+        odb = LooseObjectDB(os.path.join(repo.git_dir, 'objects'))
+    blob = _store(odb, git.Blob.type, data)
+
+    stream = BytesIO()
+    # Git requires the entries of a tree to be sorted by name
+    entries = sorted([(blob.binsha, BLOB_MODE, filename), *extra_entries], key=lambda entry: entry[2])
+    tree_to_stream(entries, stream.write)
+    tree = _store(odb, git.Tree.type, stream.getvalue())
+
+    signature = f"{actor.name} <{actor.email}> {int(time.time())} +0000"
+    lines = [f"tree {tree.hexsha.decode()}"]
+    lines += [f"parent {parent}" for parent in parents]
+    lines += [f"author {signature}", f"committer {signature}", "", message]
+    commit = _store(odb, git.Commit.type, "\n".join(lines).encode())
+
+    hexsha = commit.hexsha.decode()
+    write_ref(repo.git_dir, f'refs/heads/{branch}', hexsha)
+    return hexsha
+
+
+def _store(odb: LooseObjectDB, type_: str, data: bytes) -> IStream:
+    return odb.store(IStream(type_, len(data), BytesIO(data)))
+
+
+def write_ref(git_dir: str, ref: str, hexsha: str):
+    # Write the new value next to the ref and rename it over the ref, like git does with its lock files
+    path = os.path.join(git_dir, ref)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    lock_path = f"{path}.lock"
+    with open(lock_path, 'w') as f:
+        f.write(f"{hexsha}\n")
+    os.replace(lock_path, path)
+
+
+def read_ref(git_dir: str, ref: str) -> str | None:
+    """
+    Read a ref of a repository without going through git
+    :param git_dir: .git directory of the repository
+    :param ref: full name of the ref, e.g. refs/heads/main
+    :return: hexsha the ref points to, None if it does not exist
+    """
+    try:
+        with open(os.path.join(git_dir, ref)) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        pass
+    try:
+        with open(os.path.join(git_dir, 'packed-refs')) as f:
+            for line in f:
+                if line.rstrip().endswith(f" {ref}"):
+                    return line.split()[0]
+    except FileNotFoundError:
+        pass
+    return None
+
+
+def read_head(git_dir: str) -> str | None:
+    """
+    Read the commit HEAD points to without going through git
+    :param git_dir: .git directory of the repository
+    :return: hexsha, None if the branch of HEAD has no commit yet
+    """
+    with open(os.path.join(git_dir, 'HEAD')) as f:
+        head = f.read().strip()
+    if head.startswith('ref: '):
+        return read_ref(git_dir, head[len('ref: '):])
+    return head
+
+
+class ObjectReader:
+    """
+    Reads loose and packed objects of an objects directory and of its alternates.
+    Unlike gitdb.GitDB it does not follow the alternates of alternates, which may point back in circles
+    when player repositories list each other (see shared_store).
+    """
+
+    def __init__(self, object_dir: str):
+        dirs = [object_dir]
+        try:
+            with open(os.path.join(object_dir, 'info', 'alternates')) as f:
+                dirs += [line.strip() for line in f if line.strip()]
+        except FileNotFoundError:
+            pass
+        self.loose = [LooseObjectDB(d) for d in dirs]
+        self.packed = [PackedDB(os.path.join(d, 'pack')) for d in dirs]
+
+    def stream(self, binsha: bytes) -> OStream:
+        for db in self.loose:
+            if db.has_object(binsha):
+                return db.stream(binsha)
+        for refresh in (False, True):
+            for db in self.packed:
+                if refresh:
+                    # New packs may have been written by a fetch or by gc
+                    db.update_cache(force=True)
+                if db.has_object(binsha):
+                    return db.stream(binsha)
+        raise BadObject(binsha)
+
+
+def read_commit_header(odb: 'ObjectReader', hexsha: str) -> tuple[str, list[str]]:
+    """
+    Read the tree and the parents of a commit from an object database
+    :param odb: object database
+    :param hexsha: commit
+    :return: hexsha of the tree, hexshas of the parents
+    """
+    data = odb.stream(bytes.fromhex(hexsha)).read()
+    header = data[:data.index(b'\n\n')].decode().split('\n')
+    tree = header[0].split()[1]
+    parents = [line.split()[1] for line in header[1:] if line.startswith('parent ')]
+    return tree, parents
+
+
+def read_commit_message(odb: 'ObjectReader', hexsha: str) -> str:
+    data = odb.stream(bytes.fromhex(hexsha)).read()
+    return data[data.index(b'\n\n') + 2:].decode()
+
+
+def read_state_at(odb: 'ObjectReader', hexsha: str) -> dict:
+    """
+    Read the state of a commit, materializing delta commits from the nearest full state before them
+    :param odb: object database
+    :param hexsha: commit
+    :return: state dictionary
+    """
+    deltas = []
+    name, data = read_state_file(odb, hexsha)
+    while name == DELTA_FILE:
+        hexsha, _, ops = decode_delta(data)
+        deltas.append(ops)
+        name, data = read_state_file(odb, hexsha)
+    state = decode_state(data, lambda: read_tree_file(odb, hexsha, RULES_FILE))
+    for ops in reversed(deltas):
+        apply_delta(state, ops)
+    return state
+
+
+def read_state_file(odb: 'ObjectReader', hexsha: str) -> tuple[str, bytes]:
+    """
+    Read the state file of a commit as it is stored
+    :param odb: object database
+    :param hexsha: commit
+    :return: STATE_FILE and the encoded state, or DELTA_FILE and the encoded delta
+    """
+    tree, _ = read_commit_header(odb, hexsha)
+    for binsha, _, name in tree_entries_from_data(odb.stream(bytes.fromhex(tree)).read()):
+        if name in (STATE_FILE, DELTA_FILE):
+            return name, odb.stream(binsha).read()
+    raise FileNotFoundError(f"Commit {hexsha} has no {STATE_FILE}")
+
+
+def read_tree_file(odb: 'ObjectReader', hexsha: str, filename: str) -> bytes:
+    """
+    Read a file of the tree of a commit
+    :param odb: object database
+    :param hexsha: commit
+    :param filename: name of the file in the root of the tree
+    :return: contents of the file
+    """
+    tree, _ = read_commit_header(odb, hexsha)
+    for binsha, _, name in tree_entries_from_data(odb.stream(bytes.fromhex(tree)).read()):
+        if name == filename:
+            return odb.stream(binsha).read()
+    raise FileNotFoundError(f"Commit {hexsha} has no {filename}")
+
+
+def delta_depth(odb: 'ObjectReader', hexsha: str) -> int:
+    # Number of delta commits since the last full state, 0 for a full state
+    name, data = read_state_file(odb, hexsha)
+    return decode_delta(data)[1] if name == DELTA_FILE else 0
+
+
+class OdbCommitter:
+    """
+    Reads and commits the state of a player repository without going through the working tree and the index.
+    With a group size n > 1, n consecutive local actions are squashed into one commit whose body lists
+    the message of every action, followed by the records of all of them (see replay). Until then the actions
+    only exist in memory, so flush must be called before other players need to see them.
+    The committer also tracks which commits are in the history of the branch, so that fast-forwards
+    can be told apart from real merges without asking git.
+    With a snapshot interval n > 0, commits only store the changes since their parent (see state_delta),
+    and every n-th commit stores the full state again. Git cannot merge such commits, so diverged branches
+    are merged by the committer (see merge).
+    """
+
+    def __init__(self, repo: git.Repo, codec: str = DEFAULT_CODEC, group_size: int = 1,
+                 object_dir: str | None = None, snapshot_interval: int = 0):
+        """
+        :param repo: player repository
+        :param codec: state codec of the full states, binary only with a snapshot interval
+        :param group_size: number of actions per commit
+        :param object_dir: objects directory new objects are written to, defaults to the one of the repository.
+         The repository must be able to read it, e.g. through its alternates.
+        :param snapshot_interval: write delta commits with a full state every this many commits, 0 for full
+         states only
+        """
+        assert group_size > 0, "Group size must be positive"
+        if not snapshot_interval:
+            # Full state commits of diverged branches are merged by git
+            check_git_mergeable(codec)
+        self.repo = repo
+        self.codec = codec
+        self.group_size = group_size
+        self.snapshot_interval = snapshot_interval
+        self.odb = LooseObjectDB(object_dir or os.path.join(repo.git_dir, 'objects'))
+        self.reader = ObjectReader(os.path.join(repo.git_dir, 'objects'))
+        self.actor = git.Actor.committer(repo.config_reader())
+        # The last state this committer wrote (or read) and the commit it belongs to
+        self.state: dict | None = None
+        self.state_head: str | None = None
+        # With deltas, a copy of the state of state_head that the actions do not change
+        self.base: dict | None = None
+        self.pending_messages: list[str] = []
+        self.pending_records: list[str] = []
+        # Tree entry of the rules file, which every commit carries over from the first one (see rules)
+        self.rules_entries: list[tuple[bytes, int, str]] | None = None
+        self.history: set[str] = set()
+        self.synced_head: str | None = self.head_hexsha()
+        self._add_to_history(self.synced_head)
+
+    def has_state(self) -> bool:
+        return self.pending_messages != [] or self.head_hexsha() is not None
+
+    def read_state(self) -> dict:
+        if self.pending_messages:
+            return self.state
+        head = self.head_hexsha()
+        if head != self.state_head:
+            self.state = read_state_at(self.reader, head)
+            self.state_head = head
+            if self.snapshot_interval:
+                self.base = copy_value(self.state)
+        return self.state
+
+    def discard_state(self):
+        """
+        Forget the in-memory state, e.g. after an action failed half-way through changing it, so the next
+        read_state reads the state of the branch again. Actions of the group that were not flushed yet are
+        dropped as well, since they only exist in the changed state.
+        """
+        self.state = None
+        self.state_head = None
+        self.pending_messages = []
+        self.pending_records = []
+
+    def commit(self, message: str, state: dict, record: str | None = None):
+        """
+        Commit a state, or keep it until the group is full
+        :param message: message of the action
+        :param state: state after the action
+        :param record: action record formatted by replay.format_action_record
+        """
+        self.state = state
+        self.pending_messages.append(message)
+        if record is not None:
+            self.pending_records.append(record)
+        if len(self.pending_messages) >= self.group_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending_messages:
+            return
+        messages = self.pending_messages
+        if len(messages) == 1:
+            message = messages[0]
+        else:
+            message = f"{messages[-1]} (+{len(messages) - 1} earlier actions)\n\n" + "\n".join(messages)
+        if self.pending_records:
+            message += "\n\n" + "\n".join(self.pending_records)
+        head = self.head_hexsha()
+        parents = [head] if head is not None else []
+        depth = 0
+        if self.snapshot_interval and head is not None and head == self.state_head:
+            depth = delta_depth(self.reader, head) + 1
+        if 0 < depth < self.snapshot_interval:
+            ops = diff_states(self.base, self.state)
+            self.state_head = write_state_commit(self.repo, encode_delta(head, depth, ops), message, parents,
+                                                 self.actor, odb=self.odb, filename=DELTA_FILE,
+                                                 extra_entries=self._rules_entries(head))
+            apply_delta(self.base, ops)
+        else:
+            self.state_head = write_state_commit(self.repo, encode_state(self.state, self.codec), message, parents,
+                                                 self.actor, odb=self.odb, extra_entries=self._rules_entries(head))
+            if self.snapshot_interval:
+                self.base = copy_value(public_state(self.state))
+        self.history.add(self.state_head)
+        self.pending_messages = []
+        self.pending_records = []
+
+    def _rules_entries(self, head: str | None) -> list[tuple[bytes, int, str]]:
+        if self.rules_entries is None:
+            if head is None:
+                return []
+            tree, _ = read_commit_header(self.reader, head)
+            entries = tree_entries_from_data(self.reader.stream(bytes.fromhex(tree)).read())
+            self.rules_entries = [entry for entry in entries if entry[2] == RULES_FILE]
+        return self.rules_entries
+
+    def contains(self, hexsha: str) -> bool:
+        return hexsha in self.history
+
+    def can_fast_forward(self, hexsha: str) -> bool:
+        """
+        Check whether the branch can be fast-forwarded to a commit, i.e. whether its head is an ancestor of it.
+        Only the commits not yet in the history of the branch are visited.
+        :param hexsha: commit to fast-forward to
+        :return: True if the head is an ancestor of the commit
+        """
+        head = self.head_hexsha()
+        if head is None:
+            return True
+        seen = set()
+        stack = [hexsha]
+        while stack:
+            commit = stack.pop()
+            if commit == head:
+                return True
+            if commit in seen or commit in self.history:
+                continue
+            seen.add(commit)
+            stack.extend(read_commit_header(self.reader, commit)[1])
+        return False
+
+    def fast_forward(self, hexsha: str):
+        assert not self.pending_messages, "Flush before moving the branch"
+        write_ref(self.repo.git_dir, 'refs/heads/main', hexsha)
+        self._add_to_history(hexsha)
+
+    def _add_to_history(self, hexsha: str | None):
+        stack = [hexsha] if hexsha is not None else []
+        while stack:
+            commit = stack.pop()
+            if commit in self.history:
+                continue
+            self.history.add(commit)
+            stack.extend(read_commit_header(self.reader, commit)[1])
+
+    def merge_branch(self, hexsha: str | None, name: str):
+        """
+        Bring a branch of another player into the branch: nothing if it is already contained,
+        a fast-forward if possible, otherwise a merge (see merge)
+        :param hexsha: tip of the other branch, None if it does not exist
+        :param name: name of the other branch, e.g. p1/main
+        """
+        if hexsha is None or self.contains(hexsha):
+            return
+        self.flush()
+        if self.can_fast_forward(hexsha):
+            self.fast_forward(hexsha)
+        else:
+            self.merge(hexsha, name)
+
+    def merge(self, hexsha: str, name: str):
+        """
+        Merge a diverged commit into the branch in-process (see state_delta.merge_states) and commit the
+        merged state in full. Used instead of git merge for delta commits.
+        :param hexsha: commit to merge
+        :param name: name of the merged branch for the commit message, e.g. p1/main
+        """
+        self.flush()
+        head = self.head_hexsha()
+        ours = read_state_at(self.reader, head)
+        merged = merge_states(self._merge_base_state(head, [hexsha]), ours, read_state_at(self.reader, hexsha))
+        self.state_head = write_state_commit(self.repo, encode_state(merged, self.codec),
+                                             f"Merge remote-tracking branch '{name}'", [head, hexsha], self.actor,
+                                             odb=self.odb, extra_entries=self._rules_entries(head))
+        self.state = merged
+        self.base = copy_value(merged)
+        self._add_to_history(self.state_head)
+
+    def _merge_base_state(self, commit: str, others: list[str]) -> dict:
+        """
+        State of the merge base of a commit and a (hypothetical) merge of other commits.
+        Criss-cross merges, e.g. of players that merged each other at the same time, have several merge bases.
+        Like git's recursive merge, they are merged into a virtual base first, each one with the merge base
+        of itself and the bases merged before it.
+        :param commit: commit
+        :param others: commits
+        :return: state of the (virtual) merge base
+        """
+        bases = self.repo.git.merge_base('--all', commit, *others).split()
+        state = read_state_at(self.reader, bases[0])
+        for i in range(1, len(bases)):
+            state = merge_states(self._merge_base_state(bases[i], bases[:i]), state,
+                                 read_state_at(self.reader, bases[i]))
+        return state
+
+    def sync_working_tree(self):
+        """
+        Flush pending actions and bring the index and working tree up to date with the branch,
+        which git merge requires. Does nothing if the branch did not move since the last sync.
+        """
+        self.flush()
+        head = self.head_hexsha()
+        if head is not None and head != self.synced_head:
+            self.repo.head.reset(index=True, working_tree=True)
+        self.synced_head = head
+
+    def mark_synced(self):
+        # git merge leaves the index and working tree in sync with the branch
+        self.synced_head = self.head_hexsha()
+        self._add_to_history(self.synced_head)
+
+    def head_hexsha(self) -> str | None:
+        return read_ref(self.repo.git_dir, 'refs/heads/main')
@@ -2,6 +2,7 @@ from typing import Callable
 
 import constants
 from auction import initialize_auction
+from board_index import count_owned, owns_all_of_same_set, set_owner
 from constants import *
 
 
@@ -141,11 +142,7 @@ def pay_rail_rent(player: str, state: dict):
 def get_rail_rent(state: dict, position: int) -> int:
     square = state[BOARD][position]
     owner = square[OWNER]
-    n_owned_railroads = 0
-    for s in state[BOARD]:
-        if (s[TYPE] == RAIL
-                and s[OWNER] == owner):
-            n_owned_railroads += 1
+    n_owned_railroads = count_owned(owner, RAIL, state)
     return 25 * (2 ** (n_owned_railroads - 1))
 
 
@@ -221,7 +218,7 @@ def try_pay_util_rent(player: str, state: dict):
     position = state[PLAYERS][player][POSITION]
     square = state[BOARD][position]
 
-    rand = Random(str(state))
+    rand = state_random(state)
     d1 = rand.randint(1, 6)
     d2 = rand.randint(1, 6)
 
@@ -244,8 +241,7 @@ def try_pay_util_rent(player: str, state: dict):
 
 
 def owns_both_utilities(owner: str, state: dict) -> bool:
-    owned_utilities = [s for s in state[BOARD] if s[TYPE] == UTILITY and s[OWNER] == owner]
-    return len(owned_utilities) == 2
+    return count_owned(owner, UTILITY, state) == 2
 
 
 def is_pay_tax_enabled(player: str, state: dict) -> bool:
@@ -297,7 +293,7 @@ def buy_property(player: str, state: dict):
     amount = square[VALUE]
 
     pay_bank(player, state, amount)
-    square[OWNER] = player
+    set_owner(state, position, player)
     state[PHASE] = DOUBLES_CHECK
     return f"{player} buys {square[NAME]} (${amount})"
 
@@ -359,7 +355,7 @@ def draw_chance_card(player: str, state: dict):
 
 
 def _draw_and_execute_card(player: str, state: dict, cards: list, max_idx: int):
-    rand = Random(str(state))
+    rand = state_random(state)
     idx = rand.randint(0, max_idx)
     card = cards[idx]
     position = state[PLAYERS][player][POSITION]
@@ -411,3 +407,5 @@ def advance_to_square(player: str, state: dict, square: int):
 def pay_player(p_from: str, p_to: str, amount: int, state: dict):
     state[PLAYERS][p_from][MONEY] -= amount
     state[PLAYERS][p_to][MONEY] += amount
+    mark_dirty(state, PLAYERS, p_from)
+    mark_dirty(state, PLAYERS, p_to)
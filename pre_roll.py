@@ -1,3 +1,4 @@
+from board_index import *
 from constants import *
 from typing import Callable
 
@@ -74,10 +75,9 @@ def pay_jail_fine(player: str, state: dict):
 def get_unmortgageable_property_idxs(player: str, state: dict) -> list[int]:
     unmortgageable_properties = []
 
-    for i, square in enumerate(state[BOARD]):
-        if (not is_property(square)
-                or square[OWNER] != player
-                or not square[MORTGAGED]):
+    for i in get_owned_property_idxs(player, state):
+        square = state[BOARD][i]
+        if not square[MORTGAGED]:
             continue
 
         mortgage_value = square[VALUE] // 2
@@ -92,17 +92,16 @@ def unmortgage_property(player: str, state: dict, prop_idx: int):
     prop = state[BOARD][prop_idx]
     mortgage_value = prop[VALUE] // 2
     unmortgage_cost = mortgage_value + (mortgage_value // 10)
-    prop[MORTGAGED] = False
+    set_mortgaged(state, prop_idx, False)
     pay_bank(player, state, unmortgage_cost)
     return f"{player} unmortgages {prop[NAME]} for ${unmortgage_cost}"
 
 
 def get_mortgageable_property_idxs(player: str, state: dict) -> list[int]:
     mortgageable_properties = []
-    for i, square in enumerate(state[BOARD]):
-        if (not is_property(square)
-                or square[OWNER] != player
-                or square[MORTGAGED]):
+    for i in get_owned_property_idxs(player, state):
+        square = state[BOARD][i]
+        if square[MORTGAGED]:
             continue
 
         # Cannot mortgage streets where any street from the same set has buildings
@@ -116,12 +115,7 @@ def get_mortgageable_property_idxs(player: str, state: dict) -> list[int]:
 
 def any_street_from_same_set_has_buildings(state: dict, prop_idx: int) -> bool:
     street = state[BOARD][prop_idx]
-    for square in state[BOARD]:
-        if (square[TYPE] == STREET
-                and square[SET] == street[SET]
-                and square[LEVEL] > 0):
-            return True
-    return False
+    return get_set_summary(state, street[SET])[MAX_LEVEL] > 0
 
 
 # Mortgaging property does not change the rent level
@@ -129,7 +123,7 @@ def any_street_from_same_set_has_buildings(state: dict, prop_idx: int) -> bool:
 def mortgage_property(player: str, state: dict, prop_idx: int):
     prop = state[BOARD][prop_idx]
     mortgage_value = prop[VALUE] // 2
-    prop[MORTGAGED] = True
+    set_mortgaged(state, prop_idx, True)
     collect_from_bank(player, state, mortgage_value)
     return f"{player} mortgages {prop[NAME]} for ${mortgage_value}"
 
@@ -137,7 +131,8 @@ def mortgage_property(player: str, state: dict, prop_idx: int):
 def get_upgradeable_street_idxs(player: str, state: dict) -> list[int]:
     upgradeable_streets = []
     money = state[PLAYERS][player][MONEY]
-    for i, square in enumerate(state[BOARD]):
+    for i in get_owned_property_idxs(player, state):
+        square = state[BOARD][i]
         if (square[TYPE] == STREET
                 and not square[MORTGAGED]
                 and square[LEVEL] < 5
@@ -149,27 +144,22 @@ def get_upgradeable_street_idxs(player: str, state: dict) -> list[int]:
 
 
 def all_from_set_are_higher_or_equal_level(state: dict, n_set: int, level: int):
-    for s in state[BOARD]:
-        if (s[TYPE] == STREET
-                and s[SET] == n_set
-                and s[LEVEL] < level):
-            return False
-    return True
+    return get_set_summary(state, n_set)[MIN_LEVEL] >= level
 
 
 def upgrade_street(player: str, state: dict, prop_idx: int):
     prop = state[BOARD][prop_idx]
     house_cost = prop[HOUSE_COST]
-    prop[LEVEL] += 1
+    set_level(state, prop_idx, prop[LEVEL] + 1)
     pay_bank(player, state, house_cost)
     return f"{player} upgrades {prop[NAME]} for ${house_cost} to level {prop[LEVEL]}"
 
 
 def get_downgradeable_street_idxs(player: str, state: dict) -> list[int]:
     downgradeable_streets = []
-    for i, square in enumerate(state[BOARD]):
+    for i in get_owned_property_idxs(player, state):
+        square = state[BOARD][i]
         if (square[TYPE] == STREET
-                and square[OWNER] == player
                 and square[LEVEL] > 0
                 and all_from_set_are_lower_or_equal_level(state, square[SET], square[LEVEL])):
             downgradeable_streets.append(i)
@@ -177,17 +167,12 @@ def get_downgradeable_street_idxs(player: str, state: dict) -> list[int]:
 
 
 def all_from_set_are_lower_or_equal_level(state: dict, n_set: int, level: int):
-    for s in state[BOARD]:
-        if (s[TYPE] == STREET
-                and s[SET] == n_set
-                and s[LEVEL] > level):
-            return False
-    return True
+    return get_set_summary(state, n_set)[MAX_LEVEL] <= level
 
 
 def downgrade_street(player: str, state: dict, prop_idx: int):
     prop = state[BOARD][prop_idx]
     house_cost = prop[HOUSE_COST]
-    prop[LEVEL] -= 1
+    set_level(state, prop_idx, prop[LEVEL] - 1)
     collect_from_bank(player, state, house_cost // 2)
     return f"{player} downgrades {prop[NAME]} for ${house_cost // 2} to level {prop[LEVEL]}"
@@ -0,0 +1,141 @@
+import threading
+
+import git
+
+from odb_commit import read_ref
+
+_workers: dict[str, 'PushWorker'] = {}
+_workers_lock = threading.Lock()
+
+
+def get_push_worker(repo: git.Repo) -> 'PushWorker':
+    """
+    Get the push worker of a repository, starting it on first use. There is one worker per repository.
+    :param repo: git repository
+    :return: push worker
+    """
+    with _workers_lock:
+        worker = _workers.get(repo.git_dir)
+        if worker is None:
+            worker = PushWorker(repo)
+            _workers[repo.git_dir] = worker
+        return worker
+
+
+def stop_push_worker(repo: git.Repo):
+    """
+    Stop the push worker of a repository, if it has one, e.g. once the game has ended and been flushed.
+    A later get_push_worker starts a new one.
+    :param repo: git repository
+    """
+    with _workers_lock:
+        worker = _workers.pop(repo.git_dir, None)
+    if worker is not None:
+        worker.stop()
+
+
+def push_if_origin_exists_and_has_unpushed(repo: git.Repo, tip: str | None = None) -> bool:
+    #  Return True if push was successful or not required, False otherwise.
+    #  tip is the commit to push as main, defaults to the current main branch.
+
+    try:
+        origin = repo.remote("origin")
+    except ValueError:
+        # The repo does not have an origin remote
+        # e.g. case in simulations
+        # just ignore it
+        return True
+    if tip is None:
+        tip = 'main'
+    try:
+        has_unpushed_commits = repo.git.rev_list(f'origin/main..{tip}', count=True) != '0'
+    except git.exc.GitCommandError:
+        # the origin main branch does not yes have any commits
+        has_unpushed_commits = True
+
+    if has_unpushed_commits:
+        try:
+            origin.push(f'{tip}:refs/heads/main').raise_if_error()
+        except Exception as e:
+            # push failed, try again the next time
+            return False
+    return True
+
+
+class PushWorker:
+    """
+    Background thread pushing the main branch of a repository to its origin.
+    Requests made while a push is pending or running are coalesced, since one push of the latest
+    head covers all of them. Failed pushes are retried with exponential backoff.
+    Commits and merges should hold lock, so the worker never reads the branch while they move it.
+    The push itself runs outside the lock, so actions do not wait for the network.
+    """
+
+    def __init__(self, repo: git.Repo, initial_backoff: float = 1.0, max_backoff: float = 60.0):
+        # A repository object of its own, GitPython objects are not safe to share between threads
+        self.repo = git.Repo(repo.git_dir)
+        self.lock = threading.Lock()
+        # Serializes the pushes of the worker thread and of flush
+        self._push_lock = threading.Lock()
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.has_origin = 'origin' in [remote.name for remote in repo.remotes]
+        self._requested = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        if self.has_origin:
+            self._thread = threading.Thread(target=self._run, name=f"push {repo.git_dir}", daemon=True)
+            self._thread.start()
+            # Commits left unpushed by an earlier session (e.g. after a connection loss)
+            self.request()
+
+    def request(self):
+        if self.has_origin:
+            self._requested.set()
+
+    def flush(self) -> bool:
+        """
+        Push in the calling thread, e.g. before the game ends
+        :return: True if the push succeeded or was not required, False otherwise
+        """
+        self._requested.clear()
+        success = self._push()
+        if not success:
+            self._requested.set()
+        return success
+
+    def stop(self):
+        """
+        Stop the worker thread and wait for it to exit. Pending requests are dropped, so flush first
+        if the head must reach the origin.
+        """
+        self._stopped.set()
+        # Wakes the thread if it waits for a request
+        self._requested.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _push(self) -> bool:
+        with self.lock:
+            tip = read_ref(self.repo.git_dir, 'refs/heads/main')
+        if tip is None:
+            return True
+        # Pushes the commit read under the lock, even if the branch has moved on since
+        with self._push_lock:
+            return push_if_origin_exists_and_has_unpushed(self.repo, tip)
+
+    def _run(self):
+        backoff = self.initial_backoff
+        while True:
+            self._requested.wait()
+            self._requested.clear()
+            if self._stopped.is_set():
+                return
+            if self._push():
+                backoff = self.initial_backoff
+                continue
+            # New requests do not cut the backoff short, but stopping does
+            if self._stopped.wait(backoff):
+                return
+            backoff = min(backoff * 2, self.max_backoff)
+            self._requested.set()
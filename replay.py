@@ -0,0 +1,232 @@
+import json
+import os
+import time
+
+import git
+
+from auction import bid
+from constants import *
+from odb_commit import ObjectReader, read_commit_header, read_commit_message, read_ref, read_state_at
+
+# Every action commit ends with one machine-readable record per action, e.g.
+#   Action: {"player": "p1", "label": "Mortgage Boardwalk"}
+# The label is the one of the enabled action (see monopoly.get_enabled_actions). Actions draw their random
+# values from state_random, so the player and the label are enough to replay them, except bids entered by a
+# human, whose amount is recorded as well.
+ACTION_TRAILER = 'Action: '
+BID_LABEL = 'Bid'
+# Last verified commit per ref, in the .git directory
+WATERMARKS_FILE = 'replay-verified'
+
+_verifiers: dict[str, 'ReplayVerifier'] = {}
+
+
+def action_record(player: str, label: str, state: dict) -> dict:
+    """
+    Record of an executed action
+    :param player: player who executed the action
+    :param label: label of the enabled action
+    :param state: state after the action
+    :return: record for format_action_record
+    """
+    record = {'player': player, 'label': label}
+    if label == BID_LABEL:
+        record['amount'] = state[AUCTION][PLAYERS][player][BID]
+    return record
+
+
+def format_action_record(record: dict) -> str:
+    return ACTION_TRAILER + json.dumps(record, sort_keys=True)
+
+
+def with_action_records(message: str, records: list[str]) -> str:
+    """
+    Append formatted action records to a commit message
+    :param message: commit message
+    :param records: records formatted by format_action_record
+    :return: commit message
+    """
+    if not records:
+        return message
+    return f"{message}\n\n" + "\n".join(records)
+
+
+def parse_action_records(message: str) -> list[dict]:
+    return [json.loads(line[len(ACTION_TRAILER):]) for line in message.splitlines() if line.startswith(ACTION_TRAILER)]
+
+
+def replay_actions(state: dict, records: list[dict]) -> dict:
+    """
+    Execute recorded actions on a state
+    :param state: state before the actions, changed in place
+    :param records: action records
+    :return: the state after the actions
+    """
+    # Imported here, because monopoly uses this module to record and verify actions
+    from monopoly import check_invariants, get_enabled_actions, invalidate_enabled_actions
+
+    for record in records:
+        player = record['player']
+        actions = dict(get_enabled_actions(player, state, sim=True))
+        if record['label'] not in actions:
+            raise Exception(f"Action '{record['label']}' of {player} is not enabled")
+        if 'amount' in record:
+            bid(player, state, True, record['amount'])
+        else:
+            actions[record['label']]()
+        invalidate_enabled_actions(state)
+        check_invariants(state)
+    return state
+
+
+class ReplayVerifier:
+    """
+    Checks that every new commit of a branch follows from its parent: the recorded actions are re-executed on
+    the state of the parent and the result must equal the committed state. Merge commits are not replayed, but
+    their state must satisfy the invariants.
+    Verified commits are remembered, and the last verified commit of every ref is stored as a watermark,
+    so every commit is only checked once, also across restarts. Ancestors of a watermark count as verified,
+    and so does the history of the local branch, which holds the player's own commits and the merged ones.
+    Remote histories therefore only cost the commits of the other players.
+    """
+
+    def __init__(self, repo: git.Repo):
+        self.repo = repo
+        self.reader = ObjectReader(os.path.join(repo.git_dir, 'objects'))
+        self.path = os.path.join(repo.git_dir, WATERMARKS_FILE)
+        try:
+            with open(self.path) as f:
+                self.watermarks: dict[str, str] = json.load(f)
+        except FileNotFoundError:
+            # Commits already merged before verification was enabled are accepted as they are
+            head = read_ref(repo.git_dir, 'refs/heads/main')
+            self.watermarks = {'refs/heads/main': head} if head is not None else {}
+        self.verified: set[str] = set()
+        for tip in self.watermarks.values():
+            self._mark_verified(tip)
+        self.n_commits = 0
+        self.n_actions = 0
+        self.seconds = 0.0
+
+    def verify_ref(self, ref: str, tip: str | None = None) -> int:
+        """
+        Verify the commits of a ref that were not verified yet
+        :param ref: full ref name, e.g. refs/remotes/p1/main
+        :param tip: commit to verify up to, defaults to the commit the ref points to
+        :return: number of newly verified commits
+        """
+        if tip is None:
+            tip = read_ref(self.repo.git_dir, ref)
+        if tip is None:
+            return 0
+        start_time = time.perf_counter()
+        local_head = read_ref(self.repo.git_dir, 'refs/heads/main')
+        if local_head is not None:
+            self._mark_verified(local_head)
+        new_commits = self._unverified_ancestors(tip)
+        for hexsha in new_commits:
+            self._verify_commit(hexsha)
+            self.verified.add(hexsha)
+        if self.watermarks.get(ref) != tip:
+            self.watermarks[ref] = tip
+            with open(f"{self.path}.lock", 'w') as f:
+                json.dump(self.watermarks, f)
+            os.replace(f"{self.path}.lock", self.path)
+        self.seconds += time.perf_counter() - start_time
+        return len(new_commits)
+
+    def _mark_verified(self, tip: str):
+        # Only visits the commits that are not known to be verified yet
+        stack = [tip]
+        while stack:
+            hexsha = stack.pop()
+            if hexsha in self.verified:
+                continue
+            self.verified.add(hexsha)
+            stack.extend(read_commit_header(self.reader, hexsha)[1])
+
+    def _unverified_ancestors(self, tip: str) -> list[str]:
+        # Parents before children, so every commit is checked after the commits it builds on
+        ordered = []
+        seen = set()
+        stack = [(tip, False)]
+        while stack:
+            hexsha, parents_done = stack.pop()
+            if parents_done:
+                ordered.append(hexsha)
+                continue
+            if hexsha in seen or hexsha in self.verified:
+                continue
+            seen.add(hexsha)
+            stack.append((hexsha, True))
+            stack.extend((parent, False) for parent in read_commit_header(self.reader, hexsha)[1])
+        return ordered
+
+    def _verify_commit(self, hexsha: str):
+        _, parents = read_commit_header(self.reader, hexsha)
+        if not parents:
+            # The initial state is agreed on when the game is created
+            return
+        from monopoly import check_invariants
+
+        committed = read_state_at(self.reader, hexsha)
+        self.n_commits += 1
+        if len(parents) > 1:
+            check_invariants(committed)
+            return
+        records = parse_action_records(read_commit_message(self.reader, hexsha))
+        if not records:
+            raise Exception(f"Commit {hexsha} has no action record")
+        try:
+            replayed = public_state(replay_actions(read_state_at(self.reader, parents[0]), records))
+        except Exception as e:
+            raise Exception(f"Replay of commit {hexsha} failed: {e}") from e
+        if replayed != committed:
+            raise Exception(f"Commit {hexsha} does not follow from its parent by its recorded actions")
+        self.n_actions += len(records)
+
+    def summary(self) -> dict:
+        return {
+            'commits': self.n_commits,
+            'actions': self.n_actions,
+            'seconds': self.seconds,
+            'commits_per_second': self.n_commits / self.seconds if self.seconds else 0
+        }
+
+    def print_summary(self):
+        s = self.summary()
+        print(f"Verified {s['commits']} commits ({s['actions']} actions) in {s['seconds']:.2f}s, "
+              f"{s['commits_per_second']:.0f} commits/s")
+
+
+def enable_replay_verification(repo: git.Repo) -> ReplayVerifier:
+    """
+    Verify the commits of other players before they are merged into the repository (see merge_from_remotes)
+    :param repo: player repository
+    :return: the verifier of the repository
+    """
+    verifier = _verifiers.get(repo.git_dir)
+    if verifier is None:
+        verifier = _verifiers[repo.git_dir] = ReplayVerifier(repo)
+    return verifier
+
+
+def get_replay_verifier(repo: git.Repo) -> ReplayVerifier | None:
+    return _verifiers.get(repo.git_dir)
+
+
+def verify_remote_commits(repo: git.Repo, remote_name: str, tip: str | None = None):
+    """
+    Replay the new commits of another player before merging them, if verification is enabled for the repository
+    :param repo: player repository
+    :param remote_name: name of the other player's remote
+    :param tip: commit to verify, defaults to the fetched main branch of the remote
+    """
+    verifier = get_replay_verifier(repo)
+    if verifier is None:
+        return
+    try:
+        verifier.verify_ref(f'refs/remotes/{remote_name}/main', tip)
+    except Exception as e:
+        print(f"Rejected commits from {remote_name} in repo {repo.working_tree_dir}")
+        raise e
@@ -1,3 +1,4 @@
+import copy
 from os import mkdir
 
 import git
@@ -5,6 +6,10 @@ import yaml
 from git import Repo, Commit
 
 from constants import *
+from game_metadata import write_game_metadata_for_state
+from rules import rules_file_reader, write_rules_file
+from shared_store import SHARED_OBJECTS, use_shared_object_store
+from state_codec import DEFAULT_CODEC, decode_state, encode_state, read_header
 
 
 def init_repo(path: str, name: str) -> tuple[Repo, Commit]:
@@ -76,7 +81,17 @@ def init_auction_repo(path: str, name: str, players: list[str], initial_money: l
     print(f"Auction Repository {name} created\n with initial commit: {initial_commit}")
     return repo, initial_commit
 
-def init_monopoly_simulation_repos(path: str, name: str, players: list[str]) -> tuple[list[Repo], Commit]:
+def init_monopoly_simulation_repos(path: str, name: str, players: list[str], codec: str = DEFAULT_CODEC,
+                                   shared_objects: bool = False) -> tuple[list[Repo], Commit]:
+    """
+    Initialize one repository per player in a new game directory, with the other players as remotes
+    :param path: directory to create the game directory in
+    :param name: game name
+    :param players: player names, the first one creates the initial commit
+    :param codec: state codec
+    :param shared_objects: let the repositories share one object store in the game directory (see shared_store)
+    :return: the player repositories and the initial commit
+    """
     if os.path.exists(f'{path}/{name}'):
         raise FileExistsError(f'Directory {name} already exists')
     else:
@@ -88,8 +103,6 @@ def init_monopoly_simulation_repos(path: str, name: str, players: list[str]) ->
     for player in players:
         mkdir(f"{path}/{name}/{player}")
         repo = git.Repo.init(f"{path}/{name}/{player}", initial_branch='main')
-        with open(f"{path}/{name}/{player}/.git/.name", 'w') as f:
-            f.write(player)
 
         others = [other for other in players if other != player]
         for other in others:
@@ -97,10 +110,36 @@ def init_monopoly_simulation_repos(path: str, name: str, players: list[str]) ->
 
         repos.append(repo)
 
+    if shared_objects:
+        shared_dir = f"{path}/{name}/{SHARED_OBJECTS}"
+        mkdir(shared_dir)
+        for player, repo in zip(players, repos):
+            others = [f"{path}/{name}/{other}" for other in players if other != player]
+            use_shared_object_store(repo, shared_dir, others)
+
     initiating_repo = repos[0]
+    init_state = init_monopoly_state(players)
+
+    state_file_path = f"{initiating_repo.working_tree_dir}/state.yml"
+    with open(state_file_path, 'wb') as f:
+        f.write(encode_state(init_state, codec))
+
+    initiating_repo.index.add([state_file_path, write_rules_file(initiating_repo.working_tree_dir, init_state)])
+    initial_commit = initiating_repo.index.commit(f"initial commit {name}")
+    for player, repo in zip(players, repos):
+        write_game_metadata_for_state(repo, player, initial_commit.hexsha, init_state, codec)
+    return repos, initial_commit
+
+
+def init_monopoly_state(players: list[str]) -> dict:
+    """
+    Create the initial game state for the given players
+    :param players: names of the players in turn order
+    :return: state dictionary with its own copies of the board and the card decks
+    """
     init_state = {
         ACTIVE: 0,
-        ORDER: players,
+        ORDER: list(players),
         PHASE: PRE_ROLL,
         FREE_4_ALL_ORDER: None,
         GOOJF_CH_OWNER: None,
@@ -110,9 +149,9 @@ def init_monopoly_simulation_repos(path: str, name: str, players: list[str]) ->
         DEBT: None,
         AUCTION: None,
         PLAYERS: {},
-        BOARD: INIT_BOARD,
-        COMMUNITY_CHEST: CC_CARDS,
-        CHANCE: CH_CARDS
+        BOARD: copy.deepcopy(INIT_BOARD),
+        COMMUNITY_CHEST: copy.deepcopy(CC_CARDS),
+        CHANCE: copy.deepcopy(CH_CARDS)
     }
 
     for player in players:
@@ -124,14 +163,7 @@ def init_monopoly_simulation_repos(path: str, name: str, players: list[str]) ->
             POSITION: 0,
             CONSECUTIVE_DOUBLES: 0
         }
-
-    state_file_path = f"{initiating_repo.working_tree_dir}/state.yml"
-    with open(state_file_path, 'w') as f:
-        yaml.dump(init_state, f)
-
-    initiating_repo.index.add(state_file_path)
-    initial_commit = initiating_repo.index.commit(f"initial commit {name}")
-    return repos, initial_commit
+    return init_state
 
 
 def init_monopoly_repo(player_url: str, player_name:str, players: list[dict[str, str]]) -> Repo:
@@ -140,44 +172,16 @@ def init_monopoly_repo(player_url: str, player_name:str, players: list[dict[str,
     to_path = f"./monopoly_{player_name}"
     repo = Repo.clone_from(player_url, to_path)
 
-    init_state = {
-        ACTIVE: 0,
-        ORDER: [p[NAME] for p in players],
-        PHASE: PRE_ROLL,
-        FREE_4_ALL_ORDER: None,
-        GOOJF_CH_OWNER: None,
-        GOOJF_CC_OWNER: None,
-        BANK_MONEY: TOTAL_MONEY - len(players) * STARTING_MONEY,
-        WINNER: None,
-        DEBT: None,
-        AUCTION: None,
-        PLAYERS: {},
-        BOARD: INIT_BOARD,
-        COMMUNITY_CHEST: CC_CARDS,
-        CHANCE: CH_CARDS
-    }
-
+    init_state = init_monopoly_state([p[NAME] for p in players])
     for player in players:
-        name = player[NAME]
-        url = player[URL]
-        init_state[PLAYERS][name] = {
-            URL: url,
-            MONEY: STARTING_MONEY,
-            BANKRUPT: False,
-            IN_JAIL: False,
-            JAIL_TIME: 0,
-            POSITION: 0,
-            CONSECUTIVE_DOUBLES: 0
-        }
-
-    with open(f"{repo.working_dir}/.git/.name", 'w') as f:
-        f.write(player_name)
+        init_state[PLAYERS][player[NAME]][URL] = player[URL]
 
-    with open(f"{repo.working_dir}/state.yml", 'w') as f:
-        yaml.dump(init_state, f)
+    with open(f"{repo.working_dir}/state.yml", 'wb') as f:
+        f.write(encode_state(init_state))
 
-    repo.index.add(f"{repo.working_dir}/state.yml")
-    repo.index.commit(f"initial commit monopoly")
+    repo.index.add([f"{repo.working_dir}/state.yml", write_rules_file(repo.working_dir, init_state)])
+    initial_commit = repo.index.commit(f"initial commit monopoly")
+    write_game_metadata_for_state(repo, player_name, initial_commit.hexsha, init_state, DEFAULT_CODEC)
 
     others = [player for player in players if player['name'] != player_name]
     for other in others:
@@ -194,8 +198,6 @@ def init_monopoly_repo(player_url: str, player_name:str, players: list[dict[str,
 def join_new_game(player_url: str, player_name: str, initiator_url: str):
     to_path = f"./monopoly_{player_name}"
     repo = Repo.clone_from(player_url, to_path)
-    with open(f"{repo.working_dir}/.git/.name", 'w') as f:
-        f.write(player_name)
 
     init_remote = repo.create_remote('initiator', initiator_url)
 
@@ -209,13 +211,17 @@ def join_new_game(player_url: str, player_name: str, initiator_url: str):
 
     repo.delete_remote(init_remote)
 
-    with open(f"{repo.working_dir}/state.yml", 'r') as f:
-        state = yaml.safe_load(f)
-        players: dict = state[PLAYERS]
-        for name, p_state in players.items():
-            if name == player_name:
-                continue
-            repo.create_remote(name, p_state[URL])
+    with open(f"{repo.working_dir}/state.yml", 'rb') as f:
+        data = f.read()
+    state = decode_state(data, rules_file_reader(repo.working_dir))
+    # The history is only as long as the initiator's at this point, usually just the initial commit
+    initial_commit = next(repo.iter_commits(rev='HEAD', reverse=True))
+    write_game_metadata_for_state(repo, player_name, initial_commit.hexsha, state, read_header(data)[0])
+    players: dict = state[PLAYERS]
+    for name, p_state in players.items():
+        if name == player_name:
+            continue
+        repo.create_remote(name, p_state[URL])
 
     print(f"Joined successfully")
     return repo
@@ -228,3 +234,30 @@ def rejoin_game(path: str) -> Repo:
     return Repo(path)
 
 
+def write_history_repo(path: str, name: str, history: list[tuple[str, dict]],
+                       codec: str = DEFAULT_CODEC) -> tuple[Repo, Commit]:
+    """
+    Write the states of an in-memory game as a linear git history, one commit per state
+    :param path: directory to create the repository in
+    :param name: repository name
+    :param history: (commit message, state) pairs, starting with the initial state
+    :param codec: state codec
+    :return: the repository and its initial commit
+    """
+    if os.path.exists(f'{path}/{name}'):
+        raise FileExistsError(f'Repo {name} already exists')
+
+    assert not len(history) == 0, "History cannot be empty"
+
+    repo = git.Repo.init(f"{path}/{name}", initial_branch='main')
+    state_file_path = f"{repo.working_tree_dir}/state.yml"
+    initial_commit = None
+    repo.index.add(write_rules_file(repo.working_tree_dir, history[0][1]))
+    for message, state in history:
+        with open(state_file_path, 'wb') as f:
+            f.write(encode_state(state, codec))
+        repo.index.add(state_file_path)
+        commit = repo.index.commit(message)
+        if initial_commit is None:
+            initial_commit = commit
+    return repo, initial_commit
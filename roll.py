@@ -1,5 +1,4 @@
 from collections.abc import Callable
-from random import Random
 
 from constants import *
 
@@ -20,7 +19,7 @@ def is_roll_and_move_enabled(player: str, state: dict) -> bool:
 
 
 def roll_and_move(player: str, state: dict):
-    rand = Random(str(state))
+    rand = state_random(state)
     d1 = rand.randint(1, 6)
     d2 = rand.randint(1, 6)
 
@@ -45,7 +44,7 @@ def is_roll_in_jail_enabled(player: str, state: dict) -> bool:
 
 
 def roll_in_jail(player: str, state: dict):
-    rand = Random(str(state))
+    rand = state_random(state)
     d1 = rand.randint(1, 6)
     d2 = rand.randint(1, 6)
 
@@ -65,6 +64,7 @@ def roll_in_jail(player: str, state: dict):
         state[PLAYERS][player][JAIL_TIME] = 0
         if state[PLAYERS][player][MONEY] >= 50:
             pay_bank(player, state, 50)
+            state[PHASE] = POST_ROLL
             new_position = state[PLAYERS][player][POSITION]
             return f"{player} rolls {d1}, {d2} in jail, missed doubles 3x, pays $50 to get out of jail, moves to {state[BOARD][new_position][NAME]}"
         else:
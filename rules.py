@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+from typing import Callable
+
+from constants import *
+
+# The static rules of a game (the square data of the board without owners, levels and mortgages, and the card
+# decks) never change during a game. Encoded states therefore only hold the dynamic fields and the hash of
+# their rules, and decoding joins them with the rules again (see state_codec). Rules are identified by the
+# hash of their canonical JSON encoding, which every game repository also holds as RULES_FILE.
+RULES = 'rules'
+RULES_FILE = 'rules.json'
+DYNAMIC_SQUARE_KEYS = (OWNER, LEVEL, MORTGAGED)
+
+_rules_by_hash: dict[str, dict] = {}
+
+
+def make_rules(board: list[dict], community_chest: list[dict], chance: list[dict]) -> dict:
+    return {
+        BOARD: [{k: v for k, v in square.items() if k not in DYNAMIC_SQUARE_KEYS} for square in board],
+        COMMUNITY_CHEST: community_chest,
+        CHANCE: chance
+    }
+
+
+def encode_rules(rules: dict) -> bytes:
+    return json.dumps(rules, sort_keys=True, separators=(',', ':')).encode()
+
+
+def register_rules(rules: dict) -> str:
+    """
+    Make rules known to the decoder
+    :param rules: rules (see make_rules)
+    :return: hash of the rules
+    """
+    rules_hash = hashlib.sha256(encode_rules(rules)).hexdigest()[:16]
+    _rules_by_hash.setdefault(rules_hash, rules)
+    return rules_hash
+
+
+def load_rules_file(path: str) -> str:
+    """
+    Register the rules of a rules file, e.g. of a game created with other rules than the default ones
+    :param path: path of the rules file
+    :return: hash of the rules
+    """
+    with open(path, 'rb') as f:
+        return register_rules(json.loads(f.read()))
+
+
+def rules_file_reader(directory: str) -> Callable[[], bytes]:
+    """
+    Reader of the rules file of a working tree, for decode_state
+    :param directory: working tree of a game repository
+    :return: function returning the encoded rules
+    """
+    def read() -> bytes:
+        with open(os.path.join(directory, RULES_FILE), 'rb') as f:
+            return f.read()
+
+    return read
+
+
+def write_rules_file(directory: str, state: dict) -> str:
+    """
+    Write the rules of a state to the rules file of a game repository
+    :param directory: working tree of the repository
+    :param state: state dictionary
+    :return: path of the rules file
+    """
+    path = os.path.join(directory, RULES_FILE)
+    with open(path, 'wb') as f:
+        f.write(encode_rules(get_rules(find_rules(state))))
+    return path
+
+
+def has_rules_hash(rules_hash: str) -> bool:
+    return rules_hash in _rules_by_hash
+
+
+def get_rules(rules_hash: str) -> dict:
+    rules = _rules_by_hash.get(rules_hash)
+    if rules is None:
+        raise KeyError(f"Unknown rules {rules_hash}, load the rules file of the game first (see load_rules_file)")
+    return rules
+
+
+DEFAULT_RULES = make_rules(INIT_BOARD, CC_CARDS, CH_CARDS)
+DEFAULT_RULES_HASH = register_rules(DEFAULT_RULES)
+
+
+def find_rules(state: dict) -> str:
+    """
+    Find the rules of a state, registering them if they are new
+    :param state: state dictionary
+    :return: hash of the rules
+    """
+    # Comparing with the known rules is much cheaper than hashing the rules of the state
+    for rules_hash, rules in _rules_by_hash.items():
+        if _has_rules(state, rules):
+            return rules_hash
+    return register_rules(make_rules(state[BOARD], state[COMMUNITY_CHEST], state[CHANCE]))
+
+
+def _has_rules(state: dict, rules: dict) -> bool:
+    if state[COMMUNITY_CHEST] != rules[COMMUNITY_CHEST] or state[CHANCE] != rules[CHANCE]:
+        return False
+    if len(state[BOARD]) != len(rules[BOARD]):
+        return False
+    for square, static in zip(state[BOARD], rules[BOARD]):
+        if len(square) - sum(k in square for k in DYNAMIC_SQUARE_KEYS) != len(static):
+            return False
+        for k, v in static.items():
+            if square.get(k) != v:
+                return False
+    return True
+
+
+def split_state(state: dict) -> dict:
+    """
+    Dynamic part of a state: the board only keeps the dynamic fields of its squares and the card decks are
+    replaced by the hash of the rules. The state must be public (see public_state).
+    :param state: state dictionary
+    :return: new dictionary sharing the unchanged values with the state
+    """
+    rules_hash = find_rules(state)
+    dynamic = {k: v for k, v in state.items() if k not in (BOARD, COMMUNITY_CHEST, CHANCE)}
+    dynamic[BOARD] = [{k: square[k] for k in DYNAMIC_SQUARE_KEYS if k in square} for square in state[BOARD]]
+    dynamic[RULES] = rules_hash
+    return dynamic
+
+
+def join_state(dynamic: dict) -> dict:
+    """
+    Join the dynamic part of a state with its rules
+    :param dynamic: dynamic part of a state (see split_state), changed in place
+    :return: the full state
+    """
+    rules = get_rules(dynamic.pop(RULES))
+    # Squares are new dicts, their static values (e.g. rent tables) are shared, as nothing changes them
+    dynamic[BOARD] = [{**static, **square} for static, square in zip(rules[BOARD], dynamic[BOARD])]
+    dynamic[COMMUNITY_CHEST] = rules[COMMUNITY_CHEST]
+    dynamic[CHANCE] = rules[CHANCE]
+    return dynamic
@@ -0,0 +1,87 @@
+import os
+
+import git
+
+from odb_commit import OdbCommitter, read_ref, write_ref
+from replay import verify_remote_commits
+
+# Object store shared by the player repositories of a simulation, next to them in the game directory
+SHARED_OBJECTS = 'objects'
+
+# Player remotes do not change during a game, so their directories are resolved once per repository
+_remote_dirs: dict[str, list[tuple[str, str]]] = {}
+
+
+def get_shared_object_dir(repo: git.Repo) -> str | None:
+    """
+    Get the shared object store of a simulation repository
+    :param repo: player repository
+    :return: path of the shared objects directory, None if the repository does not use one
+    """
+    try:
+        with open(os.path.join(repo.git_dir, 'objects', 'info', 'alternates')) as f:
+            alternates = [line.strip() for line in f]
+    except FileNotFoundError:
+        return None
+    # The shared store is always the first alternate
+    return alternates[0] if alternates else None
+
+
+def use_shared_object_store(repo: git.Repo, shared_dir: str, other_repo_dirs: list[str]):
+    """
+    Let a player repository read the shared object store and the objects of the other players through alternates,
+    so that no object ever has to be fetched or stored twice
+    :param repo: player repository
+    :param shared_dir: shared objects directory
+    :param other_repo_dirs: working tree directories of the other players
+    """
+    alternates = [os.path.abspath(shared_dir)]
+    alternates += [os.path.abspath(os.path.join(d, '.git', 'objects')) for d in other_repo_dirs]
+    with open(os.path.join(repo.git_dir, 'objects', 'info', 'alternates'), 'w') as f:
+        f.writelines(f"{path}\n" for path in alternates)
+    # Objects of a repository may only be reachable from the refs of another one, which gc cannot see
+    with repo.config_writer() as config:
+        config.set_value('gc', 'auto', 0)
+
+
+def merge_from_shared_store(repo: git.Repo, committer: OdbCommitter):
+    """
+    Merge the main branches of the other players, reading their refs directly instead of fetching.
+    Branches that are already merged are skipped and fast-forwards only move the ref.
+    Only diverged branches are merged by git.
+    :param repo: player repository using a shared object store
+    :param committer: committer of the repository
+    """
+    committer.flush()
+    for name, remote_git_dir in _get_remote_git_dirs(repo):
+        tip = read_ref(remote_git_dir, 'refs/heads/main')
+        if tip is None or committer.contains(tip):
+            continue
+        verify_remote_commits(repo, name, tip)
+
+        if committer.can_fast_forward(tip):
+            committer.fast_forward(tip)
+            continue
+
+        if committer.snapshot_interval:
+            # Git cannot merge delta commits
+            committer.merge(tip, f'{name}/main')
+            continue
+
+        # Git needs the tip as a remote tracking branch, its objects are already readable
+        write_ref(repo.git_dir, f'refs/remotes/{name}/main', tip)
+        committer.sync_working_tree()
+        try:
+            repo.git.merge(f'{name}/main')
+        except git.CommandError as e:
+            print(f"Failed to merge from {name} in repo {repo.working_tree_dir}")
+            raise e
+        committer.mark_synced()
+
+
+def _get_remote_git_dirs(repo: git.Repo) -> list[tuple[str, str]]:
+    if repo.git_dir not in _remote_dirs:
+        # Skip the origin remote, as it is not a player remote.
+        _remote_dirs[repo.git_dir] = [(remote.name, os.path.join(repo.working_tree_dir, remote.url, '.git'))
+                                      for remote in repo.remotes if remote.name != 'origin']
+    return _remote_dirs[repo.git_dir]
@@ -0,0 +1,207 @@
+import json
+from typing import Callable
+
+import yaml
+
+from constants import *
+from rules import RULES, has_rules_hash, join_state, register_rules, split_state
+
+# Every encoded state starts with a header naming the codec and the format version,
+# so a state can be decoded no matter which codec wrote it.
+# Text codecs use a comment line, which keeps YAML states readable by plain YAML parsers.
+# States without a header are legacy YAML states.
+# Since version 2, states hold only their dynamic fields and the hash of their static rules (see rules).
+FORMAT_VERSION = 2
+TEXT_HEADER = b'#!monopoly-state'
+BINARY_MAGIC = b'\x00MNP'
+
+YAML_CODEC = 'yaml'
+JSON_CODEC = 'json'
+BINARY_CODEC = 'binary'
+DEFAULT_CODEC = YAML_CODEC
+# Git merges states line by line, which does not work for binary states
+GIT_MERGEABLE_CODECS = [YAML_CODEC, JSON_CODEC]
+
+# LibYAML is an optional C extension of PyYAML
+_YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+_YamlDumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
+
+def check_git_mergeable(codec: str):
+    """
+    Reject a codec for states that git has to merge
+    :param codec: state codec
+    """
+    if codec not in GIT_MERGEABLE_CODECS:
+        raise ValueError(f"Git cannot merge {codec} states, use {' or '.join(GIT_MERGEABLE_CODECS)} "
+                         f"or delta commits (see OdbCommitter), which are merged in-process")
+
+
+def encode_state(state: dict, codec: str = DEFAULT_CODEC) -> bytes:
+    """
+    Encode the dynamic public part of a state with the given codec
+    :param state: state dictionary
+    :param codec: YAML_CODEC or JSON_CODEC (both line based, so git can merge them; JSON is much faster)
+     or BINARY_CODEC (smallest, for states that are never merged by git)
+    :return: encoded state including the format header
+    """
+    state = split_state(public_state(state))
+    if codec == YAML_CODEC:
+        payload = yaml.dump(state, Dumper=_YamlDumper).encode()
+    elif codec == JSON_CODEC:
+        # One value per line without indentation: still compact, but git can merge concurrent auction actions
+        payload = json.dumps(state, indent=0, separators=(',', ':'), sort_keys=True).encode()
+    elif codec == BINARY_CODEC:
+        out = bytearray(BINARY_MAGIC)
+        out.append(FORMAT_VERSION)
+        _encode_binary(state, out, {})
+        return bytes(out)
+    else:
+        raise ValueError(f"Unknown codec: {codec}")
+    return b'%s codec=%s version=%d\n%s' % (TEXT_HEADER, codec.encode(), FORMAT_VERSION, payload)
+
+
+def decode_state(data: bytes, read_rules: Callable[[], bytes] | None = None) -> dict:
+    """
+    Decode a state written by any codec of any supported format version
+    :param data: encoded state
+    :param read_rules: returns the rules file of the game (see rules.RULES_FILE), only called if the rules
+     of the state are not known yet, e.g. because they differ from the built-in ones
+    :return: state dictionary, joined with its rules
+    """
+    codec, version, payload = read_header(data)
+    if version > FORMAT_VERSION:
+        raise ValueError(f"State format version {version} is newer than the supported version {FORMAT_VERSION}")
+    if codec == YAML_CODEC:
+        state = yaml.load(payload, Loader=_YamlLoader)
+    elif codec == JSON_CODEC:
+        state = json.loads(payload)
+    elif codec == BINARY_CODEC:
+        state, _ = _decode_binary(payload, 0, [])
+    else:
+        raise ValueError(f"Unknown codec: {codec}")
+    if RULES not in state:
+        return state
+    if read_rules is not None and not has_rules_hash(state[RULES]):
+        register_rules(json.loads(read_rules()))
+    return join_state(state)
+
+
+def read_header(data: bytes) -> tuple[str, int, bytes]:
+    """
+    Split an encoded state into its codec, format version and payload
+    :param data: encoded state
+    :return: codec, version, payload
+    """
+    if data.startswith(BINARY_MAGIC):
+        return BINARY_CODEC, data[len(BINARY_MAGIC)], data[len(BINARY_MAGIC) + 1:]
+    if data.startswith(TEXT_HEADER):
+        header, _, payload = data.partition(b'\n')
+        fields = dict(field.split(b'=', 1) for field in header.split()[1:])
+        return fields[b'codec'].decode(), int(fields[b'version']), payload
+    return YAML_CODEC, 0, data
+
+
+# Binary format: every value starts with a one byte tag.
+# Integers are zigzag varints, strings are a varint length followed by UTF-8,
+# lists and dicts are a varint length followed by their items (dicts: key, value, key, value, ...).
+# Repeated strings (keys, player names, square types) refer back to their first occurrence by number.
+_NONE = 0
+_FALSE = 1
+_TRUE = 2
+_INT = 3
+_STR = 4
+_LIST = 5
+_DICT = 6
+_STR_REF = 7
+
+
+def _encode_binary(value, out: bytearray, strings: dict[str, int]):
+    if value is None:
+        out.append(_NONE)
+    elif value is True:
+        out.append(_TRUE)
+    elif value is False:
+        out.append(_FALSE)
+    elif isinstance(value, int):
+        out.append(_INT)
+        _encode_varint(value << 1 if value >= 0 else ((-value - 1) << 1) | 1, out)
+    elif isinstance(value, str):
+        if value in strings:
+            out.append(_STR_REF)
+            _encode_varint(strings[value], out)
+            return
+        strings[value] = len(strings)
+        encoded = value.encode()
+        out.append(_STR)
+        _encode_varint(len(encoded), out)
+        out += encoded
+    elif isinstance(value, list):
+        out.append(_LIST)
+        _encode_varint(len(value), out)
+        for item in value:
+            _encode_binary(item, out, strings)
+    elif isinstance(value, dict):
+        out.append(_DICT)
+        _encode_varint(len(value), out)
+        # Sorted like the other codecs, so equal states have equal encodings
+        for k, v in sorted(value.items()):
+            _encode_binary(k, out, strings)
+            _encode_binary(v, out, strings)
+    else:
+        raise TypeError(f"Cannot encode {type(value).__name__} in the binary state format")
+
+
+def _encode_varint(n: int, out: bytearray):
+    while n > 0x7f:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _decode_varint(data: bytes, pos: int) -> tuple[int, int]:
+    n = 0
+    shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        n |= (b & 0x7f) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+
+def _decode_binary(data: bytes, pos: int, strings: list[str]) -> tuple[object, int]:
+    tag = data[pos]
+    pos += 1
+    if tag == _NONE:
+        return None, pos
+    if tag == _TRUE:
+        return True, pos
+    if tag == _FALSE:
+        return False, pos
+    if tag == _INT:
+        n, pos = _decode_varint(data, pos)
+        return (n >> 1) ^ -(n & 1), pos
+    if tag == _STR_REF:
+        n, pos = _decode_varint(data, pos)
+        return strings[n], pos
+    if tag == _STR:
+        length, pos = _decode_varint(data, pos)
+        strings.append(data[pos:pos + length].decode())
+        return strings[-1], pos + length
+    if tag == _LIST:
+        length, pos = _decode_varint(data, pos)
+        items = []
+        for _ in range(length):
+            item, pos = _decode_binary(data, pos, strings)
+            items.append(item)
+        return items, pos
+    if tag == _DICT:
+        length, pos = _decode_varint(data, pos)
+        d = {}
+        for _ in range(length):
+            k, pos = _decode_binary(data, pos, strings)
+            d[k], pos = _decode_binary(data, pos, strings)
+        return d, pos
+    raise ValueError(f"Unknown tag {tag} in binary state at position {pos - 1}")
@@ -0,0 +1,248 @@
+import argparse
+import json
+import struct
+import zlib
+from random import Random
+from typing import Callable
+
+import git
+
+from constants import *
+from monopoly import simulate_monopoly_in_memory
+from odb_commit import ObjectReader, read_state_at
+from repo_util import init_monopoly_state
+from state_codec import JSON_CODEC, decode_state, encode_state
+
+# A corpus file holds sampled game states for benchmarks and fuzzing, readable without git:
+#   MAGIC, the index, the compression dictionary, then the states, each section after its length
+#   as an unsigned 64-bit integer. The index is JSON.
+# Every state is JSON encoded (see state_codec) and zlib compressed on its own, so one state can be read
+# without decompressing the others. The dictionary is an encoded initial state, which holds the keys and
+# values every state repeats, and makes the compressed states several times smaller.
+# The index lists offset, length, phase, player count and action number of every state, and the state ids
+# by phase and player count, sorted by action number.
+# States are deduplicated by state_digest.
+MAGIC = b'MNPCORP1'
+_LENGTH = struct.Struct('<Q')
+
+
+class CorpusRecorder:
+    """
+    Samples states by phase, player count and game progress. Every (phase, player count, progress bucket)
+    keeps at most per_bucket states, chosen uniformly from all states offered to it (reservoir sampling),
+    so long games do not crowd out rare phases.
+    """
+
+    def __init__(self, per_bucket: int = 20, progress_bucket: int = 100, seed: int = 0):
+        """
+        :param per_bucket: states kept per bucket
+        :param progress_bucket: number of actions per progress bucket
+        :param seed: seed of the sampling
+        """
+        self.per_bucket = per_bucket
+        self.progress_bucket = progress_bucket
+        self.rand = Random(seed)
+        self.buckets: dict[tuple[str, int, int], list[tuple[bytes, int, bytes]]] = {}
+        self.offered: dict[tuple[str, int, int], int] = {}
+        self.digests: set[bytes] = set()
+
+    def offer(self, action: int, state: dict):
+        """
+        Offer a state for sampling. The state is only encoded if it is kept.
+        :param action: number of actions since the start of the game
+        :param state: state dictionary
+        """
+        digest = state_digest(state)
+        if digest in self.digests:
+            return
+        key = (state[PHASE], len(state[ORDER]), action // self.progress_bucket)
+        n = self.offered[key] = self.offered.get(key, 0) + 1
+        bucket = self.buckets.setdefault(key, [])
+        if len(bucket) < self.per_bucket:
+            bucket.append((digest, action, encode_state(state, JSON_CODEC)))
+            self.digests.add(digest)
+            return
+        slot = self.rand.randrange(n)
+        if slot < self.per_bucket:
+            self.digests.discard(bucket[slot][0])
+            bucket[slot] = (digest, action, encode_state(state, JSON_CODEC))
+            self.digests.add(digest)
+
+    def observer(self) -> Callable[[str, dict], None]:
+        """
+        Observer for simulate_monopoly_in_memory that offers every state of one game
+        """
+        action = 0
+
+        def observe(_: str, state: dict):
+            nonlocal action
+            action += 1
+            self.offer(action, state)
+
+        return observe
+
+    def record_games(self, n_games: int, n_players: int = N_PLAYERS, seed: str = 'corpus'):
+        """
+        Sample the states of in-memory games
+        :param n_games: number of games
+        :param n_players: number of players
+        :param seed: prefix of the game seeds
+        """
+        for i in range(n_games):
+            simulate_monopoly_in_memory([f'c{i}_p{j}' for j in range(n_players)], f'{seed}_{i}',
+                                        observer=self.observer())
+
+    def record_repo(self, path: str, rev: str = 'HEAD'):
+        """
+        Sample the states of the history of a game repository, following first parents
+        :param path: repository path
+        :param rev: revision whose history to read
+        """
+        repo = git.Repo(path)
+        # Reads delta commits as well (see odb_commit.read_state_at)
+        reader = ObjectReader(os.path.join(repo.git_dir, 'objects'))
+        for action, commit in enumerate(repo.iter_commits(rev, first_parent=True, reverse=True)):
+            try:
+                state = read_state_at(reader, commit.hexsha)
+            except FileNotFoundError:
+                continue
+            self.offer(action, state)
+
+    def samples(self) -> list[tuple[int, dict]]:
+        """
+        Decode the sampled states, in the order write stores them
+        :return: (action number, state) of every sampled state
+        """
+        return [(action, decode_state(data))
+                for _, bucket in sorted(self.buckets.items())
+                for _, action, data in sorted(bucket, key=lambda item: item[1])]
+
+    def write(self, path: str) -> int:
+        """
+        Write the sampled states to a corpus file
+        :param path: file path
+        :return: number of states written
+        """
+        entries = []
+        blobs = []
+        offset = 0
+        zdict = encode_state(init_monopoly_state([f'p{i}' for i in range(N_PLAYERS)]), JSON_CODEC)
+        for (phase, n_players, _), bucket in sorted(self.buckets.items()):
+            for _, action, data in sorted(bucket, key=lambda item: item[1]):
+                compressor = zlib.compressobj(9, zdict=zdict)
+                blob = compressor.compress(data) + compressor.flush()
+                entries.append({'offset': offset, 'length': len(blob), 'phase': phase, 'players': n_players,
+                                'action': action})
+                blobs.append(blob)
+                offset += len(blob)
+
+        by_category: dict[str, dict[str, list[int]]] = {}
+        for i, entry in enumerate(entries):
+            by_category.setdefault(entry['phase'], {}).setdefault(str(entry['players']), []).append(i)
+        for phase in by_category.values():
+            for ids in phase.values():
+                ids.sort(key=lambda i: entries[i]['action'])
+
+        index = json.dumps({'entries': entries, 'by_category': by_category}, separators=(',', ':')).encode()
+        with open(path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(_LENGTH.pack(len(index)))
+            f.write(index)
+            f.write(_LENGTH.pack(len(zdict)))
+            f.write(zdict)
+            for blob in blobs:
+                f.write(blob)
+        return len(entries)
+
+
+class StateCorpus:
+    """
+    Reads a corpus file written by CorpusRecorder. The index is read on open, states are decoded on demand.
+    """
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            data = f.read()
+        if not data.startswith(MAGIC):
+            raise ValueError(f"{path} is not a state corpus")
+        (length,) = _LENGTH.unpack_from(data, len(MAGIC))
+        start = len(MAGIC) + _LENGTH.size
+        index = json.loads(data[start:start + length])
+        start += length
+        (length,) = _LENGTH.unpack_from(data, start)
+        start += _LENGTH.size
+        self.zdict = data[start:start + length]
+        self.data = memoryview(data)[start + length:]
+        self.entries: list[dict] = index['entries']
+        self.by_category: dict[str, dict[str, list[int]]] = index['by_category']
+
+    def __len__(self):
+        return len(self.entries)
+
+    def categories(self) -> dict[tuple[str, int], int]:
+        """
+        :return: number of states per (phase, player count)
+        """
+        return {(phase, int(n_players)): len(ids)
+                for phase, by_players in self.by_category.items() for n_players, ids in by_players.items()}
+
+    def select(self, phase: str | None = None, players: int | None = None, min_action: int = 0,
+               max_action: int | None = None) -> list[int]:
+        """
+        Ids of the states of a category
+        :param phase: phase of the states, any if None
+        :param players: player count of the states, any if None
+        :param min_action: minimal action number
+        :param max_action: maximal action number, unbounded if None
+        :return: state ids
+        """
+        ids = []
+        for p, by_players in self.by_category.items():
+            if phase is not None and p != phase:
+                continue
+            for n_players, category_ids in by_players.items():
+                if players is not None and int(n_players) != players:
+                    continue
+                ids.extend(i for i in category_ids if self.entries[i]['action'] >= min_action
+                           and (max_action is None or self.entries[i]['action'] <= max_action))
+        return ids
+
+    def state(self, i: int) -> dict:
+        entry = self.entries[i]
+        decompressor = zlib.decompressobj(zdict=self.zdict)
+        return decode_state(decompressor.decompress(self.data[entry['offset']:entry['offset'] + entry['length']]))
+
+    def load(self, phase: str | None = None, players: int | None = None, min_action: int = 0,
+             max_action: int | None = None) -> list[dict]:
+        """
+        Decode the states of a category (see select)
+        """
+        return [self.state(i) for i in self.select(phase, players, min_action, max_action)]
+
+
+def print_info(corpus: StateCorpus):
+    print(f"{len(corpus)} states")
+    print(f"{'phase':<24}{'players':>8}{'states':>8}")
+    for (phase, n_players), n in sorted(corpus.categories().items()):
+        print(f"{phase:<24}{n_players:>8}{n:>8}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Record a corpus of game states or show the contents of one")
+    parser.add_argument('corpus', help="corpus file to write, or to show with --info")
+    parser.add_argument('--info', action='store_true', help="show the states per category of the corpus")
+    parser.add_argument('--games', type=int, default=10, help="number of in-memory games to sample")
+    parser.add_argument('--players', type=int, nargs='+', default=[N_PLAYERS], help="player counts of the games")
+    parser.add_argument('--repo', nargs='*', default=[], help="also sample the histories of these game repositories")
+    parser.add_argument('--per-bucket', type=int, default=20, help="states per phase, player count and progress")
+    parser.add_argument('--progress-bucket', type=int, default=100, help="actions per progress bucket")
+    args = parser.parse_args()
+
+    if not args.info:
+        recorder = CorpusRecorder(args.per_bucket, args.progress_bucket)
+        for n in args.players:
+            recorder.record_games(args.games, n, seed=f'corpus_{n}p')
+        for repo_path in args.repo:
+            recorder.record_repo(repo_path)
+        print(f"Wrote {recorder.write(args.corpus)} states to {args.corpus}")
+    print_info(StateCorpus(args.corpus))
@@ -0,0 +1,117 @@
+import json
+
+from constants import *
+
+# A delta holds the changes of a state relative to the state of its base commit, as a list of operations
+# on paths into the state. A path is a list of dict keys and list indexes.
+#   [path, value]  set the value at the path
+#   [path]         delete the dict key at the path
+# Lists that change their length are set as a whole.
+DELTA_HEADER = b'#!monopoly-delta'
+DELTA_VERSION = 1
+
+
+def diff_states(old: dict, new: dict) -> list[list]:
+    """
+    Compute the operations that turn the public part of one state into the public part of another
+    :param old: state before
+    :param new: state after
+    :return: delta operations
+    """
+    ops = []
+    _diff(public_state(old), public_state(new), [], ops)
+    return ops
+
+
+def _diff(old, new, path: list, ops: list[list]):
+    if old == new:
+        return
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in old:
+            if key not in new:
+                ops.append([path + [key]])
+        for key, value in new.items():
+            if key in old:
+                _diff(old[key], value, path + [key], ops)
+            else:
+                ops.append([path + [key], value])
+    elif isinstance(old, list) and isinstance(new, list) and len(old) == len(new):
+        for i, (a, b) in enumerate(zip(old, new)):
+            _diff(a, b, path + [i], ops)
+    else:
+        ops.append([path, new])
+
+
+def apply_delta(state: dict, ops: list[list]) -> dict:
+    """
+    Apply delta operations to a state
+    :param state: state, changed in place
+    :param ops: delta operations
+    :return: the state
+    """
+    for op in ops:
+        path = op[0]
+        target = state
+        for key in path[:-1]:
+            target = target[key]
+        if len(op) == 1:
+            del target[path[-1]]
+        else:
+            target[path[-1]] = copy_value(op[1])
+    return state
+
+
+def copy_value(value):
+    # Faster than copy.deepcopy for the plain dicts and lists states consist of
+    if isinstance(value, dict):
+        return {k: copy_value(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [copy_value(v) for v in value]
+    return value
+
+
+def merge_states(base: dict, ours: dict, theirs: dict) -> dict:
+    """
+    Three-way merge of two states with a common base state, path by path: changes made on one side only
+    are taken, the same change on both sides is taken once, different changes of the same path conflict
+    :param base: state of the merge base
+    :param ours: state of the local branch
+    :param theirs: state of the branch to merge
+    :return: merged state, a new object
+    """
+    our_ops = {tuple(op[0]): op for op in diff_states(base, ours)}
+    merged = copy_value(public_state(ours))
+    for op in diff_states(base, theirs):
+        path = tuple(op[0])
+        for our_path, our_op in our_ops.items():
+            overlap = min(len(path), len(our_path))
+            if path[:overlap] == our_path[:overlap] and (path != our_path or op != our_op):
+                raise Exception(f"Merge conflict at {'/'.join(map(str, path))}")
+        if path not in our_ops:
+            apply_delta(merged, [op])
+    return merged
+
+
+def encode_delta(base: str, depth: int, ops: list[list]) -> bytes:
+    """
+    Encode a delta
+    :param base: hexsha of the commit whose state the delta applies to
+    :param depth: number of deltas from the nearest full state, including this one
+    :param ops: delta operations
+    :return: encoded delta
+    """
+    header = b'%s version=%d base=%s depth=%d' % (DELTA_HEADER, DELTA_VERSION, base.encode(), depth)
+    return header + b'\n' + json.dumps(ops, separators=(',', ':')).encode()
+
+
+def decode_delta(data: bytes) -> tuple[str, int, list[list]]:
+    """
+    Decode a delta written by encode_delta
+    :param data: encoded delta
+    :return: hexsha of the base commit, depth, delta operations
+    """
+    header, _, payload = data.partition(b'\n')
+    fields = dict(field.split(b'=', 1) for field in header.split()[1:])
+    if int(fields[b'version']) > DELTA_VERSION:
+        raise ValueError(f"Delta version {int(fields[b'version'])} is newer than the supported version {DELTA_VERSION}")
+    return fields[b'base'].decode(), int(fields[b'depth']), json.loads(payload)
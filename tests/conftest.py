@@ -0,0 +1,9 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The tests create commits in new repositories, which need an identity even without a git config
+for variable, value in (('GIT_AUTHOR_NAME', 'test'), ('GIT_AUTHOR_EMAIL', 'test@monopoly.com'),
+                        ('GIT_COMMITTER_NAME', 'test'), ('GIT_COMMITTER_EMAIL', 'test@monopoly.com')):
+    os.environ.setdefault(variable, value)
@@ -0,0 +1,26 @@
+import git
+
+from compact_state import from_compact, to_compact
+from constants import *
+from monopoly import simulate_monopoly_in_memory
+from odb_commit import ObjectReader, read_state_at
+
+
+def test_round_trip_over_a_game():
+    phases = set()
+
+    def observe(_: str, state: dict):
+        public = public_state(state)
+        assert from_compact(to_compact(state)) == public
+        phases.add(state[PHASE])
+
+    simulate_monopoly_in_memory(['a', 'b', 'c'], 'compact', observer=observe)
+    assert AUCTION in phases and BANKRUPTCY_PREVENTION in phases
+
+
+def test_history_is_written_from_compact_states(tmp_path):
+    final = simulate_monopoly_in_memory(['a', 'b'], 'history', max_actions=200, history_path=str(tmp_path))
+    repo = git.Repo(tmp_path / 'history')
+    reader = ObjectReader(f"{repo.git_dir}/objects")
+    assert read_state_at(reader, repo.head.commit.hexsha) == public_state(final)
+    assert len(list(repo.iter_commits())) == 201
@@ -0,0 +1,47 @@
+import copy
+
+from constants import *
+from monopoly import simulate_monopoly
+from odb_commit import OdbCommitter, read_state_at
+from repo_util import init_monopoly_simulation_repos
+from state_codec import BINARY_CODEC
+
+
+def test_criss_cross_merge_uses_virtual_base(tmp_path):
+    repos, _ = init_monopoly_simulation_repos(str(tmp_path), 'g', ['a', 'b'], shared_objects=True)
+    a, b = (OdbCommitter(repo, snapshot_interval=8) for repo in repos)
+    b.merge_branch(a.head_hexsha(), 'a/main')
+
+    state = copy.deepcopy(a.read_state())
+    state[AUCTION] = {ASSET: 1, INITIATOR: 'a', PLAYERS: {'a': {WINNER: None}, 'b': {WINNER: None}}}
+    a.commit("Start auction", state)
+    b.merge_branch(a.head_hexsha(), 'a/main')
+
+    # Both players change the state and merge each other at the same time, so the next merge has two bases
+    state = copy.deepcopy(a.read_state())
+    state[AUCTION][PLAYERS]['a'][WINNER] = True
+    a.commit("Win auction", state)
+    state = copy.deepcopy(b.read_state())
+    state[PLAYERS]['b'][MONEY] -= 10
+    b.commit("Pay", state)
+    a_tip, b_tip = a.head_hexsha(), b.head_hexsha()
+    a.merge_branch(b_tip, 'b/main')
+    b.merge_branch(a_tip, 'a/main')
+
+    # Against one of the bases alone, the winner of a and the end of the auction would conflict
+    state = copy.deepcopy(b.read_state())
+    state[AUCTION] = None
+    b.commit("End auction", state)
+    a.merge_branch(b.head_hexsha(), 'b/main')
+
+    merged = read_state_at(a.reader, a.head_hexsha())
+    assert merged[AUCTION] is None
+    assert merged[PLAYERS]['b'][MONEY] == STARTING_MONEY - 10
+
+
+def test_delta_simulation_with_concurrent_auctions_terminates(tmp_path):
+    # Every player acts in auctions, so the branches diverge and merge each other all the time
+    repos, initial_commit = init_monopoly_simulation_repos(str(tmp_path), 'g', ['a', 'b', 'c'], BINARY_CODEC,
+                                                           shared_objects=True)
+    state = simulate_monopoly(repos, initial_commit, BINARY_CODEC, odb=True, snapshot_interval=8)
+    assert state[WINNER] in ['a', 'b', 'c']
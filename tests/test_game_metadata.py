@@ -0,0 +1,18 @@
+import game_metadata
+from constants import *
+from game_metadata import get_game_codec, get_initial_commit, load_game
+from repo_util import init_monopoly_simulation_repos
+from rules import has_rules_hash
+from state_codec import JSON_CODEC
+
+
+def test_resume_reads_codec_and_initial_commit(tmp_path):
+    repos, initial_commit = init_monopoly_simulation_repos(str(tmp_path), 'g', ['a', 'b'], JSON_CODEC)
+    # As in a new process
+    game_metadata._metadata.clear()
+    for repo, player in zip(repos, ['a', 'b']):
+        metadata = load_game(repo)
+        assert metadata[NAME] == player
+        assert get_game_codec(repo) == JSON_CODEC
+        assert has_rules_hash(metadata['rules'])
+    assert get_initial_commit(repos[0]) == initial_commit
@@ -0,0 +1,20 @@
+import git
+
+from push_worker import _workers, get_push_worker, stop_push_worker
+
+
+def test_stopped_worker_exits_after_the_final_push(tmp_path):
+    origin = git.Repo.init(tmp_path / 'origin', bare=True)
+    repo = git.Repo.init(tmp_path / 'player', initial_branch='main')
+    repo.create_remote('origin', origin.git_dir)
+    repo.index.commit("initial commit")
+
+    worker = get_push_worker(repo)
+    assert worker.flush()
+    stop_push_worker(repo)
+
+    assert not worker._thread.is_alive()
+    assert repo.git_dir not in _workers
+    assert origin.commit('main') == repo.head.commit
+    # Stopping again, or a repository without a worker, does nothing
+    stop_push_worker(repo)
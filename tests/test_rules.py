@@ -0,0 +1,39 @@
+import os
+
+import rules
+from constants import *
+from odb_commit import OdbCommitter, ObjectReader, read_state_at, read_tree_file
+from repo_util import init_monopoly_state, write_history_repo
+from rules import RULES_FILE, find_rules, rules_file_reader
+from state_codec import decode_state, encode_state
+
+
+def custom_state() -> dict:
+    state = init_monopoly_state(['a', 'b'])
+    state[BOARD][1][VALUE] += 1
+    return state
+
+
+def forget_rules(state: dict):
+    # As in a new process, which only knows the built-in rules
+    rules._rules_by_hash.pop(find_rules(state))
+
+
+def test_split_and_join_round_trip():
+    state = init_monopoly_state(['a', 'b'])
+    assert decode_state(encode_state(state)) == state
+
+
+def test_unknown_rules_are_read_from_the_rules_file(tmp_path):
+    state = custom_state()
+    repo, _ = write_history_repo(str(tmp_path), 'g', [("initial commit", state)])
+    committer = OdbCommitter(repo, snapshot_interval=8)
+    committer.commit("Commit with the rules file carried over", committer.read_state())
+    forget_rules(state)
+
+    reader = ObjectReader(os.path.join(repo.git_dir, 'objects'))
+    assert read_state_at(reader, committer.head_hexsha()) == state
+    assert read_tree_file(reader, committer.head_hexsha(), RULES_FILE) == rules_file_reader(repo.working_tree_dir)()
+    forget_rules(state)
+    with open(os.path.join(repo.working_tree_dir, 'state.yml'), 'rb') as f:
+        assert decode_state(f.read(), rules_file_reader(repo.working_tree_dir)) == state
@@ -0,0 +1,18 @@
+import pytest
+
+import monopoly
+from constants import *
+
+
+def test_in_memory_game_raises_on_deadlock(monkeypatch):
+    def stuck(player: str, state: dict, sim: bool) -> list:
+        # Only the first action is enabled, after it nobody can act
+        return [] if state[PHASE] != PRE_ROLL else [("Stuck", lambda: stuck_action(state))]
+
+    def stuck_action(state: dict) -> str:
+        state[PHASE] = DOUBLES_CHECK
+        return "stuck"
+
+    monkeypatch.setattr(monopoly, 'get_enabled_actions', stuck)
+    with pytest.raises(Exception, match="Deadlock after 1 actions"):
+        monopoly.simulate_monopoly_in_memory(['a', 'b'], 'deadlock')
@@ -0,0 +1,18 @@
+import pytest
+
+from monopoly import simulate_monopoly
+from odb_commit import OdbCommitter
+from repo_util import init_monopoly_simulation_repos
+from state_codec import BINARY_CODEC, JSON_CODEC
+
+
+def test_binary_codec_is_rejected_where_git_merges(tmp_path):
+    repos, initial_commit = init_monopoly_simulation_repos(str(tmp_path), 'g', ['a', 'b'], JSON_CODEC)
+    with pytest.raises(ValueError):
+        simulate_monopoly(repos, initial_commit, BINARY_CODEC)
+    with pytest.raises(ValueError):
+        simulate_monopoly(repos, initial_commit, BINARY_CODEC, odb=True)
+    with pytest.raises(ValueError):
+        OdbCommitter(repos[0], BINARY_CODEC)
+    # Delta commits are merged in-process
+    OdbCommitter(repos[0], BINARY_CODEC, snapshot_interval=8)
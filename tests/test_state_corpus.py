@@ -0,0 +1,12 @@
+from state_corpus import CorpusRecorder, StateCorpus
+
+
+def test_samples_match_the_written_corpus(tmp_path):
+    recorder = CorpusRecorder(per_bucket=5)
+    recorder.record_games(1, 3)
+    samples = recorder.samples()
+    path = str(tmp_path / 'corpus')
+    assert recorder.write(path) == len(samples)
+
+    corpus = StateCorpus(path)
+    assert [(entry['action'], corpus.state(i)) for i, entry in enumerate(corpus.entries)] == samples
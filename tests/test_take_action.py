@@ -0,0 +1,53 @@
+import copy
+from random import Random
+
+import pytest
+
+import monopoly
+from constants import *
+from monopoly import read_player_and_state, take_action
+from odb_commit import OdbCommitter, read_state_at
+from repo_util import init_monopoly_simulation_repos
+
+
+def test_failed_commit_does_not_leave_the_changed_state_cached(tmp_path, monkeypatch):
+    repos, _ = init_monopoly_simulation_repos(str(tmp_path), 'g', ['a', 'b'])
+    repo = repos[0]
+    _, state = read_player_and_state(repo)
+    committed = copy.deepcopy(public_state(state))
+
+    def fail(*args):
+        raise Exception("Commit failed")
+
+    monkeypatch.setattr(monopoly, 'check_invariants_and_commit', fail)
+    with pytest.raises(Exception, match="Commit failed"):
+        take_action(repo, sim=True, rand=Random(0))
+    monkeypatch.undo()
+
+    _, state = read_player_and_state(repo)
+    assert public_state(state) == committed
+
+
+@pytest.mark.parametrize('group_size', [1, 2])
+def test_failed_action_does_not_leave_the_changed_state_in_the_committer(tmp_path, monkeypatch, group_size):
+    repos, _ = init_monopoly_simulation_repos(str(tmp_path), 'g', ['a', 'b'])
+    committer = OdbCommitter(repos[0], group_size=group_size)
+    rand = Random(0)
+    if group_size > 1:
+        # An earlier action of the group that is still pending
+        take_action(repos[0], sim=True, rand=rand, committer=committer)
+        assert committer.pending_messages
+    committed = copy.deepcopy(public_state(read_state_at(committer.reader, committer.head_hexsha())))
+
+    def fail(*args):
+        raise Exception("Invariant check failed")
+
+    monkeypatch.setattr(monopoly, 'check_invariants', fail)
+    with pytest.raises(Exception, match="Invariant check failed"):
+        take_action(repos[0], sim=True, rand=rand, committer=committer)
+    monkeypatch.undo()
+
+    assert not committer.pending_messages and not committer.pending_records
+    state = committer.read_state()
+    assert public_state(state) == committed
+    assert ENABLED_ACTIONS not in state
@@ -0,0 +1,25 @@
+import json
+import time
+
+from timing import get_timing_registry, start_game_timing
+
+
+def test_untimed_sections_are_left_out():
+    registry = start_game_timing()
+    with registry.time('auction', 'bid'):
+        with registry.untimed():
+            time.sleep(0.05)
+    assert registry.histograms[('auction', 'bid')].max < 10_000_000
+
+
+def test_every_game_starts_with_empty_timings(tmp_path):
+    first = start_game_timing()
+    with first.time('git', 'commit'):
+        pass
+    second = start_game_timing(str(tmp_path / 'timings.log'))
+    assert get_timing_registry() is second and second.histograms == {}
+    with second.time('git', 'merge'):
+        pass
+    second.flush()
+    with open(tmp_path / 'timings.log') as f:
+        assert list(json.loads(f.readline())['timings']) == ['git/merge']
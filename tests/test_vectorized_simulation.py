@@ -0,0 +1,8 @@
+from vectorized_simulation import cross_validate
+
+
+def test_landing_frequencies_match_the_scalar_engine():
+    # Smaller samples than the defaults, the noise per square is still below the tolerance
+    validation = cross_validate(60, 2000, tolerance=0.005)
+    assert validation['outside_tolerance'] == [], validation['differences']
+    assert abs(sum(validation['scalar']) - 1) < 1e-9 and abs(sum(validation['vectorized']) - 1) < 1e-9
@@ -0,0 +1,176 @@
+import json
+import logging
+import logging.handlers
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+# Latencies are counted in logarithmic buckets with SUB_BUCKETS buckets per power of two,
+# so percentiles are exact up to 1 / SUB_BUCKETS (12.5%) of the value and memory does not grow with the run.
+SUB_BUCKET_BITS = 3
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+# File name of timing logs in a game directory
+TIMING_LOG = 'timings.log'
+GIT = 'git'
+COMMIT = 'commit'
+MERGE = 'merge'
+
+
+class Histogram:
+    __slots__ = ('count', 'total', 'min', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+        self.buckets: dict[int, int] = {}
+
+    def record(self, ns: int):
+        self.count += 1
+        self.total += ns
+        if self.min is None or ns < self.min:
+            self.min = ns
+        if ns > self.max:
+            self.max = ns
+        bucket = _bucket(ns)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def percentile(self, q: float) -> int:
+        """
+        Approximate percentile
+        :param q: percentile between 0 and 100
+        :return: lower bound of the bucket the percentile falls into, in ns
+        """
+        rank = q / 100 * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return max(_bucket_start(bucket), self.min)
+        return self.max
+
+    def summary(self) -> dict:
+        return {
+            'count': self.count,
+            'mean_us': self.total / self.count / 1000,
+            'min_us': self.min / 1000,
+            'p50_us': self.percentile(50) / 1000,
+            'p90_us': self.percentile(90) / 1000,
+            'p99_us': self.percentile(99) / 1000,
+            'max_us': self.max / 1000
+        }
+
+
+def _bucket(ns: int) -> int:
+    # The position of the highest bit and the SUB_BUCKET_BITS bits below it
+    n_bits = ns.bit_length()
+    if n_bits <= SUB_BUCKET_BITS:
+        return ns
+    return ((n_bits - SUB_BUCKET_BITS) << SUB_BUCKET_BITS) | ((ns >> (n_bits - SUB_BUCKET_BITS - 1)) & (SUB_BUCKETS - 1))
+
+
+def _bucket_start(bucket: int) -> int:
+    if bucket < SUB_BUCKETS:
+        return bucket
+    shift = (bucket >> SUB_BUCKET_BITS) - 1
+    return (SUB_BUCKETS | (bucket & (SUB_BUCKETS - 1))) << shift
+
+
+class TimingRegistry:
+    """
+    In-process latency histograms keyed by phase and kind, e.g. (post-roll, pay_street_rent) or (git, commit).
+    Recording is a dict lookup and a few integer operations. If a path is given, the summary is also
+    written to a rotating log file every flush_interval seconds and on flush.
+    Time spent in untimed sections, e.g. waiting for input, is left out of the enclosing timed sections.
+    """
+
+    def __init__(self, path: str | None = None, flush_interval: float = 60.0, max_bytes: int = 1 << 20,
+                 backup_count: int = 3):
+        self.histograms: dict[tuple[str, str], Histogram] = {}
+        self.flush_interval = flush_interval
+        self.last_flush = time.monotonic()
+        self.untimed_ns = 0
+        self.logger = None
+        if path is not None:
+            self.logger = logging.getLogger(f"{__name__}.{path}")
+            self.logger.propagate = False
+            self.logger.setLevel(logging.INFO)
+            if not self.logger.handlers:
+                self.logger.addHandler(logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes,
+                                                                            backupCount=backup_count))
+
+    def record(self, phase: str, kind: str, ns: int):
+        histogram = self.histograms.get((phase, kind))
+        if histogram is None:
+            histogram = self.histograms[(phase, kind)] = Histogram()
+        histogram.record(ns)
+        if self.logger is not None and time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    @contextmanager
+    def time(self, phase: str, kind: str):
+        untimed_start = self.untimed_ns
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.record(phase, kind, time.perf_counter_ns() - start - (self.untimed_ns - untimed_start))
+
+    @contextmanager
+    def untimed(self):
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.untimed_ns += time.perf_counter_ns() - start
+
+    def summary(self) -> dict[str, dict]:
+        return {f"{phase}/{kind}": self.histograms[(phase, kind)].summary() for phase, kind in sorted(self.histograms)}
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        if self.logger is not None:
+            self.logger.info(json.dumps({'time': time.time(), 'timings': self.summary()}))
+
+    def print_summary(self):
+        print(f"{'phase/kind':<48}{'count':>8}{'mean':>10}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}  (us)")
+        for key, s in self.summary().items():
+            print(f"{key:<48}{s['count']:>8}{s['mean_us']:>10.0f}{s['p50_us']:>10.0f}{s['p90_us']:>10.0f}"
+                  f"{s['p99_us']:>10.0f}{s['max_us']:>10.0f}")
+
+
+def action_kind(action: Callable) -> str:
+    """
+    Name of the function an enabled action calls, e.g. roll_and_move or pay_street_rent.
+    Actions are lambdas calling one module function, which is the first global name of their code.
+    """
+    names = getattr(action, '__code__', None) and action.__code__.co_names
+    return names[0] if names else getattr(action, '__name__', 'unknown')
+
+
+_default_registry: TimingRegistry | None = None
+
+
+def get_timing_registry() -> TimingRegistry:
+    global _default_registry
+    if _default_registry is None:
+        _default_registry = TimingRegistry()
+    return _default_registry
+
+
+def set_timing_registry(registry: TimingRegistry):
+    global _default_registry
+    _default_registry = registry
+
+
+def start_game_timing(path: str | None = None) -> TimingRegistry:
+    """
+    Replace the default registry by an empty one, so the timings of a game do not include earlier games
+    :param path: rotating log file the summary is written to periodically and at flush, None for none
+    :return: the new default registry
+    """
+    registry = TimingRegistry(path)
+    set_timing_registry(registry)
+    return registry
@@ -0,0 +1,401 @@
+import argparse
+import time
+
+import numpy as np
+
+from constants import *
+
+# Lockstep Monte Carlo simulation of many games at once for strategy research.
+# Only dice, movement, jail, cards, rent and cash flow are modelled. All players follow one fixed policy:
+# buy every property they land on and can afford, build one house per complete set and turn while keeping
+# a cash reserve, never mortgage, and go bankrupt as soon as a payment cannot be made.
+# Every step advances each unfinished game by one roll of its active player.
+
+N_SQUARES = len(INIT_BOARD)
+NO_OWNER = -1
+
+_TYPES = np.array([square[TYPE] for square in INIT_BOARD])
+PRICE = np.array([square.get(VALUE, 0) for square in INIT_BOARD])
+STREET_RENT = np.array([square[RENT] if square[TYPE] == STREET else [0] * 6 for square in INIT_BOARD])
+HOUSE_COST_OF = np.array([square.get(HOUSE_COST, 0) for square in INIT_BOARD])
+SET_OF = np.array([square[SET] if square[TYPE] == STREET else 0 for square in INIT_BOARD])
+IS_STREET = _TYPES == STREET
+IS_RAIL = _TYPES == RAIL
+IS_UTILITY = _TYPES == UTILITY
+IS_PROPERTY = IS_STREET | IS_RAIL | IS_UTILITY
+IS_TAX = _TYPES == TAX
+IS_CC = _TYPES == COMMUNITY_CHEST
+IS_CH = _TYPES == CHANCE
+GO_TO_JAIL_IDX = int(np.flatnonzero(_TYPES == GO_TO_JAIL)[0])
+RAIL_IDXS = np.flatnonzero(IS_RAIL)
+UTILITY_IDXS = np.flatnonzero(IS_UTILITY)
+
+# Street indices per set, padded with -1 (the first and the last set only have two streets)
+N_SETS = int(SET_OF.max())
+SET_IDXS = np.full((N_SETS + 1, 3), -1)
+for _s in range(1, N_SETS + 1):
+    _idxs = np.flatnonzero(SET_OF == _s)
+    SET_IDXS[_s, :len(_idxs)] = _idxs
+
+_CARD_TYPES = (COLLECT, PAY, ADVANCE_TO, GO_TO_JAIL, GOOFJ_CC, GOOFJ_CH)
+
+
+def _deck(cards: list[dict]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    types = np.array([_CARD_TYPES.index(card[TYPE]) for card in cards])
+    amounts = np.array([card.get(AMOUNT, 0) for card in cards])
+    squares = np.array([card.get(SQUARE, -1) for card in cards])
+    return types, amounts, squares
+
+
+CC_DECK = _deck(CC_CARDS)
+CH_DECK = _deck(CH_CARDS)
+
+
+class VectorizedGames:
+    """
+    Arrays of n games with n_players each. Per game values have shape (n,), per player values (n, n_players)
+    and per square values (n, N_SQUARES). Players and owners are seat numbers, NO_OWNER is the bank.
+    """
+
+    def __init__(self, n_games: int, n_players: int, seed: int, reserve: int):
+        self.n_games = n_games
+        self.n_players = n_players
+        self.reserve = reserve
+        self.rng = np.random.default_rng(seed)
+
+        self.money = np.full((n_games, n_players), STARTING_MONEY, dtype=np.int64)
+        self.position = np.zeros((n_games, n_players), dtype=np.int64)
+        self.in_jail = np.zeros((n_games, n_players), dtype=bool)
+        self.jail_time = np.zeros((n_games, n_players), dtype=np.int64)
+        self.bankrupt = np.zeros((n_games, n_players), dtype=bool)
+        self.owner = np.full((n_games, N_SQUARES), NO_OWNER, dtype=np.int64)
+        self.level = np.zeros((n_games, N_SQUARES), dtype=np.int64)
+        self.goojf_cc_owner = np.full(n_games, NO_OWNER, dtype=np.int64)
+        self.goojf_ch_owner = np.full(n_games, NO_OWNER, dtype=np.int64)
+        self.active = np.zeros(n_games, dtype=np.int64)
+        self.consecutive_doubles = np.zeros(n_games, dtype=np.int64)
+        self.finished = np.zeros(n_games, dtype=bool)
+
+        # Statistics
+        self.turns = np.zeros(n_games, dtype=np.int64)
+        self.landings = np.zeros(N_SQUARES, dtype=np.int64)
+        self.rent_by_square = np.zeros(N_SQUARES, dtype=np.int64)
+        self.bankruptcy_turn = np.full((n_games, n_players), -1, dtype=np.int64)
+        self.winner = np.full(n_games, NO_OWNER, dtype=np.int64)
+
+    def step(self):
+        g = np.flatnonzero(~self.finished)
+        a = self.active[g]
+        self.turns[g] += 1
+        self._build(g, a)
+
+        # Get Out of Jail Free cards are played right away
+        for card_owner in (self.goojf_cc_owner, self.goojf_ch_owner):
+            plays = self.in_jail[g, a] & (card_owner[g] == a)
+            self.in_jail[g[plays], a[plays]] = False
+            self.jail_time[g[plays], a[plays]] = 0
+            card_owner[g[plays]] = NO_OWNER
+
+        d1 = self.rng.integers(1, 7, len(g))
+        d2 = self.rng.integers(1, 7, len(g))
+        doubles = d1 == d2
+        jailed = self.in_jail[g, a]
+        moves = ~jailed
+
+        # In jail: doubles free the player, the third miss costs $50, otherwise the turn ends
+        leaves = jailed & (doubles | (self.jail_time[g, a] == 2))
+        stays = jailed & ~leaves
+        self.jail_time[g[stays], a[stays]] += 1
+        self.in_jail[g[leaves], a[leaves]] = False
+        self.jail_time[g[leaves], a[leaves]] = 0
+        fined = leaves & ~doubles
+        self._pay(g[fined], a[fined], np.full(fined.sum(), 50), np.full(fined.sum(), NO_OWNER))
+        moves |= leaves & ~self.bankrupt[g, a]
+
+        # Doubles out of jail do not give another turn
+        cd = np.where(jailed, 0, np.where(doubles, self.consecutive_doubles[g] + 1, 0))
+        third_doubles = moves & (cd == 3)
+        self._go_to_jail(g[third_doubles], a[third_doubles])
+        cd[third_doubles] = 0
+        moves &= ~third_doubles
+
+        gm, am = g[moves], a[moves]
+        self._move_to(gm, am, (self.position[gm, am] + (d1 + d2)[moves]) % N_SQUARES)
+        self._resolve(gm, am)
+
+        # The turn passes on unless the player rolled doubles and is still free and solvent
+        again = (cd > 0) & ~self.in_jail[g, a] & ~self.bankrupt[g, a]
+        self.consecutive_doubles[g] = np.where(again, cd, 0)
+        self._pass_turn(g[~again])
+        self._check_finished(g)
+
+    def _build(self, g: np.ndarray, a: np.ndarray):
+        # Sets do not share streets, so building on one set does not change the owners and levels of another
+        owner = self.owner[g]
+        level = self.level[g]
+        for s in range(1, N_SETS + 1):
+            idxs = SET_IDXS[s][SET_IDXS[s] >= 0]
+            complete = (owner[:, idxs] == a[:, None]).all(axis=1)
+            levels = level[:, idxs]
+            # Build evenly: on the first street with the lowest level
+            target = idxs[levels.argmin(axis=1)]
+            cost = HOUSE_COST_OF[target]
+            builds = complete & (levels.min(axis=1) < 5) & (self.money[g, a] >= cost + self.reserve)
+            gb, ab, tb = g[builds], a[builds], target[builds]
+            self.level[gb, tb] += 1
+            self.money[gb, ab] -= cost[builds]
+
+    def _move_to(self, g: np.ndarray, a: np.ndarray, new_pos: np.ndarray, collect_go: bool = True):
+        old_pos = self.position[g, a]
+        if collect_go:
+            self.money[g, a] += np.where(new_pos < old_pos, 200, 0)
+        self.position[g, a] = new_pos
+        np.add.at(self.landings, new_pos[new_pos != old_pos], 1)
+
+    def _go_to_jail(self, g: np.ndarray, a: np.ndarray):
+        self._move_to(g, a, np.full(len(g), JAIL_IDX), collect_go=False)
+        self.in_jail[g, a] = True
+        self.jail_time[g, a] = 0
+
+    def _resolve(self, g: np.ndarray, a: np.ndarray):
+        pos = self.position[g, a]
+
+        to_jail = pos == GO_TO_JAIL_IDX
+        self._go_to_jail(g[to_jail], a[to_jail])
+
+        tax = IS_TAX[pos]
+        self._pay(g[tax], a[tax], PRICE[pos[tax]], np.full(tax.sum(), NO_OWNER))
+
+        for is_deck, deck, card_owner in ((IS_CC, CC_DECK, self.goojf_cc_owner),
+                                          (IS_CH, CH_DECK, self.goojf_ch_owner)):
+            draws = is_deck[pos]
+            advanced = self._draw(g[draws], a[draws], deck, card_owner)
+            # Advancing cards lead to properties, which are resolved like a roll onto them
+            self._resolve_property(g[draws][advanced], a[draws][advanced])
+
+        prop = IS_PROPERTY[pos]
+        self._resolve_property(g[prop], a[prop])
+
+    def _draw(self, g: np.ndarray, a: np.ndarray, deck: tuple, card_owner: np.ndarray) -> np.ndarray:
+        types, amounts, squares = deck
+        # The Get Out of Jail Free card is the last card and stays out of the deck while someone holds it
+        n_cards = np.where(card_owner[g] == NO_OWNER, len(types), len(types) - 1)
+        card = (self.rng.random(len(g)) * n_cards).astype(np.int64)
+        kind = types[card]
+
+        collect = kind == _CARD_TYPES.index(COLLECT)
+        self.money[g[collect], a[collect]] += amounts[card[collect]]
+        pay = kind == _CARD_TYPES.index(PAY)
+        self._pay(g[pay], a[pay], amounts[card[pay]], np.full(pay.sum(), NO_OWNER))
+        jail = kind == _CARD_TYPES.index(GO_TO_JAIL)
+        self._go_to_jail(g[jail], a[jail])
+        goojf = (kind == _CARD_TYPES.index(GOOFJ_CC)) | (kind == _CARD_TYPES.index(GOOFJ_CH))
+        card_owner[g[goojf]] = a[goojf]
+        advance = kind == _CARD_TYPES.index(ADVANCE_TO)
+        self._move_to(g[advance], a[advance], squares[card[advance]])
+        return advance & IS_PROPERTY[np.maximum(squares[card], 0)]
+
+    def _resolve_property(self, g: np.ndarray, a: np.ndarray):
+        pos = self.position[g, a]
+        owner = self.owner[g, pos]
+
+        buys = (owner == NO_OWNER) & (self.money[g, a] >= PRICE[pos])
+        self.owner[g[buys], pos[buys]] = a[buys]
+        self.money[g[buys], a[buys]] -= PRICE[pos[buys]]
+
+        rents = (owner != NO_OWNER) & (owner != a)
+        g, a, pos, owner = g[rents], a[rents], pos[rents], owner[rents]
+        rent = self._street_rent(g, pos, owner)
+        n_rails = (self.owner[g][:, RAIL_IDXS] == owner[:, None]).sum(axis=1)
+        rent = np.where(IS_RAIL[pos], 25 * 2 ** np.maximum(n_rails - 1, 0), rent)
+        n_utilities = (self.owner[g][:, UTILITY_IDXS] == owner[:, None]).sum(axis=1)
+        # Like the engine, utility rent is based on a new roll of the dice, not on the roll that moved the player
+        dice = self.rng.integers(1, 7, len(g)) + self.rng.integers(1, 7, len(g))
+        rent = np.where(IS_UTILITY[pos], dice * np.where(n_utilities == 2, 10, 4), rent)
+        np.add.at(self.rent_by_square, pos, np.minimum(rent, self.money[g, a]))
+        self._pay(g, a, rent, owner)
+
+    def _street_rent(self, g: np.ndarray, pos: np.ndarray, owner: np.ndarray) -> np.ndarray:
+        level = self.level[g, pos]
+        set_idxs = SET_IDXS[SET_OF[pos]]
+        set_owners = np.where(set_idxs >= 0, self.owner[g[:, None], np.maximum(set_idxs, 0)], owner[:, None])
+        monopoly = (set_owners == owner[:, None]).all(axis=1)
+        base = STREET_RENT[pos, 0] * np.where(monopoly, 2, 1)
+        return np.where(level > 0, STREET_RENT[pos, level], base)
+
+    def _pay(self, g: np.ndarray, a: np.ndarray, amount: np.ndarray, creditor: np.ndarray):
+        """
+        Pay an amount to a creditor (NO_OWNER for the bank), going bankrupt if the money does not suffice
+        """
+        can_pay = self.money[g, a] >= amount
+        gp, ap, cp, amp = g[can_pay], a[can_pay], creditor[can_pay], amount[can_pay]
+        self.money[gp, ap] -= amp
+        to_player = cp != NO_OWNER
+        self.money[gp[to_player], cp[to_player]] += amp[to_player]
+        self._go_bankrupt(g[~can_pay], a[~can_pay], creditor[~can_pay])
+
+    def _go_bankrupt(self, g: np.ndarray, a: np.ndarray, creditor: np.ndarray):
+        # All assets go to the creditor, properties taken by the bank are back on the market without houses
+        to_player = creditor != NO_OWNER
+        self.money[g[to_player], creditor[to_player]] += self.money[g[to_player], a[to_player]]
+        self.money[g, a] = 0
+        owned = self.owner[g] == a[:, None]
+        self.owner[g] = np.where(owned, creditor[:, None], self.owner[g])
+        self.level[g] = np.where(owned & ~to_player[:, None], 0, self.level[g])
+        for card_owner in (self.goojf_cc_owner, self.goojf_ch_owner):
+            card_owner[g] = np.where(card_owner[g] == a, creditor, card_owner[g])
+        self.bankrupt[g, a] = True
+        self.in_jail[g, a] = False
+        self.bankruptcy_turn[g, a] = self.turns[g]
+
+    def _pass_turn(self, g: np.ndarray):
+        nxt = (self.active[g] + 1) % self.n_players
+        # Skip bankrupt players, at least one player is still solvent in an unfinished game
+        for _ in range(self.n_players - 1):
+            nxt = np.where(self.bankrupt[g, nxt], (nxt + 1) % self.n_players, nxt)
+        self.active[g] = nxt
+
+    def _check_finished(self, g: np.ndarray):
+        alive = ~self.bankrupt[g]
+        done = alive.sum(axis=1) <= 1
+        self.finished[g[done]] = True
+        self.winner[g[done]] = np.where(alive[done].any(axis=1), alive[done].argmax(axis=1), NO_OWNER)
+
+
+def simulate_vectorized(n_games: int, n_players: int = N_PLAYERS, seed: int = 0, max_turns: int = 2000,
+                        reserve: int = 200) -> dict:
+    """
+    Simulate n games in lockstep
+    :param n_games: number of games
+    :param n_players: players per game
+    :param seed: seed of the dice and card draws
+    :param max_turns: stop games that are not decided after this many rolls
+    :param reserve: money a player keeps when building houses
+    :return: report with landing frequencies, rent flows and bankruptcy times (see print_report)
+    """
+    games = VectorizedGames(n_games, n_players, seed, reserve)
+    start_time = time.perf_counter()
+    n_steps = 0
+    while not games.finished.all() and n_steps < max_turns:
+        games.step()
+        n_steps += 1
+    seconds = time.perf_counter() - start_time
+
+    bankruptcies = games.bankruptcy_turn[games.bankruptcy_turn >= 0]
+    first_bankruptcy = np.where(games.bankruptcy_turn >= 0, games.bankruptcy_turn, np.iinfo(np.int64).max).min(axis=1)
+    first_bankruptcy = first_bankruptcy[first_bankruptcy < np.iinfo(np.int64).max]
+    decided = games.finished
+    return {
+        'games': n_games,
+        'players': n_players,
+        'decided': int(decided.sum()),
+        'seconds': seconds,
+        'rolls': int(games.turns.sum()),
+        'landing_frequencies': (games.landings / games.landings.sum()).tolist(),
+        'rent_per_game': (games.rent_by_square / n_games).tolist(),
+        'bankruptcy_turns': _quantiles(bankruptcies),
+        'first_bankruptcy_turns': _quantiles(first_bankruptcy),
+        'game_turns': _quantiles(games.turns[decided]),
+        'wins_by_seat': np.bincount(games.winner[decided & (games.winner >= 0)], minlength=n_players).tolist()
+    }
+
+
+def _quantiles(values: np.ndarray) -> dict:
+    if len(values) == 0:
+        return {}
+    q = np.percentile(values, [10, 50, 90])
+    return {'n': len(values), 'mean': float(values.mean()), 'p10': float(q[0]), 'p50': float(q[1]),
+            'p90': float(q[2])}
+
+
+def scalar_landing_frequencies(n_games: int, max_actions: int = 5000) -> list[float]:
+    """
+    Landing frequencies of games on the scalar in-memory engine, counted like the vectorized simulation
+    counts them: every time a token ends up on another square
+    :param n_games: number of games
+    :param max_actions: actions per game
+    :return: frequency per square
+    """
+    # Imported here, the vectorized simulation itself does not need the scalar engine
+    from monopoly import simulate_monopoly_in_memory
+
+    landings = np.zeros(N_SQUARES, dtype=np.int64)
+    for i in range(n_games):
+        positions = {}
+
+        def observe(_: str, state: dict):
+            for name, player in state[PLAYERS].items():
+                if positions.get(name, 0) != player[POSITION]:
+                    landings[player[POSITION]] += 1
+                positions[name] = player[POSITION]
+
+        simulate_monopoly_in_memory([f'v{i}_p{j}' for j in range(N_PLAYERS)], f'vectorized_{i}',
+                                    max_actions=max_actions, observer=observe)
+    return (landings / landings.sum()).tolist()
+
+
+def cross_validate(n_scalar_games: int = 200, n_vectorized_games: int = 10_000, seed: int = 0,
+                   tolerance: float = 0.005) -> dict:
+    """
+    Compare the landing frequency of every square in the vectorized simulation with the scalar engine.
+    Movement does not depend on the policy apart from how players leave jail (the scalar engine picks
+    actions at random, so it sometimes pays the fine), so the frequencies should agree up to sampling noise.
+    With the default sample sizes the noise per square stays well below the default tolerance of half a
+    percentage point, while the frequencies themselves are around 2.5%.
+    :param n_scalar_games: number of scalar games
+    :param n_vectorized_games: number of vectorized games
+    :param seed: seed of the vectorized simulation
+    :param tolerance: largest accepted absolute difference of the landing frequency of a square
+    :return: both distributions, the difference per square, the squares outside the tolerance,
+     their total variation distance and the largest difference per square
+    """
+    vectorized = np.array(simulate_vectorized(n_vectorized_games, seed=seed)['landing_frequencies'])
+    scalar = np.array(scalar_landing_frequencies(n_scalar_games))
+    diff = np.abs(vectorized - scalar)
+    return {
+        'vectorized': vectorized.tolist(),
+        'scalar': scalar.tolist(),
+        'differences': diff.tolist(),
+        'tolerance': tolerance,
+        'outside_tolerance': [INIT_BOARD[i][NAME] for i in np.flatnonzero(diff > tolerance)],
+        'total_variation': float(diff.sum() / 2),
+        'max_difference': float(diff.max()),
+        'max_difference_square': INIT_BOARD[int(diff.argmax())][NAME]
+    }
+
+
+def print_report(report: dict):
+    print(f"{report['games']} games with {report['players']} players, {report['decided']} decided, "
+          f"{report['rolls']} rolls in {report['seconds']:.2f}s "
+          f"({report['rolls'] / max(report['seconds'], 1e-9):,.0f} rolls/s)")
+    print(f"{'square':<24}{'landings':>10}{'rent/game':>12}")
+    for square, freq, rent in zip(INIT_BOARD, report['landing_frequencies'], report['rent_per_game']):
+        print(f"{square[NAME]:<24}{freq:>10.2%}{rent:>12.1f}")
+    for key in ('first_bankruptcy_turns', 'bankruptcy_turns', 'game_turns'):
+        print(f"{key}: {report[key]}")
+    print(f"wins by seat: {report['wins_by_seat']}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Monte Carlo simulation of many games in lockstep")
+    parser.add_argument('--games', type=int, default=10_000, help="number of games")
+    parser.add_argument('--players', type=int, default=N_PLAYERS, help="players per game")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the dice and card draws")
+    parser.add_argument('--max-turns', type=int, default=2000, help="maximum number of rolls per game")
+    parser.add_argument('--reserve', type=int, default=200, help="money kept when building houses")
+    parser.add_argument('--validate', type=int, default=0,
+                        help="also compare the landing frequencies with this many scalar engine games")
+    parser.add_argument('--tolerance', type=float, default=0.005,
+                        help="largest accepted difference of the landing frequency of a square")
+    args = parser.parse_args()
+
+    print_report(simulate_vectorized(args.games, args.players, args.seed, args.max_turns, args.reserve))
+    if args.validate:
+        validation = cross_validate(args.validate, args.games, args.seed, args.tolerance)
+        print(f"total variation distance to the scalar engine: {validation['total_variation']:.4f}, "
+              f"largest difference {validation['max_difference']:.2%} on {validation['max_difference_square']}")
+        if validation['outside_tolerance']:
+            print(f"landing frequencies differ by more than {args.tolerance:.2%} on: "
+                  f"{', '.join(validation['outside_tolerance'])}")
+        else:
+            print(f"landing frequencies agree within {args.tolerance:.2%} on every square")